@@ -2,13 +2,13 @@
 Authentication routes
 """
 
-import httpx
 import traceback
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.responses import RedirectResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
+from app.core.http import http_pool
 from app.core.security import create_access_token
 from app.db.session import get_db
 from app.models.user import User as UserModel
@@ -118,28 +118,30 @@ async def auth_callback(code: str, db: AsyncSession = Depends(get_db)):
     """
     try:
         # Exchange code for access token
-        async with httpx.AsyncClient() as client:
-            token_response = await client.post(
-                settings.ANILIST_TOKEN_URL,
-                data={
-                    "client_id": settings.ANILIST_CLIENT_ID,
-                    "client_secret": settings.ANILIST_CLIENT_SECRET,
-                    "redirect_uri": settings.ANILIST_REDIRECT_URI,
-                    "code": code,
-                    "grant_type": "authorization_code",
-                },
-            )
+        token_response = await http_pool.client.post(
+            settings.ANILIST_TOKEN_URL,
+            data={
+                "client_id": settings.ANILIST_CLIENT_ID,
+                "client_secret": settings.ANILIST_CLIENT_SECRET,
+                "redirect_uri": settings.ANILIST_REDIRECT_URI,
+                "code": code,
+                "grant_type": "authorization_code",
+            },
+        )
 
-            if token_response.status_code != 200:
-                error_detail = f"Failed to exchange authorization code. Status: {token_response.status_code}, Body: {token_response.text}"
-                print(error_detail)
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=error_detail,
-                )
+        if token_response.status_code != 200:
+            error_detail = (
+                "Failed to exchange authorization code. "
+                f"Status: {token_response.status_code}, Body: {token_response.text}"
+            )
+            print(error_detail)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=error_detail,
+            )
 
-            token_data = token_response.json()
-            access_token = token_data["access_token"]
+        token_data = token_response.json()
+        access_token = token_data["access_token"]
 
         # Get user info from AniList
         anilist_client = AniListClient(access_token)
@@ -2,14 +2,17 @@
 Sequels API router
 """
 
-from typing import Any, Dict
+import json
+from typing import Any, AsyncIterator, Dict
 from fastapi import APIRouter, Query, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 
 import app.services.sequel_finder as sequel_service
 from app.api.deps import get_current_user
 from app.models.user import User
 from app.services.anilist_client import AniListClient
-from app.schemas.sequel import AddToListRequest
+from app.schemas.sequel import AddToListRequest, ScanJobRequest
+from app.services.scan_jobs import JobQueueFull, scan_jobs
 
 router = APIRouter()
 
@@ -38,6 +41,96 @@ async def find_sequels(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _format_event(event: Dict[str, Any], fmt: str) -> str:
+    data = json.dumps(event, separators=(",", ":"))
+    if fmt == "ndjson":
+        return data + "\n"
+    return f"event: {event['event']}\ndata: {data}\n\n"
+
+
+async def _stream_events(
+    first: Dict[str, Any], events: AsyncIterator[Dict[str, Any]], fmt: str
+):
+    yield _format_event(first, fmt)
+    try:
+        async for event in events:
+            yield _format_event(event, fmt)
+    except ValueError as e:
+        # Headers are already sent, so errors become the last event
+        yield _format_event({"event": "error", "status": 404, "detail": str(e)}, fmt)
+    except Exception as e:
+        yield _format_event({"event": "error", "status": 500, "detail": str(e)}, fmt)
+
+
+@router.get("/find/stream")
+async def find_sequels_stream(
+    username: str = Query(..., description="AniList username"),
+    force_refresh: bool = Query(False, description="Force refresh from AniList API"),
+    max_depth: int = Query(2, description="Maximum depth for recursive sequel search"),
+    fmt: str = Query(
+        "sse",
+        alias="format",
+        pattern="^(sse|ndjson)$",
+        description="sse (Server-Sent Events) or ndjson",
+    ),
+) -> StreamingResponse:
+    """Find missing sequels for a username, streaming results as they are found
+
+    Emits ``user``, ``progress``, ``sequel`` and ``done`` events (see
+    ``iter_missing_sequels``), or a final ``error`` event if the scan fails
+    after the response has started.
+    """
+    events = sequel_service.iter_missing_sequels(
+        username,
+        force_refresh=force_refresh,
+        max_depth=max_depth,
+    )
+    # Wait for the first event (the user profile) so unknown users still get
+    # a plain 404 instead of a stream
+    try:
+        first = await events.__anext__()
+    except StopAsyncIteration:
+        raise HTTPException(status_code=500, detail="Scan ended without results")
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    media_type = "application/x-ndjson" if fmt == "ndjson" else "text/event-stream"
+    return StreamingResponse(
+        _stream_events(first, events, fmt),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/jobs", status_code=202)
+async def create_scan_job(request: ScanJobRequest) -> Dict[str, Any]:
+    """Start a background scan, or join the one running for the same user and depth
+
+    A ``force_refresh`` scan only joins another forced scan, so it always
+    reads fresh lists. Poll ``GET /jobs/{id}`` for progress and the result.
+    """
+    try:
+        job, joined = await scan_jobs.submit(
+            request.username,
+            max_depth=request.max_depth,
+            force_refresh=request.force_refresh,
+        )
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {**job, "joined": joined}
+
+
+@router.get("/jobs/{job_id}")
+async def get_scan_job(job_id: str) -> Dict[str, Any]:
+    """Status, progress and (once done) result of a scan job"""
+    job = await scan_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+
 @router.post("/add")
 async def add_to_list(
     request: AddToListRequest,
@@ -1,118 +1,642 @@
-import pickle
-import os
+import asyncio
+import fnmatch
 import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Any, Optional
+from typing import (
+    Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple,
+    Union,
+)
 import redis.asyncio as redis
+from app.core.cache_backends import FileBackend, RedisBackend, SQLiteBackend
+from app.core.codecs import CacheCodec
 from app.core.config import settings
 
+_MISSING = object()
+
+
+async def _no_values() -> Dict[str, Any]:
+    return {}
+
+
+# Stale-while-revalidate envelope: {_SWR_KEY: soft expiry, "value": value}
+_SWR_KEY = "__swr_soft_expiry__"
+
+
+# Derives (soft TTL, hard TTL) in seconds from the value being cached
+TTLPolicy = Callable[[Any], Tuple[int, int]]
+
+# Key prefixes the sweep never evicts for size (they still expire): losing a
+# user list generation counter would bring back lists it had invalidated,
+# and losing scan job state would orphan jobs that are still running
+PINNED_PREFIXES = ("user_list_gen:", "scan_job:", "scan_job_active:")
+
+
+def _unwrap(stored: Any) -> Tuple[Any, Optional[float]]:
+    """Split a stored value into (value, soft expiry or None)"""
+    if isinstance(stored, dict) and _SWR_KEY in stored:
+        return stored["value"], stored[_SWR_KEY]
+    return stored, None
+
+
+CacheBackend = Union[RedisBackend, FileBackend, SQLiteBackend]
+
+
+class MemoryCache:
+    """Bounded in-process LRU with per-entry TTL (the L1 tier).
+
+    Values are stored as-is, not copied, so callers must treat anything
+    returned from the cache as read-only.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # key -> (value, expiry, size in bytes)
+        self._data: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Any:
+        """Return the cached value or ``_MISSING``"""
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return _MISSING
+        value, expiry, _ = item
+        if expiry <= time.time():
+            self._remove(key)
+            self.misses += 1
+            return _MISSING
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: float, size: int):
+        if self.max_entries <= 0 or size > self.max_bytes:
+            self._remove(key)
+            return
+        self._remove(key)
+        self._data[key] = (value, time.time() + min(ttl, self.ttl), size)
+        self.bytes += size
+        while len(self._data) > self.max_entries or self.bytes > self.max_bytes:
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        item = self._data.pop(key, None)
+        if item is not None:
+            self.bytes -= item[2]
+
+    def delete(self, key: str):
+        self._remove(key)
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        expired = [key for key, (_, expiry, _) in self._data.items() if expiry <= now]
+        for key in expired:
+            self._remove(key)
+        return len(expired)
+
+    def delete_pattern(self, pattern: str):
+        for key in [k for k in self._data if fnmatch.fnmatchcase(k, pattern)]:
+            self._remove(key)
+
+    def clear(self):
+        self._data.clear()
+        self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._data),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
 
 class CacheService:
     def __init__(self):
         self.redis: Optional[redis.Redis] = None
-        self.memory_cache: dict = {}
+        # L1: bounded in-process tier in front of the storage backend (L2)
+        self.memory_cache = MemoryCache(
+            max_entries=settings.CACHE_MEMORY_MAX_ENTRIES,
+            max_bytes=settings.CACHE_MEMORY_MAX_BYTES,
+            ttl=settings.CACHE_MEMORY_TTL,
+        )
+        self.codec = CacheCodec(
+            compress_threshold=settings.CACHE_COMPRESS_THRESHOLD,
+            allow_pickle=settings.CACHE_ALLOW_PICKLE,
+        )
+        self.hits = 0
+        self.misses = 0
+        self.reclaimed: Dict[str, int] = {
+            "expired": 0,
+            "expired_bytes": 0,
+            "evicted": 0,
+            "evicted_bytes": 0,
+            "memory_expired": 0,
+        }
+        self._sweeper: Optional[asyncio.Task] = None
+        # Background stale-while-revalidate refreshes, by key
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self.stale_hits = 0
+        self.refreshes = 0
+        # Cross-worker fill leases (Redis only)
+        self.leases_won = 0
+        self.leases_lost = 0
+        self.fill_timeouts = 0
         self.use_redis = False
         self.cache_dir = Path(settings.CACHE_DIR)
         self.cache_dir.mkdir(exist_ok=True)
 
-        if settings.REDIS_URL:
+        backend_name = settings.CACHE_BACKEND
+        if backend_name in ("auto", "redis") and settings.REDIS_URL:
             try:
                 self.redis = redis.from_url(
                     settings.REDIS_URL, encoding="utf-8", decode_responses=False
                 )
                 self.use_redis = True
             except Exception as e:
-                print(f"⚠️ Failed to connect to Redis: {e}. Falling back to file cache.")
+                print(
+                    f"⚠️ Failed to connect to Redis: {e}. Falling back to local cache."
+                )
 
-    def _get_file_path(self, key: str) -> Path:
-        # Sanitize key for filename
-        safe_key = "".join(
-            c if c.isalnum() or c in "._-" else "_" for c in key
-        )
-        return self.cache_dir / f"{safe_key}.cache"
+        self.backend: CacheBackend
+        if self.use_redis and self.redis:
+            self.backend = RedisBackend(self.redis)
+        elif backend_name == "file":
+            self.backend = FileBackend(self.cache_dir, settings.CACHE_ALLOW_PICKLE)
+        else:
+            sqlite_path = settings.CACHE_SQLITE_PATH or str(
+                self.cache_dir / "cache.sqlite3"
+            )
+            self.backend = SQLiteBackend(Path(sqlite_path))
 
     async def get(self, key: str) -> Optional[Any]:
-        """Get value from cache"""
-        if self.use_redis and self.redis:
+        """Get value from cache (memory first, then the backend)"""
+        found = await self._get_stored([key])
+        return _unwrap(found[key])[0] if key in found else None
+
+    async def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """Get several values at once; missing keys are left out of the result
+
+        Memory hits are served locally, the rest is fetched with a single
+        backend round trip (MGET on Redis, one query on SQLite).
+        """
+        found = await self._get_stored(keys)
+        return {key: _unwrap(stored)[0] for key, stored in found.items()}
+
+    async def get_many_swr(self, keys: List[str]) -> Dict[str, Tuple[Any, bool]]:
+        """Like get_many, but returns ``(value, is_stale)`` for each hit
+
+        An entry is stale once its soft TTL has passed; it is still served
+        until the hard TTL (the storage TTL) removes it. Entries written
+        without a soft TTL count as stale.
+        """
+        now = time.time()
+        result = {}
+        for key, stored in (await self._get_stored(keys)).items():
+            value, soft_expiry = _unwrap(stored)
+            stale = soft_expiry is None or soft_expiry <= now
+            if stale:
+                self.stale_hits += 1
+            result[key] = (value, stale)
+        return result
+
+    async def _get_stored(self, keys: List[str]) -> Dict[str, Any]:
+        found: Dict[str, Any] = {}
+        pending = []
+        for key in keys:
+            value = self.memory_cache.get(key)
+            if value is not _MISSING:
+                found[key] = value
+            else:
+                pending.append(key)
+        if pending:
+            found.update(await self._get_from_backend(pending))
+        return found
+
+    async def _get_from_backend(self, keys: List[str]) -> Dict[str, Any]:
+        try:
+            entries = await self.backend.get_many(keys)
+        except Exception as e:
+            print(f"⚠️ Cache get error ({self.backend.name}): {e}")
+            entries = {}
+
+        found: Dict[str, Any] = {}
+        now = time.time()
+        for key, (data, expires_at) in entries.items():
             try:
-                data = await self.redis.get(key)
-                if data:
-                    return pickle.loads(data)
+                # Sized by the decoded JSON, not the (possibly compressed) entry
+                value, size = self.codec.decode_sized(data)
             except Exception as e:
-                print(f"⚠️ Redis get error: {e}")
+                print(f"⚠️ Cache decode error for {key}: {e}")
+                continue
+            ttl = expires_at - now if expires_at is not None else self.memory_cache.ttl
+            self.memory_cache.set(key, value, ttl, size)
+            found[key] = value
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    async def set(self, key: str, value: Any, ttl: int = 3600):
+        """Set value in cache with TTL (seconds), writing through both tiers"""
+        await self.set_many({key: value}, ttl=ttl)
+
+    async def set_many(
+        self,
+        items: Dict[str, Any],
+        ttl: int = 3600,
+        soft_ttl: Optional[Union[int, Dict[str, int]]] = None,
+    ):
+        """Set several values with the same TTL in one round trip
+
+        With ``soft_ttl`` the entries are stored for ``ttl`` (the hard TTL)
+        but reported as stale by ``get_many_swr`` after ``soft_ttl``, which
+        may also be given per key.
+        """
+        if not items:
+            return
+        if soft_ttl is not None:
+            now = time.time()
+            if isinstance(soft_ttl, dict):
+                soft_expiry = {key: now + soft_ttl[key] for key in items}
+            else:
+                soft_expiry = dict.fromkeys(items, now + soft_ttl)
+            items = {
+                key: {_SWR_KEY: soft_expiry[key], "value": value}
+                for key, value in items.items()
+            }
+        try:
+            sized = {
+                key: self.codec.encode_sized(value) for key, value in items.items()
+            }
+            encoded = {key: data for key, (data, _) in sized.items()}
+            await self.backend.set_many(encoded, ttl)
+        except Exception as e:
+            for key in items:
+                self.memory_cache.delete(key)
+            print(f"⚠️ Cache set error ({self.backend.name}): {e}")
+            return
+        for key, value in items.items():
+            self.memory_cache.set(key, value, ttl, sized[key][1])
+
+    async def set_many_with_policy(self, items: Dict[str, Any], policy: TTLPolicy):
+        """Set several values, each with the TTLs ``policy`` derives from it
+
+        Entries are grouped by hard TTL, so a batch still costs one backend
+        write per distinct hard TTL rather than one per entry.
+        """
+        groups: Dict[int, Dict[str, Any]] = {}
+        soft_ttls: Dict[str, int] = {}
+        for key, value in items.items():
+            soft_ttl, hard_ttl = policy(value)
+            groups.setdefault(hard_ttl, {})[key] = value
+            soft_ttls[key] = soft_ttl
+        for hard_ttl, group in groups.items():
+            await self.set_many(group, ttl=hard_ttl, soft_ttl=soft_ttls)
+
+    async def get_or_refresh(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        soft_ttl: Optional[int] = None,
+        hard_ttl: Optional[int] = None,
+        ttl_policy: Optional[TTLPolicy] = None,
+    ) -> Any:
+        """Stale-while-revalidate read of a single key
+
+        Fresh entries are returned as-is. Stale entries are returned
+        immediately and refreshed in the background (once per key). Only a
+        missing entry makes the caller wait for ``loader``. TTLs are either
+        fixed (``soft_ttl``/``hard_ttl``) or derived from each loaded value
+        by ``ttl_policy``. A loader returning None (nothing found) is passed
+        through without being cached.
+        """
+        policy: TTLPolicy
+        if ttl_policy is not None:
+            policy = ttl_policy
+        elif soft_ttl is not None and hard_ttl is not None:
+            fixed = (soft_ttl, hard_ttl)
+            policy = lambda _value: fixed  # noqa: E731
         else:
-            # File-based cache fallback
-            file_path = self._get_file_path(key)
-            if file_path.exists():
+            raise TypeError("get_or_refresh needs soft_ttl and hard_ttl, or ttl_policy")
+
+        async def load_and_store() -> Any:
+            value = await loader()
+            if value is not None:
+                await self.set_many_with_policy({key: value}, policy)
+            return value
+
+        found = await self.get_many_swr([key])
+        if key in found:
+            value, stale = found[key]
+            if stale:
+                async def refresh(_keys: List[str]):
+                    await load_and_store()
+
+                self.schedule_refresh([key], refresh)
+            return value
+
+        async def fill(_keys: List[str]) -> Dict[str, Any]:
+            value = await load_and_store()
+            return {} if value is None else {key: value}
+
+        found = await self.fill_many([key], fill)
+        return found.get(key)
+
+    def schedule_refresh(
+        self,
+        keys: Iterable[str],
+        refresh: Callable[[List[str]], Awaitable[None]],
+    ):
+        """Run ``refresh`` in the background for keys not already refreshing
+
+        ``refresh`` receives only the keys this call claimed, so batch
+        refreshes never duplicate work already in flight.
+        """
+        pending = [key for key in keys if key not in self._refreshing]
+        if not pending:
+            return
+        task = asyncio.create_task(self._run_refresh(pending, refresh))
+        for key in pending:
+            self._refreshing[key] = task
+
+    async def _run_refresh(
+        self, keys: List[str], refresh: Callable[[List[str]], Awaitable[None]]
+    ):
+        try:
+            # Only one worker refreshes a key; the others keep serving stale
+            async with self._leases(keys) as leased:
+                if leased:
+                    self.refreshes += 1
+                    await refresh(leased)
+        except Exception as e:
+            print(f"⚠️ Background cache refresh failed for {len(keys)} key(s): {e}")
+        finally:
+            for key in keys:
+                self._refreshing.pop(key, None)
+
+    @asynccontextmanager
+    async def _leases(self, keys: List[str]) -> AsyncIterator[List[str]]:
+        """Hold fill leases for ``keys``; yields the keys this worker won
+
+        Leases only exist on Redis; other backends are local to the host
+        (or a plain miss is acceptable), so every key is granted.
+        """
+        if not isinstance(self.backend, RedisBackend) or not keys:
+            yield keys
+            return
+
+        token = uuid.uuid4().hex
+        try:
+            leased = await self.backend.acquire_leases(
+                keys, token, settings.CACHE_FILL_LEASE_MS
+            )
+        except Exception as e:
+            print(f"⚠️ Cache lease error ({self.backend.name}): {e}")
+            yield keys
+            return
+
+        self.leases_won += len(leased)
+        self.leases_lost += len(keys) - len(leased)
+        renewal = None
+        if leased:
+            renewal = asyncio.create_task(
+                self._renew_leases(self.backend, leased, token)
+            )
+        try:
+            yield leased
+        finally:
+            if renewal is not None:
+                renewal.cancel()
                 try:
-                    with open(file_path, "rb") as f:
-                        data, expiry = pickle.load(f)
-                        if expiry > time.time():
-                            return data
-                        else:
-                            # Expired
-                            os.remove(file_path)
-                except Exception:
+                    await renewal
+                except asyncio.CancelledError:
                     pass
-        return None
+            if leased:
+                try:
+                    await self.backend.release_leases(leased, token)
+                except Exception as e:
+                    print(f"⚠️ Cache lease release error ({self.backend.name}): {e}")
 
-    async def set(self, key: str, value: Any, ttl: int = 3600):
-        """Set value in cache with TTL (seconds)"""
-        if self.use_redis and self.redis:
+    async def _renew_leases(self, backend: RedisBackend, keys: List[str], token: str):
+        """Keep extending held leases while the fill runs
+
+        A fill can outlast one lease (e.g. queued behind the rate limiter);
+        renewing at a third of the TTL keeps other workers waiting for it
+        rather than taking the lease over, while a crashed worker's leases
+        still lapse after CACHE_FILL_LEASE_MS.
+        """
+        ttl_ms = settings.CACHE_FILL_LEASE_MS
+        while True:
+            await asyncio.sleep(ttl_ms / 3000)
             try:
-                data = pickle.dumps(value)
-                await self.redis.set(key, data, ex=ttl)
+                await backend.extend_leases(keys, token, ttl_ms)
             except Exception as e:
-                print(f"⚠️ Redis set error: {e}")
-        else:
-            # File-based cache fallback
-            file_path = self._get_file_path(key)
-            expiry = time.time() + ttl
+                print(f"⚠️ Cache lease renewal error ({backend.name}): {e}")
+
+    async def fill_many(
+        self,
+        keys: List[str],
+        fetch: Callable[[List[str]], Awaitable[Dict[str, Any]]],
+    ) -> Dict[str, Any]:
+        """Fill missing keys without a cross-worker stampede
+
+        ``fetch(keys)`` loads the given keys from the source, stores them in
+        the cache and returns ``{key: value}``. Keys whose lease this worker
+        wins are fetched right away; keys leased by another worker are
+        awaited in the cache for as long as that worker holds the lease (at
+        most ``CACHE_FILL_WAIT`` seconds) and only fetched here if that fill
+        does not show up.
+        """
+        async with self._leases(keys) as leased:
+            others = [key for key in keys if key not in set(leased)]
+            own, waited = await asyncio.gather(
+                fetch(leased) if leased else _no_values(),
+                self._wait_for_fill(others),
+            )
+
+        results = {**own, **waited}
+        late = [key for key in others if key not in waited]
+        if late:
+            self.fill_timeouts += len(late)
+            results.update(await fetch(late))
+        return results
+
+    async def _wait_for_fill(self, keys: List[str]) -> Dict[str, Any]:
+        """Poll for keys another worker is filling
+
+        Stops once every key is filled, once no lease on the missing keys is
+        held any more (the holder gave up, failed or died), or after
+        CACHE_FILL_WAIT seconds.
+        """
+        found: Dict[str, Any] = {}
+        if not keys or not isinstance(self.backend, RedisBackend):
+            return found
+        deadline = time.monotonic() + settings.CACHE_FILL_WAIT
+        delay = 0.025
+        while True:
+            pending = [key for key in keys if key not in found]
+            found.update(await self.get_many(pending))
+            if len(found) == len(keys) or time.monotonic() >= deadline:
+                return found
+            pending = [key for key in keys if key not in found]
             try:
-                with open(file_path, "wb") as f:
-                    pickle.dump((value, expiry), f)
-            except Exception as e:
-                print(f"⚠️ File cache set error: {e}")
+                held = await self.backend.held_leases(pending)
+            except Exception:
+                held = pending
+            if not held:
+                # A fill may have landed just before its lease was released
+                found.update(await self.get_many(pending))
+                return found
+            await asyncio.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+            delay = min(delay * 2, 0.2)
+
+    async def get_counter(self, key: str) -> int:
+        """Read a counter written by ``incr`` (0 when missing)
+
+        Counters skip the memory tier and the codec, so every read sees the
+        latest value from the shared backend.
+        """
+        try:
+            entry = (await self.backend.get_many([key])).get(key)
+            return int(entry[0]) if entry else 0
+        except Exception as e:
+            print(f"⚠️ Cache counter read error ({self.backend.name}): {e}")
+            return 0
+
+    async def incr(self, key: str, ttl: int) -> Optional[int]:
+        """Atomically increment a counter and return its new value
+
+        Returns None when the backend is unavailable.
+        """
+        try:
+            return await self.backend.incr(key, ttl)
+        except Exception as e:
+            print(f"⚠️ Cache incr error ({self.backend.name}): {e}")
+            return None
+
+    async def get_shared(self, key: str) -> Optional[Any]:
+        """Read a value straight from the backend, skipping the memory tier
+
+        For state other workers update (e.g. scan jobs), where a copy up
+        to CACHE_MEMORY_TTL old would be wrong.
+        """
+        try:
+            entry = (await self.backend.get_many([key])).get(key)
+            if entry is None:
+                return None
+            return _unwrap(self.codec.decode(entry[0]))[0]
+        except Exception as e:
+            print(f"⚠️ Cache shared read error ({self.backend.name}): {e}")
+            return None
+
+    async def add(self, key: str, value: Any, ttl: int) -> Optional[bool]:
+        """Store ``value`` only if ``key`` is missing; return whether it was stored
+
+        Atomic across workers on Redis and SQLite. Returns None when the
+        backend is unavailable. The memory tier is not populated, so the
+        value is read back with ``get_shared``.
+        """
+        try:
+            return await self.backend.set_if_absent(key, self.codec.encode(value), ttl)
+        except Exception as e:
+            print(f"⚠️ Cache add error ({self.backend.name}): {e}")
+            return None
 
     async def delete(self, key: str):
         """Delete value from cache"""
-        if self.use_redis and self.redis:
-            await self.redis.delete(key)
-        else:
-            file_path = self._get_file_path(key)
-            if file_path.exists():
-                os.remove(file_path)
+        self.memory_cache.delete(key)
+        try:
+            await self.backend.delete(key)
+        except Exception as e:
+            print(f"⚠️ Cache delete error ({self.backend.name}): {e}")
 
     async def clear(self):
         """Clear all cache"""
-        if self.use_redis and self.redis:
-            await self.redis.flushdb()
-        else:
-            for file_path in self.cache_dir.glob("*.cache"):
-                os.remove(file_path)
+        self.memory_cache.clear()
+        await self.backend.clear()
 
     async def delete_pattern(self, pattern: str):
         """Delete keys matching pattern (e.g. 'prefix:*')"""
-        if self.use_redis and self.redis:
-            keys = []
-            async for key in self.redis.scan_iter(match=pattern):
-                keys.append(key)
-            if keys:
-                await self.redis.delete(*keys)
-        else:
-            # File cache: simple prefix matching
-            # We assume the pattern ends with * and we match the sanitized prefix
-            prefix = pattern.rstrip("*")
-            safe_prefix = "".join(
-                c if c.isalnum() or c in "._-" else "_" for c in prefix
-            )
-            
-            for file_path in self.cache_dir.glob(f"{safe_prefix}*.cache"):
-                try:
-                    os.remove(file_path)
-                except OSError:
-                    pass
+        self.memory_cache.delete_pattern(pattern)
+        await self.backend.delete_pattern(pattern)
+
+    async def sweep(self) -> Dict[str, int]:
+        """Run one maintenance step: drop expired entries and enforce size caps"""
+        result = await self.backend.sweep(
+            batch=settings.CACHE_SWEEP_BATCH,
+            max_entries=settings.CACHE_MAX_ENTRIES,
+            max_bytes=settings.CACHE_MAX_BYTES,
+            policy=settings.CACHE_EVICTION_POLICY,
+            pinned=PINNED_PREFIXES,
+        )
+        result["memory_expired"] = self.memory_cache.purge_expired()
+        for name, value in result.items():
+            self.reclaimed[name] += value
+        return result
+
+    async def _sweep_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                result = await self.sweep()
+            except Exception as e:
+                print(f"⚠️ Cache sweep error ({self.backend.name}): {e}")
+                continue
+            if result["expired"] or result["evicted"]:
+                print(
+                    f"🧹 Cache sweep: {result['expired']} expired "
+                    f"({result['expired_bytes']} bytes), {result['evicted']} evicted "
+                    f"({result['evicted_bytes']} bytes)"
+                )
+
+    def start_maintenance(self):
+        """Start the background sweeper (called from the app lifespan)"""
+        interval = settings.CACHE_SWEEP_INTERVAL
+        if interval > 0 and (self._sweeper is None or self._sweeper.done()):
+            self._sweeper = asyncio.create_task(self._sweep_loop(interval))
+
+    async def stop_maintenance(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+        # Drop background refreshes still in flight; the stale entries stay
+        for task in set(self._refreshing.values()):
+            task.cancel()
+        self._refreshing.clear()
 
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for metrics"""
+        return {
+            "backend": self.backend.name,
+            "l2_hits": self.hits,
+            "l2_misses": self.misses,
+            "stale_hits": self.stale_hits,
+            "background_refreshes": self.refreshes,
+            "refreshing": len(self._refreshing),
+            "fill_leases": {
+                "won": self.leases_won,
+                "lost": self.leases_lost,
+                "wait_timeouts": self.fill_timeouts,
+            },
+            "memory": self.memory_cache.stats(),
+            "reclaimed": dict(self.reclaimed),
+        }
 
 
 # Global cache instance
@@ -0,0 +1,669 @@
+"""
+Storage backends (L2) for CacheService
+
+Backends store already-encoded bytes; encoding and the in-memory tier are
+handled by CacheService. Every backend exposes the same async interface:
+
+- ``get_many(keys)`` -> ``{key: (payload, expires_at or None)}`` for hits
+- ``set_many(items, ttl)`` with ``items`` as ``{key: payload}``
+- ``delete(key)``, ``delete_pattern(pattern)`` and ``clear()``
+- ``incr(key, ttl)`` atomically increments a counter and returns the new
+  value; counters are stored as plain decimal bytes (what Redis INCR uses)
+  and read back through ``get_many``
+- ``set_if_absent(key, payload, ttl)`` stores ``payload`` only if the key
+  is missing (or expired) and returns whether it did
+- ``sweep(batch, max_entries, max_bytes, policy)`` for the background
+  maintenance task; returns counts of what was reclaimed
+
+Only ``RedisBackend`` also offers cache-fill leases (``acquire_leases``,
+``extend_leases``, ``release_leases`` and ``held_leases``); they coordinate
+fills across workers and nodes.
+"""
+
+import asyncio
+import os
+import pickle
+import sqlite3
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import redis.asyncio as redis
+
+Entry = Tuple[bytes, Optional[float]]
+
+# File entries: tag byte, expiry (float64) and the codec payload
+_FILE_TAG = b"\x10"
+_FILE_EXPIRY = struct.Struct("<d")
+
+# SQLite limits host parameters per statement (999 on older builds)
+_SQLITE_CHUNK = 500
+# Buffered access stats are written early once this many keys are pending
+_SQLITE_ACCESS_BUFFER = 10000
+
+
+def _sweep_result() -> Dict[str, int]:
+    return {"expired": 0, "expired_bytes": 0, "evicted": 0, "evicted_bytes": 0}
+
+
+def _glob_prefix(pattern: str) -> Optional[str]:
+    """Return the literal prefix of a 'prefix*' pattern, or None"""
+    if not pattern.endswith("*"):
+        return None
+    prefix = pattern[:-1]
+    if any(c in prefix for c in "*?[]\\"):
+        return None
+    return prefix
+
+
+def _safe_filename(key: str) -> str:
+    return "".join(c if c.isalnum() or c in "._-" else "_" for c in key)
+
+
+# Release a lease only if we still own it (it may have expired and been
+# taken by another worker meanwhile)
+_RELEASE_LEASES_SCRIPT = """
+local released = 0
+for i, key in ipairs(KEYS) do
+  if redis.call('GET', key) == ARGV[1] then
+    released = released + redis.call('DEL', key)
+  end
+end
+return released
+"""
+
+# Extend a lease only if we still own it
+_EXTEND_LEASES_SCRIPT = """
+local extended = 0
+for i, key in ipairs(KEYS) do
+  if redis.call('GET', key) == ARGV[1] then
+    extended = extended + redis.call('PEXPIRE', key, ARGV[2])
+  end
+end
+return extended
+"""
+
+
+def _lease_key(key: str) -> str:
+    return f"lease:{key}"
+
+
+class RedisBackend:
+    name = "redis"
+
+    def __init__(self, client: redis.Redis):
+        self.redis = client
+        self._release_leases = client.register_script(_RELEASE_LEASES_SCRIPT)
+        self._extend_leases = client.register_script(_EXTEND_LEASES_SCRIPT)
+
+    async def acquire_leases(
+        self, keys: List[str], token: str, ttl_ms: int
+    ) -> List[str]:
+        """Take the fill lease (SET NX PX) for each key; return the keys won"""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.set(_lease_key(key), token, nx=True, px=ttl_ms)
+            won = await pipe.execute()
+        return [key for key, ok in zip(keys, won) if ok]
+
+    async def release_leases(self, keys: List[str], token: str):
+        await self._release_leases(
+            keys=[_lease_key(key) for key in keys], args=[token]
+        )
+
+    async def extend_leases(self, keys: List[str], token: str, ttl_ms: int):
+        await self._extend_leases(
+            keys=[_lease_key(key) for key in keys], args=[token, ttl_ms]
+        )
+
+    async def held_leases(self, keys: List[str]) -> List[str]:
+        """Keys whose fill lease is currently held by some worker"""
+        held = await self.redis.mget([_lease_key(key) for key in keys])
+        return [key for key, token in zip(keys, held) if token is not None]
+
+    async def get_many(self, keys: List[str]) -> Dict[str, Entry]:
+        found: Dict[str, Entry] = {}
+        for key, data in zip(keys, await self.redis.mget(keys)):
+            if data:
+                # Redis owns expiry; the remaining TTL is not fetched
+                found[key] = (data, None)
+        return found
+
+    async def set_many(self, items: Dict[str, bytes], ttl: int):
+        if len(items) == 1:
+            ((key, data),) = items.items()
+            await self.redis.set(key, data, ex=ttl)
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key, data in items.items():
+                pipe.set(key, data, ex=ttl)
+            await pipe.execute()
+
+    async def incr(self, key: str, ttl: int) -> int:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.incr(key)
+            pipe.expire(key, ttl)
+            value, _ = await pipe.execute()
+        return int(value)
+
+    async def set_if_absent(self, key: str, data: bytes, ttl: int) -> bool:
+        return bool(await self.redis.set(key, data, ex=ttl, nx=True))
+
+    async def delete(self, key: str):
+        await self.redis.delete(key)
+
+    async def delete_pattern(self, pattern: str):
+        keys = []
+        async for key in self.redis.scan_iter(match=pattern):
+            keys.append(key)
+        if keys:
+            await self.redis.delete(*keys)
+
+    async def clear(self):
+        await self.redis.flushdb()
+
+    async def sweep(
+        self,
+        batch: int,
+        max_entries: int,
+        max_bytes: int,
+        policy: str,
+        pinned: Tuple[str, ...] = (),
+    ) -> Dict[str, int]:
+        # Redis expires keys itself; size is bounded by its maxmemory-policy
+        return _sweep_result()
+
+
+class FileBackend:
+    """One file per key in ``cache_dir``; all I/O runs in worker threads"""
+
+    name = "file"
+
+    def __init__(self, cache_dir: Path, allow_pickle: bool = True):
+        self.cache_dir = cache_dir
+        self.allow_pickle = allow_pickle
+        self.cache_dir.mkdir(exist_ok=True)
+        # Incremental sweep state: directory iterator and live files seen so
+        # far as (access time, size, path, pinned)
+        self._sweep_iter: Optional[Iterator[os.DirEntry]] = None
+        self._sweep_seen: List[Tuple[float, int, str, bool]] = []
+        # Counter and set-if-absent updates are atomic within this process only
+        self._incr_lock = threading.Lock()
+
+    def _get_file_path(self, key: str) -> Path:
+        return self.cache_dir / f"{_safe_filename(key)}.cache"
+
+    def _read(self, key: str) -> Optional[Entry]:
+        file_path = self._get_file_path(key)
+        if not file_path.exists():
+            return None
+        try:
+            with open(file_path, "rb") as f:
+                raw = f.read()
+            if raw[:1] == _FILE_TAG:
+                (expiry,) = _FILE_EXPIRY.unpack_from(raw, 1)
+                data = raw[1 + _FILE_EXPIRY.size:]
+            elif self.allow_pickle:
+                # Entry written before the codec layer: hand it back as a
+                # pickle payload, which the codec still understands
+                value, expiry = pickle.loads(raw)
+                data = pickle.dumps(value)
+            else:
+                return None
+            if expiry > time.time():
+                return data, expiry
+            # Expired
+            os.remove(file_path)
+        except Exception:
+            pass
+        return None
+
+    def _expiry_of(self, path: str) -> Optional[float]:
+        """Expiry timestamp of a cache file; None if it cannot be read"""
+        try:
+            with open(path, "rb") as f:
+                header = f.read(1 + _FILE_EXPIRY.size)
+                if header[:1] == _FILE_TAG:
+                    return _FILE_EXPIRY.unpack_from(header, 1)[0]
+                if not self.allow_pickle:
+                    return None
+                f.seek(0)
+                return pickle.load(f)[1]
+        except Exception:
+            return None
+
+    def _sweep_step(
+        self, batch: int, max_entries: int, max_bytes: int, pinned: Tuple[str, ...]
+    ) -> Dict[str, int]:
+        result = _sweep_result()
+        if self._sweep_iter is None:
+            self._sweep_iter = iter(os.scandir(self.cache_dir))
+            self._sweep_seen = []
+
+        now = time.time()
+        for _ in range(batch):
+            entry = next(self._sweep_iter, None)
+            if entry is None:
+                # Pass complete: enforce the cap on what is still live
+                self._sweep_iter = None
+                self._evict(self._sweep_seen, max_entries, max_bytes, result)
+                self._sweep_seen = []
+                break
+            if not entry.name.endswith(".cache"):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            expiry = self._expiry_of(entry.path)
+            if expiry is None or expiry <= now:
+                try:
+                    os.remove(entry.path)
+                    result["expired"] += 1
+                    result["expired_bytes"] += stat.st_size
+                except OSError:
+                    pass
+            else:
+                self._sweep_seen.append(
+                    (
+                        stat.st_atime,
+                        stat.st_size,
+                        entry.path,
+                        entry.name.startswith(pinned),
+                    )
+                )
+        return result
+
+    @staticmethod
+    def _evict(
+        files: List[Tuple[float, int, str, bool]],
+        max_entries: int,
+        max_bytes: int,
+        result: Dict[str, int],
+    ):
+        # Pinned files count towards the cap but are never evicted
+        count = len(files)
+        total = sum(size for _, size, _, _ in files)
+        # Least recently accessed first (files carry no hit counts, so LFU
+        # degrades to LRU here)
+        for _, size, path, _ in sorted(f for f in files if not f[3]):
+            if not (max_entries and count > max_entries) and not (
+                max_bytes and total > max_bytes
+            ):
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            count -= 1
+            total -= size
+            result["evicted"] += 1
+            result["evicted_bytes"] += size
+
+    async def sweep(
+        self,
+        batch: int,
+        max_entries: int,
+        max_bytes: int,
+        policy: str,
+        pinned: Tuple[str, ...] = (),
+    ) -> Dict[str, int]:
+        """Check the next ``batch`` files; enforce the cap after each full pass
+
+        Files of ``pinned`` key prefixes still expire but are never evicted.
+        """
+        return await asyncio.to_thread(
+            self._sweep_step,
+            batch,
+            max_entries,
+            max_bytes,
+            tuple(_safe_filename(prefix) for prefix in pinned),
+        )
+
+    def _write(self, key: str, data: bytes, ttl: int):
+        with open(self._get_file_path(key), "wb") as f:
+            f.write(_FILE_TAG + _FILE_EXPIRY.pack(time.time() + ttl) + data)
+
+    async def get_many(self, keys: List[str]) -> Dict[str, Entry]:
+        def read_all() -> Dict[str, Entry]:
+            found = {}
+            for key in keys:
+                entry = self._read(key)
+                if entry is not None:
+                    found[key] = entry
+            return found
+
+        return await asyncio.to_thread(read_all)
+
+    async def set_many(self, items: Dict[str, bytes], ttl: int):
+        def write_all():
+            for key, data in items.items():
+                self._write(key, data, ttl)
+
+        await asyncio.to_thread(write_all)
+
+    async def incr(self, key: str, ttl: int) -> int:
+        def increment() -> int:
+            with self._incr_lock:
+                entry = self._read(key)
+                value = int(entry[0]) + 1 if entry else 1
+                self._write(key, str(value).encode(), ttl)
+                return value
+
+        return await asyncio.to_thread(increment)
+
+    async def set_if_absent(self, key: str, data: bytes, ttl: int) -> bool:
+        def add() -> bool:
+            with self._incr_lock:
+                if self._read(key) is not None:
+                    return False
+                self._write(key, data, ttl)
+                return True
+
+        return await asyncio.to_thread(add)
+
+    async def delete(self, key: str):
+        def remove():
+            try:
+                os.remove(self._get_file_path(key))
+            except FileNotFoundError:
+                pass
+
+        await asyncio.to_thread(remove)
+
+    async def delete_pattern(self, pattern: str):
+        # File cache: simple prefix matching
+        # We assume the pattern ends with * and we match the sanitized prefix
+        prefix = pattern.rstrip("*")
+        safe_prefix = _safe_filename(prefix)
+
+        def remove_matching():
+            for file_path in self.cache_dir.glob(f"{safe_prefix}*.cache"):
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    pass
+
+        await asyncio.to_thread(remove_matching)
+
+    async def clear(self):
+        def remove_all():
+            for file_path in self.cache_dir.glob("*.cache"):
+                os.remove(file_path)
+
+        await asyncio.to_thread(remove_all)
+
+
+class SQLiteBackend:
+    """Single-file cache store in SQLite (WAL mode).
+
+    Keys are the primary key, so prefix deletes are index range scans, and
+    ``expires_at`` is indexed so expired rows can be purged in bulk. All
+    queries run on one dedicated thread, keeping the event loop free and
+    giving the connection a single owner.
+
+    Reads do not write: access stats for LRU/LFU eviction are buffered in
+    memory and written by the next sweep, so a cache hit never waits for
+    the database write lock.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="sqlite-cache"
+        )
+        self._conn: Optional[sqlite3.Connection] = None
+        # key -> (last access, hits since the last flush)
+        self._access: Dict[str, Tuple[float, int]] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY,"
+                " value BLOB NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " last_access REAL NOT NULL DEFAULT 0,"
+                " hits INTEGER NOT NULL DEFAULT 0"
+                ") WITHOUT ROWID"
+            )
+            # Stores created before access tracking existed
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(cache)")}
+            if "last_access" not in columns:
+                conn.execute(
+                    "ALTER TABLE cache ADD COLUMN last_access REAL NOT NULL DEFAULT 0"
+                )
+            if "hits" not in columns:
+                conn.execute(
+                    "ALTER TABLE cache ADD COLUMN hits INTEGER NOT NULL DEFAULT 0"
+                )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS cache_last_access ON cache (last_access)"
+            )
+            # Eviction order of the LFU policy
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS cache_hits ON cache (hits, last_access)"
+            )
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, lambda: fn(self._connect())
+        )
+
+    async def get_many(self, keys: List[str]) -> Dict[str, Entry]:
+        def select(conn: sqlite3.Connection) -> Dict[str, Entry]:
+            now = time.time()
+            found = {}
+            for i in range(0, len(keys), _SQLITE_CHUNK):
+                chunk = keys[i:i + _SQLITE_CHUNK]
+                rows = conn.execute(
+                    "SELECT key, value, expires_at FROM cache"
+                    f" WHERE key IN ({','.join('?' * len(chunk))}) AND expires_at > ?",
+                    (*chunk, now),
+                )
+                for key, value, expires_at in rows:
+                    found[key] = (bytes(value), expires_at)
+            return found
+
+        found = await self._run(select)
+        now = time.time()
+        for key in found:
+            hits = self._access[key][1] if key in self._access else 0
+            self._access[key] = (now, hits + 1)
+        if len(self._access) >= _SQLITE_ACCESS_BUFFER:
+            await self.flush_access()
+        return found
+
+    async def flush_access(self):
+        """Write buffered access stats (last access, hit count)"""
+        if not self._access:
+            return
+        access, self._access = self._access, {}
+
+        def update(conn: sqlite3.Connection):
+            conn.execute("BEGIN")
+            try:
+                conn.executemany(
+                    "UPDATE cache SET last_access = ?, hits = hits + ? WHERE key = ?",
+                    [(at, hits, key) for key, (at, hits) in access.items()],
+                )
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+        await self._run(update)
+
+    async def set_many(self, items: Dict[str, bytes], ttl: int):
+        now = time.time()
+        expires_at = now + ttl
+
+        def upsert(conn: sqlite3.Connection):
+            conn.execute("BEGIN")
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO cache (key, value, expires_at, last_access)"
+                    " VALUES (?, ?, ?, ?)",
+                    [(key, data, expires_at, now) for key, data in items.items()],
+                )
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+        await self._run(upsert)
+
+    async def incr(self, key: str, ttl: int) -> int:
+        def increment(conn: sqlite3.Connection) -> int:
+            now = time.time()
+            # IMMEDIATE takes the write lock up front, so concurrent workers
+            # sharing the file cannot both read the same old value
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT value FROM cache WHERE key = ? AND expires_at > ?",
+                    (key, now),
+                ).fetchone()
+                value = int(bytes(row[0])) + 1 if row else 1
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, expires_at, last_access)"
+                    " VALUES (?, ?, ?, ?)",
+                    (key, str(value).encode(), now + ttl, now),
+                )
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return value
+
+        return await self._run(increment)
+
+    async def set_if_absent(self, key: str, data: bytes, ttl: int) -> bool:
+        def add(conn: sqlite3.Connection) -> bool:
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT 1 FROM cache WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                if row is None:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO cache"
+                        " (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                        (key, data, now + ttl, now),
+                    )
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return row is None
+
+        return await self._run(add)
+
+    async def delete(self, key: str):
+        await self._run(
+            lambda conn: conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+        )
+
+    async def delete_pattern(self, pattern: str):
+        prefix = _glob_prefix(pattern)
+        if prefix:
+            # Range over the primary key: [prefix, prefix with last char + 1)
+            upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+            await self._run(
+                lambda conn: conn.execute(
+                    "DELETE FROM cache WHERE key >= ? AND key < ?", (prefix, upper)
+                )
+            )
+        else:
+            # Redis-style glob; SQLite GLOB has the same wildcards
+            await self._run(
+                lambda conn: conn.execute(
+                    "DELETE FROM cache WHERE key GLOB ?", (pattern,)
+                )
+            )
+
+    async def clear(self):
+        await self._run(lambda conn: conn.execute("DELETE FROM cache"))
+
+    async def sweep(
+        self,
+        batch: int,
+        max_entries: int,
+        max_bytes: int,
+        policy: str,
+        pinned: Tuple[str, ...] = (),
+    ) -> Dict[str, int]:
+        """Purge every expired row, then evict down to the cap
+
+        Expired rows go first in one range delete on the expires_at index,
+        so live rows are never evicted while an expired backlog remains.
+        ``batch`` bounds each eviction query. Rows of ``pinned`` key
+        prefixes still expire but are never evicted.
+        """
+        await self.flush_access()
+        order = "hits, last_access" if policy == "lfu" else "last_access"
+        # Pinned prefixes as primary key ranges, like delete_pattern
+        ranges = [(prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)) for prefix in pinned]
+        keep = "".join(" AND NOT (key >= ? AND key < ?)" for _ in ranges)
+        keep_args = [bound for bounds in ranges for bound in bounds]
+
+        def run(conn: sqlite3.Connection) -> Dict[str, int]:
+            result = _sweep_result()
+            now = time.time()
+            expired, expired_bytes = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM cache"
+                " WHERE expires_at <= ?",
+                (now,),
+            ).fetchone()
+            if expired:
+                conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+                result["expired"] = expired
+                result["expired_bytes"] = expired_bytes
+
+            if not max_entries and not max_bytes:
+                return result
+            count, total = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM cache"
+            ).fetchone()
+            while (max_entries and count > max_entries) or (
+                max_bytes and total > max_bytes
+            ):
+                rows = conn.execute(
+                    f"SELECT key, LENGTH(value) FROM cache WHERE 1{keep}"
+                    f" ORDER BY {order} LIMIT ?",
+                    (*keep_args, batch),
+                ).fetchall()
+                victims = []
+                for key, size in rows:
+                    if not (max_entries and count > max_entries) and not (
+                        max_bytes and total > max_bytes
+                    ):
+                        break
+                    victims.append((key,))
+                    count -= 1
+                    total -= size
+                    result["evicted"] += 1
+                    result["evicted_bytes"] += size
+                if not victims:
+                    break
+                conn.executemany("DELETE FROM cache WHERE key = ?", victims)
+            return result
+
+        return await self._run(run)
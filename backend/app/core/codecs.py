@@ -0,0 +1,109 @@
+"""
+Serialization codecs for cached values
+"""
+
+import json
+import pickle
+import zlib
+from typing import Any, Tuple
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None  # type: ignore[assignment]
+
+try:
+    import zstandard  # type: ignore[import-not-found]
+except ImportError:  # pragma: no cover - optional compression
+    zstandard = None
+
+
+# Every encoded entry starts with a one-byte tag, so formats can change
+# without flushing the cache. Pickle protocol 2+ always starts with 0x80,
+# which lets entries written before codecs existed still be read.
+TAG_JSON = 0x01
+TAG_JSON_ZSTD = 0x02
+TAG_JSON_ZLIB = 0x03
+TAG_PICKLE = 0x80
+
+
+def _json_dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+def _json_loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class CacheCodec:
+    """Tagged JSON codec with optional compression of large entries.
+
+    Values are encoded as compact JSON (orjson when installed) and
+    compressed with zstd (or zlib when zstandard is missing) once they
+    exceed ``compress_threshold`` bytes. Values JSON cannot represent fall
+    back to pickle. Pickled entries are only decoded while
+    ``allow_pickle`` is on, so a shared store can be weaned off pickle once
+    old entries have expired.
+    """
+
+    def __init__(
+        self,
+        compress_threshold: int = 1024,
+        allow_pickle: bool = True,
+        zstd_level: int = 3,
+    ):
+        self.compress_threshold = compress_threshold
+        self.allow_pickle = allow_pickle
+        if zstandard is not None:
+            self._zstd_compressor = zstandard.ZstdCompressor(level=zstd_level)
+            self._zstd_decompressor = zstandard.ZstdDecompressor()
+
+    def encode(self, value: Any) -> bytes:
+        return self.encode_sized(value)[0]
+
+    def decode(self, data: bytes) -> Any:
+        return self.decode_sized(data)[0]
+
+    def encode_sized(self, value: Any) -> Tuple[bytes, int]:
+        """Encode ``value``; also return its size before compression"""
+        try:
+            payload = _json_dumps(value)
+        except (TypeError, ValueError):
+            if not self.allow_pickle:
+                raise
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            return data, len(data)
+
+        if 0 < self.compress_threshold <= len(payload):
+            if zstandard is not None:
+                compressed = self._zstd_compressor.compress(payload)
+                return bytes([TAG_JSON_ZSTD]) + compressed, len(payload)
+            return bytes([TAG_JSON_ZLIB]) + zlib.compress(payload, 3), len(payload)
+        return bytes([TAG_JSON]) + payload, len(payload)
+
+    def decode_sized(self, data: bytes) -> Tuple[Any, int]:
+        """Decode ``data``; also return the value's size before compression"""
+        tag = data[0]
+        if tag == TAG_JSON:
+            return _json_loads(data[1:]), len(data) - 1
+        if tag == TAG_JSON_ZSTD:
+            if zstandard is None:
+                raise ValueError(
+                    "zstd-compressed cache entry but zstandard is not installed"
+                )
+            payload = self._zstd_decompressor.decompress(data[1:])
+            return _json_loads(payload), len(payload)
+        if tag == TAG_JSON_ZLIB:
+            payload = zlib.decompress(data[1:])
+            return _json_loads(payload), len(payload)
+        if tag == TAG_PICKLE:
+            if not self.allow_pickle:
+                raise ValueError(
+                    "Pickled cache entry rejected (CACHE_ALLOW_PICKLE is off)"
+                )
+            return pickle.loads(data), len(data)
+        raise ValueError(f"Unknown cache entry tag: {tag:#x}")
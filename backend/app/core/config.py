@@ -36,6 +36,13 @@ class Settings(BaseSettings):
     ANILIST_TOKEN_URL: str = "https://anilist.co/api/v2/oauth/token"
     ANILIST_API_URL: str = "https://graphql.anilist.co"
 
+    # Outgoing HTTP connection pool (shared by every AniListClient)
+    HTTP2_ENABLED: bool = True
+    HTTP_TIMEOUT: float = 60.0
+    HTTP_MAX_CONNECTIONS: int = 20
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+
     # JWT
     JWT_SECRET_KEY: str
     JWT_ALGORITHM: str = "HS256"
@@ -46,11 +53,74 @@ class Settings(BaseSettings):
 
     # Cache
     CACHE_DIR: str = ".cache"
+    # auto (Redis if REDIS_URL, else SQLite), redis, sqlite, file
+    CACHE_BACKEND: str = "auto"
+    CACHE_SQLITE_PATH: str = ""  # Defaults to {CACHE_DIR}/cache.sqlite3
     CACHE_TTL: int = 86400  # 24 hours
+    # Stale-while-revalidate: entries are fresh for the TTL, then served stale
+    # (and refreshed in the background) until the hard TTL
+    CACHE_MEDIA_TTL: int = 86400
+    CACHE_MEDIA_HARD_TTL: int = 7 * 86400
+    # FINISHED media with no airing relations
+    CACHE_MEDIA_FINISHED_TTL: int = 30 * 86400
+    # Floor for airing media that expire at the next episode
+    CACHE_MEDIA_MIN_TTL: int = 300
+    CACHE_USER_LIST_TTL: int = 300
+    CACHE_USER_LIST_HARD_TTL: int = 3600
+    # Redis lease held (and renewed) by the worker filling a missed key
+    CACHE_FILL_LEASE_MS: int = 5000
+    # Max seconds other workers wait on a held lease before fetching themselves
+    CACHE_FILL_WAIT: float = 30.0
+    CACHE_MEMORY_MAX_ENTRIES: int = 10000  # In-process LRU tier in front of Redis/files
+    CACHE_MEMORY_MAX_BYTES: int = 64 * 1024 * 1024
+    # Max seconds an entry lives in memory (bounds cross-worker staleness)
+    CACHE_MEMORY_TTL: int = 60
+    # Compress encoded entries at least this big (0 = never)
+    CACHE_COMPRESS_THRESHOLD: int = 1024
+    # Still decode legacy pickled entries during rollout
+    CACHE_ALLOW_PICKLE: bool = True
+    CACHE_SWEEP_INTERVAL: int = 300  # Seconds between background sweeps (0 = disabled)
+    CACHE_SWEEP_BATCH: int = 1000  # Entries checked / evicted per sweep step
+    # Cap for the local (SQLite/file) cache, 0 = unbounded
+    CACHE_MAX_ENTRIES: int = 200000
+    CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+    CACHE_EVICTION_POLICY: str = "lru"  # "lru" or "lfu" (SQLite only; files use LRU)
 
     # Rate Limiting
     RATE_LIMIT_PER_MINUTE: int = 60
 
+    # AniList rate governor (outgoing requests, shared by the whole process)
+    ANILIST_RATE_LIMIT_PER_MINUTE: int = 90  # Initial budget, updated from headers
+    ANILIST_RATE_LIMIT_HEADROOM: float = 0.9  # Fraction of the budget we pace to
+    ANILIST_RATE_LIMIT_BURST: int = 5  # Max requests sent back-to-back
+    ANILIST_RATE_LIMIT_RESERVE: int = 2  # Remaining calls kept as safety margin
+    # "memory" or "redis" (shared by all workers)
+    ANILIST_RATE_LIMIT_BACKEND: str = "memory"
+    MEDIA_LOADER_WINDOW_MS: float = 5  # Window for batching media lookups across scans
+    MEDIA_BATCH_NODE_BUDGET: int = 2000  # Media + relation edges per id_in request
+
+    # Sequel finder
+    SEQUEL_LIST_MODE: str = "pages"  # "pages" or "collection" (MediaListCollection)
+    # Lists also select relations of relations (depth 2)
+    SEQUEL_DEEP_PREFETCH: bool = False
+    # Seconds to use the full profile after a complexity error
+    SEQUEL_DEEP_PREFETCH_RETRY: int = 3600
+    # Deep-search batches resolved concurrently per scan
+    DEEP_SEARCH_MAX_IN_FLIGHT: int = 4
+    SCAN_JOB_WORKERS: int = 2  # Background scans run concurrently per process
+    # Scans waiting for a worker before POST /jobs returns 503
+    SCAN_JOB_QUEUE_SIZE: int = 100
+    SCAN_JOB_RESULT_TTL: int = 3600  # Seconds finished jobs stay pollable
+    # Seconds a job keeps its claim after its last progress write
+    SCAN_JOB_TIMEOUT: int = 900
+    SCAN_JOB_PROGRESS_INTERVAL: float = 1.0  # Min seconds between job progress writes
+    # Store media relations in the database and traverse locally
+    MEDIA_GRAPH_ENABLED: bool = True
+    # Defaults to {CACHE_DIR}/graph.snapshot (see export_graph.py)
+    GRAPH_SNAPSHOT_PATH: str = ""
+    # Seconds between checks for a newer snapshot
+    GRAPH_SNAPSHOT_CHECK_INTERVAL: float = 30.0
+
     # Redis (Optional)
     REDIS_URL: str | None = None
 
@@ -0,0 +1,61 @@
+"""
+Shared HTTP connection pool for outgoing AniList traffic
+"""
+
+from typing import Optional
+
+import httpx
+
+from app.core.config import settings
+
+
+class HTTPClientPool:
+    """Process-wide keep-alive ``httpx.AsyncClient``.
+
+    The client is opened and closed through the FastAPI lifespan, but it is
+    also created lazily on first use so scripts and tests that never run the
+    lifespan still get a working (and still pooled) client.
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _build_client(self) -> httpx.AsyncClient:
+        http2 = settings.HTTP2_ENABLED
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                print("⚠️ HTTP/2 requested but 'h2' is not installed. Using HTTP/1.1.")
+                http2 = False
+
+        return httpx.AsyncClient(
+            http2=http2,
+            timeout=httpx.Timeout(settings.HTTP_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Return the shared client, creating it if needed"""
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+
+    async def start(self):
+        """Open the pool (called from the app lifespan)"""
+        _ = self.client
+
+    async def close(self):
+        """Close the pool and drop all idle connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# Global HTTP pool instance
+http_pool = HTTPClientPool()
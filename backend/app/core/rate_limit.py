@@ -0,0 +1,372 @@
+"""
+Process-wide rate governor for AniList API calls
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, Mapping, Optional, Union
+
+from app.core.cache import cache
+from app.core.config import settings
+
+
+def _header_number(headers: Mapping[str, str], name: str) -> Optional[float]:
+    """Read a numeric header, returning None when missing or malformed"""
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucketLimiter:
+    """Token bucket shared by every AniListClient in this process.
+
+    Tokens refill at ``limit * headroom`` per minute, so requests are paced
+    just under the budget instead of bursting into 429s. The bucket is kept
+    in sync with AniList's own view through the ``X-RateLimit-*`` and
+    ``Retry-After`` headers of every response.
+
+    Waiters reserve a token up front (the balance may go negative) and sleep
+    for their share of the deficit, which keeps them in FIFO order without
+    a lock or a polling loop.
+    """
+
+    def __init__(
+        self,
+        limit: int = settings.ANILIST_RATE_LIMIT_PER_MINUTE,
+        headroom: float = settings.ANILIST_RATE_LIMIT_HEADROOM,
+        burst: int = settings.ANILIST_RATE_LIMIT_BURST,
+        reserve: int = settings.ANILIST_RATE_LIMIT_RESERVE,
+    ):
+        self.headroom = headroom
+        self.burst = burst
+        self.reserve = reserve
+        self._set_limit(limit)
+        self._tokens = float(self.capacity)
+        # Refill clock; may point into the future while we are blocked
+        self._updated = time.monotonic()
+
+        # Last values reported by AniList
+        self.remaining: Optional[int] = None
+        self.reset_at: Optional[float] = None
+
+        # Counters for metrics
+        self.requests = 0
+        self.throttled = 0
+        self.rate_limited = 0
+        self.total_wait = 0.0
+
+    def _set_limit(self, limit: int):
+        self.limit = max(1, int(limit))
+        self.rate = self.limit * self.headroom / 60.0  # tokens per second
+        self.capacity = max(1, min(self.burst, self.limit))
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def _block_until(self, until: float):
+        """Stop refilling until ``until`` (monotonic), then allow one request"""
+        if until > self._updated:
+            self._updated = until
+        self._tokens = min(self._tokens, 1.0)
+
+    async def acquire(self):
+        """Wait until a request may be sent"""
+        now = time.monotonic()
+        self._refill(now)
+        self._tokens -= 1
+        self.requests += 1
+
+        wait = max(0.0, self._updated - now) + max(0.0, -self._tokens) / self.rate
+        if wait > 0:
+            self.throttled += 1
+            self.total_wait += wait
+            await asyncio.sleep(wait)
+
+    async def update_from_headers(
+        self, status_code: int, headers: Mapping[str, str]
+    ):
+        """Synchronise the bucket with AniList's rate limit headers"""
+        now = time.monotonic()
+        self._refill(now)
+
+        limit = _header_number(headers, "X-RateLimit-Limit")
+        if limit and int(limit) != self.limit:
+            self._set_limit(int(limit))
+            self._tokens = min(self._tokens, self.capacity)
+
+        reset = _header_number(headers, "X-RateLimit-Reset")
+        if reset is not None:
+            self.reset_at = reset
+
+        remaining = _header_number(headers, "X-RateLimit-Remaining")
+        if remaining is not None:
+            self.remaining = int(remaining)
+            spare = self.remaining - self.reserve
+            if spare <= 0:
+                # Budget exhausted: hold everything until the window resets
+                if reset is not None:
+                    self._block_until(now + max(0.0, reset - time.time()))
+                else:
+                    self._tokens = min(self._tokens, 0.0)
+            else:
+                self._tokens = min(self._tokens, float(spare))
+
+        retry_after = _header_number(headers, "Retry-After")
+        if retry_after is not None:
+            self._block_until(now + retry_after)
+
+        if status_code == 429:
+            self.rate_limited += 1
+
+    async def penalize(self, seconds: float):
+        """Hold all requests for ``seconds`` (e.g. a 429 without Retry-After)"""
+        now = time.monotonic()
+        self._refill(now)
+        self._block_until(now + seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current governor state for metrics"""
+        now = time.monotonic()
+        self._refill(now)
+        return {
+            "backend": "memory",
+            "limit": self.limit,
+            "rate_per_second": round(self.rate, 3),
+            "capacity": self.capacity,
+            "tokens": round(self._tokens, 3),
+            "blocked_for": round(max(0.0, self._updated - now), 3),
+            "remaining": self.remaining,
+            "reset_at": self.reset_at,
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "rate_limited": self.rate_limited,
+            "total_wait": round(self.total_wait, 3),
+        }
+
+
+# Token bucket kept in a Redis hash. TIME is read on the server so every
+# worker agrees on the clock. The limit in use is stored with the bucket, so
+# a Retry-After seen before any rate limit header can still be applied.
+# Floats are returned as strings because Lua numbers are truncated to
+# integers in Redis replies.
+_ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated', 'limit')
+local limit = tonumber(state[3]) or tonumber(ARGV[1])
+local rate = limit * tonumber(ARGV[2]) / 60
+local capacity = math.max(1, math.min(tonumber(ARGV[3]), limit))
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+if now > updated then
+  tokens = math.min(capacity, tokens + (now - updated) * rate)
+  updated = now
+end
+tokens = tokens - 1
+local wait = math.max(0, updated - now) + math.max(0, -tokens) / rate
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens),
+  'updated', tostring(updated), 'limit', tostring(limit))
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[4]))
+return {tostring(wait), tostring(tokens), tostring(limit)}
+"""
+
+# ARGV: headroom, burst, ttl, reserve, limit, remaining, reset_in, retry_after
+# (the last four may be empty strings when the header was absent)
+_SYNC_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated', 'limit')
+local limit = tonumber(ARGV[5]) or tonumber(state[3])
+if not limit then
+  return 0
+end
+local rate = limit * tonumber(ARGV[1]) / 60
+local capacity = math.max(1, math.min(tonumber(ARGV[2]), limit))
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+if now > updated then
+  tokens = math.min(capacity, tokens + (now - updated) * rate)
+  updated = now
+end
+tokens = math.min(tokens, capacity)
+local remaining = tonumber(ARGV[6])
+local block = tonumber(ARGV[8])
+if remaining then
+  local spare = remaining - tonumber(ARGV[4])
+  if spare <= 0 then
+    local reset_in = tonumber(ARGV[7])
+    if reset_in then
+      block = math.max(block or 0, reset_in)
+    else
+      tokens = math.min(tokens, 0)
+    end
+  else
+    tokens = math.min(tokens, spare)
+  end
+end
+if block then
+  updated = math.max(updated, now + block)
+  tokens = math.min(tokens, 1)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens),
+  'updated', tostring(updated), 'limit', tostring(limit))
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[3]))
+return 1
+"""
+
+
+class RedisTokenBucketLimiter:
+    """Token bucket shared by all workers and nodes through Redis.
+
+    Uses the ``CacheService`` Redis connection and atomic Lua scripts so
+    every process draws from the same AniList budget. When Redis fails the
+    limiter falls back to an in-process ``TokenBucketLimiter`` (kept warm
+    with the same header updates) and retries Redis after a cooldown.
+    """
+
+    def __init__(self, redis_client, key: str, retry_interval: float = 30.0):
+        self.redis = redis_client
+        self.key = key
+        self.retry_interval = retry_interval
+        self.fallback = TokenBucketLimiter()
+        self._acquire = redis_client.register_script(_ACQUIRE_SCRIPT)
+        self._sync = redis_client.register_script(_SYNC_SCRIPT)
+        self._down_until = 0.0
+        # Bucket TTL: long enough to outlive a quiet minute
+        self._ttl = 120
+
+        self.shared_tokens: Optional[float] = None
+        self.requests = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.fallbacks = 0
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def _mark_down(self, error: Exception):
+        self.fallbacks += 1
+        self._down_until = time.monotonic() + self.retry_interval
+        print(f"⚠️ Redis rate limiter error: {error}. Using in-process limiter.")
+
+    async def acquire(self):
+        """Wait until a request may be sent"""
+        if not self.available:
+            return await self.fallback.acquire()
+
+        try:
+            wait, tokens, _limit = await self._acquire(
+                keys=[self.key],
+                args=[
+                    self.fallback.limit,
+                    self.fallback.headroom,
+                    self.fallback.burst,
+                    self._ttl,
+                ],
+            )
+        except Exception as e:
+            self._mark_down(e)
+            return await self.fallback.acquire()
+
+        wait = float(wait)
+        self.shared_tokens = float(tokens)
+        self.requests += 1
+        if wait > 0:
+            self.throttled += 1
+            self.total_wait += wait
+            await asyncio.sleep(wait)
+
+    async def update_from_headers(
+        self, status_code: int, headers: Mapping[str, str]
+    ):
+        """Synchronise the shared bucket with AniList's rate limit headers"""
+        await self.fallback.update_from_headers(status_code, headers)
+
+        limit = _header_number(headers, "X-RateLimit-Limit")
+        remaining = _header_number(headers, "X-RateLimit-Remaining")
+        reset = _header_number(headers, "X-RateLimit-Reset")
+        retry_after = _header_number(headers, "Retry-After")
+        if limit is None and remaining is None and retry_after is None:
+            return
+
+        reset_in = max(0.0, reset - time.time()) if reset is not None else None
+        await self._run_sync(limit, remaining, reset_in, retry_after)
+
+    async def penalize(self, seconds: float):
+        """Hold all requests on every worker for ``seconds``"""
+        await self.fallback.penalize(seconds)
+        await self._run_sync(None, None, None, seconds)
+
+    async def _run_sync(
+        self,
+        limit: Optional[float],
+        remaining: Optional[float],
+        reset_in: Optional[float],
+        block: Optional[float],
+    ):
+        if not self.available:
+            return
+
+        def arg(value: Optional[float]) -> str:
+            return "" if value is None else str(value)
+
+        try:
+            await self._sync(
+                keys=[self.key],
+                args=[
+                    self.fallback.headroom,
+                    self.fallback.burst,
+                    self._ttl,
+                    self.fallback.reserve,
+                    arg(limit),
+                    arg(remaining),
+                    arg(reset_in),
+                    arg(block),
+                ],
+            )
+        except Exception as e:
+            self._mark_down(e)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current governor state for metrics"""
+        return {
+            "backend": "redis" if self.available else "redis (fallback)",
+            "key": self.key,
+            "shared_tokens": (
+                round(self.shared_tokens, 3) if self.shared_tokens is not None else None
+            ),
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "total_wait": round(self.total_wait, 3),
+            "fallbacks": self.fallbacks,
+            "local": self.fallback.snapshot(),
+        }
+
+
+RateLimiter = Union[TokenBucketLimiter, RedisTokenBucketLimiter]
+
+
+def create_rate_limiter() -> RateLimiter:
+    """Build the limiter selected by ``ANILIST_RATE_LIMIT_BACKEND``"""
+    if settings.ANILIST_RATE_LIMIT_BACKEND == "redis":
+        if cache.use_redis and cache.redis:
+            return RedisTokenBucketLimiter(
+                cache.redis, f"anilist_rate_limit:{settings.ANILIST_CLIENT_ID}"
+            )
+        print(
+            "⚠️ Redis rate limiter requested but Redis is not configured. "
+            "Using in-process limiter."
+        )
+    return TokenBucketLimiter()
+
+
+# Global rate governor instance
+rate_limiter = create_rate_limiter()
@@ -0,0 +1,95 @@
+"""
+In-process coalescing of concurrent identical calls
+"""
+
+import asyncio
+from typing import (
+    Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Sequence, TypeVar
+)
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class SingleFlight:
+    """Share one in-flight task between concurrent callers of the same key.
+
+    The first caller starts the work as a task; callers arriving while it
+    runs await the same task instead of repeating it. Keys are forgotten as
+    soon as the task finishes, so this never serves old results (that is
+    the cache's job). Tasks are shielded: a caller that is cancelled, e.g.
+    a disconnected client, does not cancel the work other callers share.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        # Counters for metrics
+        self.started = 0
+        self.joined = 0
+
+    def _start(self, keys: Sequence[Hashable], work: Awaitable[Any]) -> asyncio.Task:
+        task = asyncio.ensure_future(work)
+        for key in keys:
+            self._tasks[key] = task
+
+        def forget(done: asyncio.Task):
+            for key in keys:
+                if self._tasks.get(key) is done:
+                    del self._tasks[key]
+            # Mark the exception as retrieved even if every caller went away
+            if not done.cancelled():
+                done.exception()
+
+        task.add_done_callback(forget)
+        self.started += 1
+        return task
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[V]]) -> V:
+        """Run ``fn()`` unless a call for ``key`` is already in flight"""
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._start([key], fn())
+        else:
+            self.joined += 1
+        return await asyncio.shield(task)
+
+    async def do_many(
+        self,
+        keys: Iterable[K],
+        fn: Callable[[List[K]], Awaitable[Dict[K, V]]],
+    ) -> Dict[K, V]:
+        """Batch version of ``do``
+
+        Keys already in flight (possibly inside another caller's batch) are
+        joined; ``fn`` is called once with the remaining keys and must return
+        ``{key: value}``. Keys missing from every result are left out.
+        """
+        tasks: Dict[K, asyncio.Task] = {}
+        missing: List[K] = []
+        for key in dict.fromkeys(keys):
+            task = self._tasks.get(key)
+            if task is None:
+                missing.append(key)
+            else:
+                tasks[key] = task
+                self.joined += 1
+        if missing:
+            task = self._start(missing, fn(missing))
+            for key in missing:
+                tasks[key] = task
+
+        results: Dict[K, V] = {}
+        for task in set(tasks.values()):
+            await asyncio.shield(task)
+        for key, task in tasks.items():
+            found = task.result()
+            if key in found:
+                results[key] = found[key]
+        return results
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(set(self._tasks.values())),
+            "started": self.started,
+            "joined": self.joined,
+        }
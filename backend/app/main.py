@@ -2,6 +2,8 @@
 FastAPI Application Entry Point
 """
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
@@ -9,7 +11,19 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 import os
 
+from app.core.cache import cache
 from app.core.config import settings
+from app.core.http import http_pool
+from app.core.rate_limit import rate_limiter
+from app.services.anilist_client import (
+    media_batch_size,
+    media_flight,
+    media_loader,
+    request_flight,
+)
+from app.services.graph_snapshot import graph_snapshot
+from app.services.media_graph import media_graph
+from app.services.scan_jobs import scan_jobs
 from app.api.v1 import auth
 from app.api.v1.sequels import router as sequels_router
 
@@ -32,9 +46,24 @@ class OptionsMiddleware(BaseHTTPMiddleware):
         return await call_next(request)
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared resources on startup and release them on shutdown"""
+    await http_pool.start()
+    await media_graph.start()
+    cache.start_maintenance()
+    scan_jobs.start()
+    yield
+    await scan_jobs.stop()
+    await media_graph.stop()
+    await cache.stop_maintenance()
+    await http_pool.close()
+
+
 # Create FastAPI application
 app = FastAPI(
     title=settings.APP_NAME,
+    lifespan=lifespan,
     debug=settings.DEBUG,
     version="1.0.0",
     description="Find missing anime sequels from your AniList account",
@@ -63,6 +92,33 @@ app.include_router(
     sequels_router, prefix=f"{settings.API_V1_PREFIX}/sequels", tags=["sequels"]
 )
 
+
+# Health and metrics are registered before the SPA catch-all below, which
+# would otherwise answer them with index.html
+@app.get("/health")
+async def health_check():
+    """Health check endpoint"""
+    return {"status": "healthy"}
+
+
+@app.get("/metrics")
+async def metrics():
+    """Runtime metrics for the AniList client layer"""
+    return {
+        "anilist_rate_limit": rate_limiter.snapshot(),
+        "cache": cache.stats(),
+        "singleflight": {
+            "requests": request_flight.stats(),
+            "media": media_flight.stats(),
+        },
+        "media_loader": media_loader.stats(),
+        "media_batch_size": media_batch_size.stats(),
+        "media_graph": media_graph.stats(),
+        "graph_snapshot": graph_snapshot.stats(),
+        "scan_jobs": scan_jobs.stats(),
+    }
+
+
 # Serve static files (Frontend)
 # We expect the frontend build to be in the 'static' directory
 # In Docker, this is /app/static
@@ -108,11 +164,6 @@ else:
             "cwd": os.getcwd()
         }
 
-@app.get("/health")
-async def health_check():
-    """Health check endpoint"""
-    return {"status": "healthy"}
-
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,5 +1,6 @@
 """Models module exports"""
 
+from app.models.media import MediaNode, MediaRelation
 from app.models.user import User
 
-__all__ = ["User"]
+__all__ = ["MediaNode", "MediaRelation", "User"]
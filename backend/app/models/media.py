@@ -0,0 +1,63 @@
+"""
+Media relation graph models
+"""
+
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, String
+from sqlalchemy.sql import func
+
+from app.db.session import Base
+
+
+class MediaNode(Base):
+    """AniList media, as seen in list pages, batch lookups or relations"""
+
+    __tablename__ = "media_nodes"
+
+    # AniList media id
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    title_romaji = Column(String(500), nullable=True)
+    title_english = Column(String(500), nullable=True)
+    format = Column(String(20), nullable=True)
+    episodes = Column(Integer, nullable=True)
+    duration = Column(Integer, nullable=True)
+    season_year = Column(Integer, nullable=True)
+    average_score = Column(Integer, nullable=True)
+    status = Column(String(30), nullable=True)
+    next_airing_episode = Column(Integer, nullable=True)
+    next_airing_at = Column(Integer, nullable=True)
+    cover_image = Column(String(500), nullable=True)
+
+    # When this media's own relations were last stored. NULL for media only
+    # seen as the target of another media's relation.
+    relations_synced_at = Column(DateTime(timezone=True), nullable=True)
+
+    # Timestamps
+    updated_at = Column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+    def __repr__(self):
+        return f"<MediaNode(id={self.id}, title={self.title_romaji})>"
+
+
+class MediaRelation(Base):
+    """Typed relation edge between two media (e.g. SEQUEL, PREQUEL)"""
+
+    __tablename__ = "media_relations"
+
+    source_id = Column(
+        Integer, ForeignKey("media_nodes.id", ondelete="CASCADE"), primary_key=True
+    )
+    target_id = Column(
+        Integer,
+        ForeignKey("media_nodes.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
+    )
+    relation_type = Column(String(30), primary_key=True)
+
+    def __repr__(self):
+        return (
+            f"<MediaRelation({self.source_id} -{self.relation_type}->"
+            f" {self.target_id})>"
+        )
@@ -3,3 +3,9 @@ from pydantic import BaseModel
 class AddToListRequest(BaseModel):
     media_id: int
     status: str = "PLANNING"
+
+
+class ScanJobRequest(BaseModel):
+    username: str
+    max_depth: int = 2
+    force_refresh: bool = False
@@ -4,9 +4,228 @@ AniList API Client
 
 import httpx
 import asyncio
-from typing import Dict, Any, Optional, List
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
 from app.core.config import settings
 from app.core.cache import cache
+from app.core.http import http_pool
+from app.core.singleflight import SingleFlight
+from app.services.media_graph import media_graph
+from app.services.media_loader import AdaptiveBatchSize, MediaLoader
+from app.core.rate_limit import rate_limiter
+
+
+# Fields selected for each relation node
+RELATION_NODE_FIELDS = """
+id
+title {
+  romaji
+}
+format
+episodes
+seasonYear
+averageScore
+status
+nextAiringEpisode {
+  episode
+  airingAt
+}
+coverImage {
+  extraLarge
+}
+"""
+
+
+def _media_fields(node_fields: str) -> str:
+    return """
+id
+title {
+  romaji
+  english
+}
+format
+episodes
+duration
+status
+nextAiringEpisode {
+  episode
+  airingAt
+}
+coverImage {
+  extraLarge
+}
+relations {
+  edges {
+    relationType
+    node {
+      %s
+    }
+  }
+}
+""" % node_fields
+
+
+# Media selection shared by the list queries and the media details batch
+# query, so list pages return media in the media-details shape
+MEDIA_FIELDS = _media_fields(RELATION_NODE_FIELDS)
+
+# Like MEDIA_FIELDS, but relation nodes also carry their own relations, so
+# the sequels of sequels (depth 2) arrive with the list itself
+DEEP_MEDIA_FIELDS = _media_fields(
+    RELATION_NODE_FIELDS
+    + """
+relations {
+  edges {
+    relationType
+    node {
+      %s
+    }
+  }
+}
+""" % RELATION_NODE_FIELDS
+)
+
+# Top-level keys of a media-details payload (the fields of MEDIA_FIELDS)
+MEDIA_DETAIL_KEYS = (
+    "id",
+    "title",
+    "format",
+    "episodes",
+    "duration",
+    "status",
+    "nextAiringEpisode",
+    "coverImage",
+    "relations",
+)
+
+# Media selections available to the list queries. "ids" is for statuses that
+# are only used as exclusion sets and skips covers, airing info and relations.
+# "deep" is much more complex; see _deep_profile_allowed.
+LIST_FIELD_PROFILES = {
+    "full": MEDIA_FIELDS,
+    "deep": DEEP_MEDIA_FIELDS,
+    "ids": "id",
+}
+
+# Profiles whose media have the media-details shape
+DETAIL_PROFILES = {"full", "deep"}
+
+# When AniList rejects a deep list query as too complex, lists fall back to
+# the "full" profile (and deep search to batch lookups) until this time
+_deep_profile_retry_at = 0.0
+
+
+def _deep_profile_allowed() -> bool:
+    return time.monotonic() >= _deep_profile_retry_at
+
+
+def _reject_deep_profile(reason: str):
+    global _deep_profile_retry_at
+    _deep_profile_retry_at = time.monotonic() + settings.SEQUEL_DEEP_PREFETCH_RETRY
+    print(f"⚠️ Deep list profile rejected ({reason}). Using the full profile.")
+
+
+def _is_complexity_rejection(e: httpx.HTTPStatusError) -> bool:
+    status_code = e.response.status_code
+    return 400 <= status_code < 500 and _is_too_costly(status_code, e.response.text)
+
+
+def _list_fields(profile: str) -> str:
+    try:
+        return LIST_FIELD_PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"Unknown list field profile: {profile}")
+
+
+# User list keys embed a per-user generation; bumping it invalidates every
+# list of that user at once and the old generation simply expires. The
+# counter itself must outlive every list entry it namespaces.
+USER_LIST_GENERATION_TTL = 365 * 86400
+
+
+def _generation_key(username: str) -> str:
+    return f"user_list_gen:{username}"
+
+
+# Process-wide coalescing of identical in-flight work: GraphQL requests by
+# (token, query, variables), media details by id (so overlapping batches
+# and single lookups join fetches that are already running)
+request_flight = SingleFlight()
+media_flight = SingleFlight()
+
+
+# Media still producing new episodes or related entries
+_AIRING_STATUSES = {"RELEASING", "NOT_YET_RELEASED"}
+
+
+def media_cache_ttl(media: Dict[str, Any]) -> Tuple[int, int]:
+    """
+    Derive (soft TTL, hard TTL) for a media payload
+
+    FINISHED media whose relations are all settled barely ever changes and
+    is kept for weeks. Airing media goes stale when its next episode airs
+    (never later than the default media TTL). Everything else uses the
+    default media TTL.
+    """
+    soft_ttl = settings.CACHE_MEDIA_TTL
+    status = media.get("status")
+
+    if status == "FINISHED":
+        edges = (media.get("relations") or {}).get("edges") or []
+        pending = any(
+            (edge.get("node") or {}).get("status") in _AIRING_STATUSES
+            for edge in edges
+        )
+        if not pending:
+            soft_ttl = settings.CACHE_MEDIA_FINISHED_TTL
+    elif status in _AIRING_STATUSES:
+        airing_at = (media.get("nextAiringEpisode") or {}).get("airingAt")
+        if airing_at:
+            until_airing = int(airing_at - time.time())
+            soft_ttl = max(settings.CACHE_MEDIA_MIN_TTL, min(soft_ttl, until_airing))
+
+    # Stale copies stay usable for the same grace period past the soft TTL
+    hard_ttl = soft_ttl + settings.CACHE_MEDIA_HARD_TTL - settings.CACHE_MEDIA_TTL
+    return soft_ttl, max(soft_ttl, hard_ttl)
+
+
+def _media_details_shape(media: Dict[str, Any]) -> Dict[str, Any]:
+    """Trim a list-page media to the media-details shape"""
+    details = {key: media.get(key) for key in MEDIA_DETAIL_KEYS}
+    edges = (media.get("relations") or {}).get("edges")
+    if edges and any("relations" in (edge.get("node") or {}) for edge in edges):
+        # Deep profile: drop the relations nested inside relation nodes
+        details["relations"] = {
+            "edges": [
+                {
+                    **edge,
+                    "node": {
+                        key: value
+                        for key, value in (edge.get("node") or {}).items()
+                        if key != "relations"
+                    },
+                }
+                for edge in edges
+            ]
+        }
+    return details
+
+
+class MediaBatchError(Exception):
+    """AniList rejected an id_in request"""
+
+    def __init__(self, message: str, too_costly: bool = False):
+        super().__init__(message)
+        self.too_costly = too_costly
+
+
+def _is_too_costly(status_code: int, message: str) -> bool:
+    """Whether an error means the request asked for too much at once"""
+    message = message.lower()
+    return status_code == 413 or any(
+        hint in message for hint in ("complexity", "too large", "too many")
+    )
 
 
 class AniListClient:
@@ -15,13 +234,73 @@ class AniListClient:
     def __init__(self, access_token: Optional[str] = None):
         self.api_url = settings.ANILIST_API_URL
         self.access_token = access_token
+        # List generations seen by this client (one counter read per user)
+        self._list_generations: Dict[str, int] = {}
+
+    async def _with_deep_fallback(
+        self, profile: str, call: Callable[[str], Awaitable[Any]]
+    ) -> Any:
+        """Run a list call, downgrading "deep" to "full" when it is too complex
+
+        AniList checks query complexity up front; a rejected deep query is
+        retried with the full profile and deep queries are skipped for
+        SEQUEL_DEEP_PREFETCH_RETRY seconds.
+        """
+        if profile != "deep":
+            return await call(profile)
+        if not _deep_profile_allowed():
+            return await call("full")
+        try:
+            return await call("deep")
+        except httpx.HTTPStatusError as e:
+            if not _is_complexity_rejection(e):
+                raise
+            _reject_deep_profile(e.response.text[:200])
+            return await call("full")
+
+    async def _user_list_prefix(self, username: str) -> str:
+        """Cache key prefix for the user's lists at the current generation"""
+        generation = self._list_generations.get(username)
+        if generation is None:
+            generation = await cache.get_counter(_generation_key(username))
+            self._list_generations[username] = generation
+        return f"user_list_v5:{username}:{generation}"
 
     async def _make_request(
+        self,
+        query: str,
+        variables: Optional[Dict[str, Any]] = None,
+        scope: Hashable = None,
+    ) -> Dict[str, Any]:
+        """
+        Make a GraphQL request, sharing identical requests already in flight
+
+        Queries are coalesced per access token, query, variables and
+        ``scope``; mutations are always sent. User list loads pass their
+        cache keys as ``scope``, so a load for a new list generation never
+        joins a request started before ``invalidate_user_lists``.
+        """
+        if query.lstrip().startswith("mutation"):
+            return await self._send_request(query, variables)
+        key = (
+            self.access_token,
+            query,
+            json.dumps(variables, sort_keys=True, default=str),
+            scope,
+        )
+        return await request_flight.do(
+            key, lambda: self._send_request(query, variables)
+        )
+
+    async def _send_request(
         self, query: str, variables: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """
         Make a GraphQL request to AniList API with Rate Limit handling
 
+        Every attempt first waits on the process-wide rate governor, and
+        every response feeds its rate limit headers back into it.
+
         Args:
             query: GraphQL query string
             variables: Query variables
@@ -36,45 +315,47 @@ class AniListClient:
         max_retries = 10
         base_delay = 1.5
 
-        async with httpx.AsyncClient() as client:
-            for attempt in range(max_retries):
-                try:
-                    response = await client.post(
-                        self.api_url,
-                        json={"query": query, "variables": variables},
-                        headers=headers,
-                        timeout=60.0,
-                    )
-
-                    if response.status_code == 429:
-                        retry_after = int(
-                            response.headers.get(
-                                "Retry-After", base_delay * (2**attempt)
-                            )
-                        )
-                        print(f"⚠️ Rate limit hit (429). Retrying in {retry_after}s...")
-                        await asyncio.sleep(retry_after)
-                        continue
-
-                    response.raise_for_status()
-                    return response.json()
-
-                except httpx.HTTPStatusError as e:
-                    if e.response.status_code == 429:
-                        # Should be handled above, but just in case
+        client = http_pool.client
+        for attempt in range(max_retries):
+            try:
+                await rate_limiter.acquire()
+                response = await client.post(
+                    self.api_url,
+                    json={"query": query, "variables": variables},
+                    headers=headers,
+                )
+                await rate_limiter.update_from_headers(
+                    response.status_code, response.headers
+                )
+
+                if response.status_code == 429:
+                    retry_after = response.headers.get("Retry-After")
+                    if retry_after is None:
+                        # No hint from AniList: back off exponentially
                         retry_after = base_delay * (2**attempt)
-                        print(f"⚠️ Rate limit hit (429). Retrying in {retry_after}s...")
-                        await asyncio.sleep(retry_after)
-                        continue
+                        await rate_limiter.penalize(retry_after)
+                    print(f"⚠️ Rate limit hit (429). Retrying in {retry_after}s...")
+                    continue
+
+                response.raise_for_status()
+                return response.json()
+
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code == 429:
+                    # Should be handled above, but just in case
+                    retry_after = base_delay * (2**attempt)
+                    await rate_limiter.penalize(retry_after)
+                    print(f"⚠️ Rate limit hit (429). Retrying in {retry_after}s...")
+                    continue
+                raise e
+            except (httpx.RequestError, httpx.TimeoutException) as e:
+                if attempt == max_retries - 1:
                     raise e
-                except (httpx.RequestError, httpx.TimeoutException) as e:
-                    if attempt == max_retries - 1:
-                        raise e
-                    wait_time = base_delay * (2**attempt)
-                    print(f"⚠️ Network error: {e}. Retrying in {wait_time}s...")
-                    await asyncio.sleep(wait_time)
+                wait_time = base_delay * (2**attempt)
+                print(f"⚠️ Network error: {e}. Retrying in {wait_time}s...")
+                await asyncio.sleep(wait_time)
 
-            raise Exception("Max retries exceeded")
+        raise Exception("Max retries exceeded")
 
     async def get_user_info(self) -> Dict[str, Any]:
         """Get authenticated user information"""
@@ -117,7 +398,12 @@ class AniListClient:
         return result["data"]["User"]
 
     async def get_user_anime_list(
-        self, username: str, status: str, page: int = 1, per_page: int = 50
+        self,
+        username: str,
+        status: str,
+        page: int = 1,
+        per_page: int = 50,
+        profile: str = "full",
     ) -> Dict[str, Any]:
         """
         Get user's anime list
@@ -127,15 +413,22 @@ class AniListClient:
             status: List status (COMPLETED, PLANNING, etc.)
             page: Page number
             per_page: Items per page
+            profile: Media field profile (see LIST_FIELD_PROFILES)
 
         Returns:
             Anime list data
         """
-        cache_key = f"user_list_v4:{username}:{status}:{page}:{per_page}"
-        cached_data = await cache.get(cache_key)
-        if cached_data:
-            return cached_data
+        return await self._with_deep_fallback(
+            profile,
+            lambda p: self._get_user_anime_list(username, status, page, per_page, p),
+        )
 
+    async def _get_user_anime_list(
+        self, username: str, status: str, page: int, per_page: int, profile: str
+    ) -> Dict[str, Any]:
+        fields = _list_fields(profile)
+        prefix = await self._user_list_prefix(username)
+        cache_key = f"{prefix}:{status}:{profile}:{page}:{per_page}"
         query = """
         query ($username: String, $status: MediaListStatus, $page: Int, $perPage: Int) {
           Page(page: $page, perPage: $perPage) {
@@ -147,217 +440,349 @@ class AniListClient:
             mediaList(userName: $username, type: ANIME, status: $status) {
               score(format: POINT_100)
               media {
-                id
-                title {
-                  romaji
-                  english
-                }
-                format
-                episodes
-                duration
-                status
-                nextAiringEpisode {
-                  episode
-                  airingAt
-                }
-                coverImage {
-                  extraLarge
-                }
-                relations {
-                  edges {
-                    relationType
-                    node {
-                      id
-                      title {
-                        romaji
-                      }
-                      format
-                      episodes
-                      seasonYear
-                      averageScore
-                      status
-                      nextAiringEpisode {
-                        episode
-                        airingAt
-                      }
-                      coverImage {
-                        extraLarge
-                      }
-                    }
-                  }
-                }
+                %s
               }
             }
           }
         }
-        """
+        """ % fields
         variables = {
             "username": username,
             "status": status,
             "page": page,
             "perPage": per_page,
         }
-        result = await self._make_request(query, variables)
 
-        # Cache for 5 minutes only, to ensure freshness while avoiding immediate re-fetches
-        await cache.set(cache_key, result, ttl=300)
+        async def load() -> Dict[str, Any]:
+            result = await self._make_request(query, variables, scope=cache_key)
+            if profile in DETAIL_PROFILES:
+                page_data = (result.get("data") or {}).get("Page") or {}
+                await self._warm_media_cache(page_data.get("mediaList") or [])
+            return result
+
+        # Fresh for a few minutes; after that a stale copy is served while
+        # a background request refreshes it
+        return await cache.get_or_refresh(
+            cache_key,
+            load,
+            soft_ttl=settings.CACHE_USER_LIST_TTL,
+            hard_ttl=settings.CACHE_USER_LIST_HARD_TTL,
+        )
+
+    async def get_user_anime_list_collection(
+        self,
+        username: str,
+        statuses: List[str],
+        per_chunk: int = 500,
+        profile: str = "full",
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Get the user's whole anime list for several statuses at once
+
+        Uses the MediaListCollection query, which returns up to ``per_chunk``
+        entries per request across all requested statuses, instead of one
+        request per 50-entry page per status.
+
+        Args:
+            username: AniList username
+            statuses: List statuses to load (COMPLETED, PLANNING, etc.)
+            per_chunk: Entries per chunk (AniList allows up to 500)
+            profile: Media field profile (see LIST_FIELD_PROFILES)
+
+        Returns:
+            Mapping of status to list entries (``{"score", "media"}`` dicts,
+            the same shape as ``Page.mediaList`` items)
+        """
+        return await self._with_deep_fallback(
+            profile,
+            lambda p: self._get_user_anime_list_collection(
+                username, statuses, per_chunk, p
+            ),
+        )
+
+    async def _get_user_anime_list_collection(
+        self, username: str, statuses: List[str], per_chunk: int, profile: str
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        prefix = await self._user_list_prefix(username)
+        keys = {
+            status: f"{prefix}:{status}:collection:{profile}" for status in statuses
+        }
+        cached = await cache.get_many_swr(list(keys.values()))
+        lists: Dict[str, List[Dict[str, Any]]] = {}
+        missing = []
+        stale = []
+        for status in statuses:
+            if keys[status] in cached:
+                lists[status], is_stale = cached[keys[status]]
+                if is_stale:
+                    stale.append(status)
+            else:
+                missing.append(status)
+
+        if stale:
+            # Serve the stale lists now and reload them in the background
+            # (into the same generation they were read from)
+            by_key = {keys[status]: status for status in stale}
 
-        return result
+            async def refresh(refresh_keys: List[str]):
+                await self._fetch_collection(
+                    username,
+                    {key: by_key[key] for key in refresh_keys},
+                    per_chunk,
+                    profile,
+                )
 
-    async def get_media_details(self, media_id: int) -> Dict[str, Any]:
-        """Get details for a specific anime"""
-        cache_key = f"media_details_v3:{media_id}"
-        cached_data = await cache.get(cache_key)
-        if cached_data:
-            return cached_data
+            cache.schedule_refresh(list(by_key), refresh)
 
+        if missing:
+            lists.update(
+                await self._fetch_collection(
+                    username,
+                    {keys[status]: status for status in missing},
+                    per_chunk,
+                    profile,
+                )
+            )
+        return lists
+
+    async def _fetch_collection(
+        self,
+        username: str,
+        keys: Dict[str, str],
+        per_chunk: int,
+        profile: str,
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Load statuses with MediaListCollection and cache them per status
+
+        ``keys`` maps each cache key to the status stored under it.
+        """
+        statuses = list(keys.values())
+        fields = _list_fields(profile)
         query = """
-        query ($id: Int) {
-          Media(id: $id) {
-            id
-            title {
-              romaji
-              english
-            }
-            format
-            episodes
-            duration
-            status
-            nextAiringEpisode {
-              episode
-              airingAt
-            }
-            coverImage {
-              extraLarge
-            }
-            relations {
-              edges {
-                relationType
-                node {
-                  id
-                  title {
-                    romaji
-                  }
-                  format
-                  episodes
-                  seasonYear
-                  averageScore
-                  status
-                  nextAiringEpisode {
-                    episode
-                    airingAt
-                  }
-                  coverImage {
-                    extraLarge
-                  }
+        query (
+          $username: String, $statuses: [MediaListStatus], $chunk: Int, $perChunk: Int
+        ) {
+          MediaListCollection(
+            userName: $username
+            type: ANIME
+            status_in: $statuses
+            chunk: $chunk
+            perChunk: $perChunk
+            forceSingleCompletedList: true
+          ) {
+            hasNextChunk
+            lists {
+              status
+              isCustomList
+              entries {
+                score(format: POINT_100)
+                media {
+                  %s
                 }
               }
             }
           }
         }
+        """ % fields
+
+        fetched: Dict[str, List[Dict[str, Any]]] = {status: [] for status in statuses}
+        chunk = 1
+        while True:
+            variables = {
+                "username": username,
+                "statuses": statuses,
+                "chunk": chunk,
+                "perChunk": per_chunk,
+            }
+            result = await self._make_request(
+                query, variables, scope=tuple(sorted(keys))
+            )
+            collection = (result.get("data") or {}).get("MediaListCollection") or {}
+
+            for media_list in collection.get("lists") or []:
+                # Custom lists repeat entries that already appear in a status list
+                if media_list.get("isCustomList"):
+                    continue
+                status = media_list.get("status")
+                if status in fetched:
+                    fetched[status].extend(media_list.get("entries") or [])
+
+            if not collection.get("hasNextChunk"):
+                break
+            chunk += 1
+
+        # Cached per status so partial refreshes keep working
+        await cache.set_many(
+            {key: fetched[status] for key, status in keys.items()},
+            ttl=settings.CACHE_USER_LIST_HARD_TTL,
+            soft_ttl=settings.CACHE_USER_LIST_TTL,
+        )
+        if profile in DETAIL_PROFILES:
+            await self._warm_media_cache(
+                [entry for entries in fetched.values() for entry in entries]
+            )
+        return fetched
+
+    async def _warm_media_cache(self, entries: List[Dict[str, Any]]):
+        """Store the media of full/deep list entries as media details
+
+        List pages select MEDIA_FIELDS (or a superset of it), the same
+        fields as the media details query, so later lookups of these ids are
+        served from the cache. The media and their relations also go into
+        the media graph store.
         """
-        result = await self._make_request(query, {"id": media_id})
-        data = result["data"]["Media"]
+        items = {}
+        for entry in entries:
+            media = entry.get("media")
+            if media and media.get("id") is not None:
+                items[f"media_details_v3:{media['id']}"] = _media_details_shape(media)
+        if items:
+            await cache.set_many_with_policy(items, media_cache_ttl)
+            media_graph.schedule_upsert(list(items.values()))
 
-        # Cache for 24 hours
-        await cache.set(cache_key, data, ttl=86400)
+    async def get_media_details(self, media_id: int) -> Optional[Dict[str, Any]]:
+        """Get details for a specific anime, or None if AniList has no such id"""
+        async def load() -> Optional[Dict[str, Any]]:
+            # Batched with every other media lookup in this process
+            return await media_loader.load(media_id)
 
-        return data
+        return await cache.get_or_refresh(
+            f"media_details_v3:{media_id}",
+            load,
+            ttl_policy=media_cache_ttl,
+        )
 
     async def get_media_details_batch(self, media_ids: List[int]) -> List[Dict[str, Any]]:
         """Get details for multiple anime in a single request"""
-        # Check cache first
+        # Check cache first (one bulk lookup for the whole batch)
+        cached = await cache.get_many_swr(
+            [f"media_details_v3:{mid}" for mid in media_ids]
+        )
         cached_results = []
         ids_to_fetch = []
-        
+        stale_keys = []
+
         for mid in media_ids:
-            cache_key = f"media_details_v3:{mid}"
-            cached = await cache.get(cache_key)
-            if cached:
-                cached_results.append(cached)
+            key = f"media_details_v3:{mid}"
+            data, is_stale = cached.get(key, (None, False))
+            if data:
+                cached_results.append(data)
+                if is_stale:
+                    stale_keys.append(key)
             else:
                 ids_to_fetch.append(mid)
-        
+
+        if stale_keys:
+            # Stale details are good enough for this request; refresh them
+            # in the background with the same batched query
+            async def refresh(keys: List[str]):
+                await self._fetch_media_batch(
+                    [int(key.rsplit(":", 1)[1]) for key in keys]
+                )
+
+            cache.schedule_refresh(stale_keys, refresh)
+
         if not ids_to_fetch:
             return cached_results
 
-        # Fetch missing IDs
+        # Across workers only one fetches each missing id; the others wait
+        # for that fill to land in the cache
+        async def fill(keys: List[str]) -> Dict[str, Any]:
+            fetched = await self._fetch_media_batch(
+                [int(key.rsplit(":", 1)[1]) for key in keys]
+            )
+            return {f"media_details_v3:{media['id']}": media for media in fetched}
+
+        filled = await cache.fill_many(
+            [f"media_details_v3:{mid}" for mid in ids_to_fetch], fill
+        )
+        return cached_results + list(filled.values())
+
+    async def _fetch_media_batch(self, media_ids: List[int]) -> List[Dict[str, Any]]:
+        """Fetch media by id through the shared media loader"""
+        found = await media_loader.load_many(media_ids)
+        return [found[mid] for mid in dict.fromkeys(media_ids) if mid in found]
+
+    async def _fetch_media_pages(
+        self, media_ids: List[int]
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        Fetch media by id from AniList and cache them
+
+        Ids are sent in requests sized by ``media_batch_size``, which adapts
+        to the cost AniList reports. A request AniList rejects is bisected,
+        so only ids that fail on their own are dropped.
+        """
         query = """
-        query ($ids: [Int], $page: Int) {
-          Page(page: $page, perPage: 50) {
-            pageInfo {
-              hasNextPage
-            }
+        query ($ids: [Int], $perPage: Int) {
+          Page(page: 1, perPage: $perPage) {
             media(id_in: $ids) {
-              id
-              title {
-                romaji
-                english
-              }
-              format
-              episodes
-              duration
-              status
-              nextAiringEpisode {
-                episode
-                airingAt
-              }
-              coverImage {
-                extraLarge
-              }
-              relations {
-                edges {
-                  relationType
-                  node {
-                    id
-                    title {
-                      romaji
-                    }
-                    format
-                    episodes
-                    seasonYear
-                    averageScore
-                    status
-                    nextAiringEpisode {
-                      episode
-                      airingAt
-                    }
-                    coverImage {
-                      extraLarge
-                    }
-                  }
-                }
-              }
+              %s
             }
           }
         }
-        """
-        
-        fetched_results = []
-        page = 1
-        
-        while True:
-            variables = {"ids": ids_to_fetch, "page": page}
-            result = await self._make_request(query, variables)
-            
-            if "errors" in result:
-                print(f"Error fetching batch: {result['errors']}")
-                break
-                
-            data = result.get("data", {}).get("Page", {})
-            media_list = data.get("media", [])
-            fetched_results.extend(media_list)
-            
-            # Cache fetched items
-            for media in media_list:
-                cache_key = f"media_details_v3:{media['id']}"
-                await cache.set(cache_key, media, ttl=86400)
-            
-            if not data.get("pageInfo", {}).get("hasNextPage"):
-                break
-            page += 1
+        """ % MEDIA_FIELDS
+
+        found: Dict[int, Dict[str, Any]] = {}
+        remaining = list(dict.fromkeys(media_ids))
+        retry: List[List[int]] = []
+        while retry or remaining:
+            if retry:
+                chunk = retry.pop()
+            else:
+                size = media_batch_size.size
+                chunk, remaining = remaining[:size], remaining[size:]
+
+            try:
+                media_list = await self._fetch_media_page(query, chunk)
+            except MediaBatchError as e:
+                if e.too_costly:
+                    media_batch_size.record_too_costly()
+                if len(chunk) == 1:
+                    print(f"⚠️ Dropping media {chunk[0]}: {e}")
+                    continue
+                half = len(chunk) // 2
+                # First half is retried first
+                retry.append(chunk[half:])
+                retry.append(chunk[:half])
+                continue
+
+            media_batch_size.record_success(media_list)
+            await cache.set_many_with_policy(
+                {f"media_details_v3:{media['id']}": media for media in media_list},
+                media_cache_ttl,
+            )
+            media_graph.schedule_upsert(media_list)
+            found.update((media["id"], media) for media in media_list)
+
+        return found
 
-        return cached_results + fetched_results
+    async def _fetch_media_page(
+        self, query: str, media_ids: List[int]
+    ) -> List[Dict[str, Any]]:
+        """Fetch one id_in page, raising MediaBatchError when AniList rejects it"""
+        try:
+            result = await self._make_request(
+                query, {"ids": media_ids, "perPage": len(media_ids)}
+            )
+        except httpx.HTTPStatusError as e:
+            # Client errors are about this request (e.g. complexity); server
+            # errors and exhausted retries are not fixed by splitting it
+            status_code = e.response.status_code
+            if 400 <= status_code < 500:
+                message = e.response.text
+                raise MediaBatchError(
+                    message, too_costly=_is_too_costly(status_code, message)
+                ) from e
+            raise
+
+        if result.get("errors"):
+            message = "; ".join(
+                str(err.get("message", err)) for err in result["errors"]
+            )
+            raise MediaBatchError(message, too_costly=_is_too_costly(200, message))
+
+        return ((result.get("data") or {}).get("Page") or {}).get("media") or []
 
     async def add_to_list(
         self, media_id: int, status: str = "PLANNING"
@@ -381,7 +806,30 @@ class AniListClient:
         return await self._make_request(mutation, variables)
 
     async def invalidate_user_lists(self, username: str):
-        """Invalidate cached user lists for a username"""
-        # Pattern matches: user_list_v4:{username}:*
-        await cache.delete_pattern(f"user_list_v4:{username}:*")
+        """Invalidate cached user lists for a username
+
+        A single atomic increment of the user's list generation; entries of
+        older generations are never read again and expire on their own.
+        """
+        generation = await cache.incr(
+            _generation_key(username), USER_LIST_GENERATION_TTL
+        )
+        if generation is None:
+            # Cache backend unavailable: forget the memoized generation so
+            # the next read asks the backend again
+            self._list_generations.pop(username, None)
+            return
+        self._list_generations[username] = generation
+
+
+async def _load_media(media_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    # Media details are public, so one tokenless client serves every caller;
+    # ids already being fetched are joined rather than requested again
+    return await media_flight.do_many(media_ids, AniListClient()._fetch_media_pages)
+
+
+# Process-wide loader batching media lookups from all concurrent scans
+media_loader = MediaLoader(_load_media, window=settings.MEDIA_LOADER_WINDOW_MS / 1000)
 
+# Ids per id_in request, adapted to AniList's complexity and size limits
+media_batch_size = AdaptiveBatchSize(node_budget=settings.MEDIA_BATCH_NODE_BUDGET)
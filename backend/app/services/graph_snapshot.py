@@ -0,0 +1,379 @@
+"""
+Compact, memory-mapped snapshot of the SEQUEL graph shared by all workers
+"""
+
+import bisect
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from datetime import timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.config import settings
+from app.db.session import engine
+from app.models.media import MediaNode, MediaRelation
+
+# File layout (little-endian), each section padded to 8 bytes:
+#   header
+#   ids       int32[nodes]        sorted AniList media ids
+#   offsets   uint32[nodes + 1]   node i's edges: edges[offsets[i]:offsets[i+1]]
+#   edges     uint32[edges]       SEQUEL targets, as indexes into ids
+#   metadata  _RECORD[nodes]      per-node fields, strings point into the pool
+#   pool      utf-8 bytes         deduplicated strings
+_MAGIC = b"SQGRAPH\x00"
+_VERSION = 1
+# magic, version, nodes, edges, pool size, exported at (epoch seconds)
+_HEADER = struct.Struct("<8sIIIIQ")
+# relations synced at (epoch seconds, 0 = unknown), episodes, duration,
+# season year, average score, next airing episode, next airing at, then
+# (offset, length) of title romaji, title english, cover, format, status.
+# Missing integers are stored as -1 and missing strings as length 0.
+_RECORD = struct.Struct("<Iiiiiiq" + "II" * 5)
+_STRINGS = ("title_romaji", "title_english", "cover_image", "format", "status")
+
+# Derives (soft TTL, hard TTL) from a media-details payload
+TTLPolicy = Callable[[Dict[str, Any]], Tuple[int, int]]
+
+
+def _align(size: int) -> int:
+    return -size % 8
+
+
+def _int(value: Optional[int]) -> int:
+    return -1 if value is None else value
+
+
+def _opt(value: int) -> Optional[int]:
+    return None if value == -1 else value
+
+
+def _le(values: array) -> bytes:
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+async def export_snapshot(
+    path: str, db_engine: AsyncEngine = engine
+) -> Dict[str, int]:
+    """Write the SEQUEL graph stored by the media graph store to ``path``
+
+    The file is written next to ``path`` and renamed over it, so workers
+    that still map the previous snapshot keep a consistent view.
+    """
+    async with db_engine.connect() as conn:
+        nodes = (await conn.execute(select(MediaNode).order_by(MediaNode.id))).all()
+        relations = (
+            await conn.execute(
+                select(MediaRelation.source_id, MediaRelation.target_id)
+                .where(MediaRelation.relation_type == "SEQUEL")
+                .order_by(MediaRelation.source_id, MediaRelation.target_id)
+            )
+        ).all()
+
+    ids = array("i", (node.id for node in nodes))
+    index = {media_id: i for i, media_id in enumerate(ids)}
+
+    targets: List[List[int]] = [[] for _ in ids]
+    for source_id, target_id in relations:
+        if source_id in index and target_id in index:
+            targets[index[source_id]].append(index[target_id])
+    offsets = array("I", [0])
+    edges = array("I")
+    for node_targets in targets:
+        edges.extend(node_targets)
+        offsets.append(len(edges))
+
+    pool = bytearray()
+    interned: Dict[str, Tuple[int, int]] = {}
+
+    def intern(value: Optional[str]) -> Tuple[int, int]:
+        if not value:
+            return 0, 0
+        if value not in interned:
+            data = value.encode("utf-8")
+            interned[value] = (len(pool), len(data))
+            pool.extend(data)
+        return interned[value]
+
+    records = bytearray()
+    for node in nodes:
+        synced = node.relations_synced_at
+        if synced is not None and synced.tzinfo is None:
+            # SQLite hands back naive datetimes
+            synced = synced.replace(tzinfo=timezone.utc)
+        strings: List[int] = []
+        for column in _STRINGS:
+            strings.extend(intern(getattr(node, column)))
+        records += _RECORD.pack(
+            int(synced.timestamp()) if synced is not None else 0,
+            _int(node.episodes),
+            _int(node.duration),
+            _int(node.season_year),
+            _int(node.average_score),
+            _int(node.next_airing_episode),
+            _int(node.next_airing_at),
+            *strings,
+        )
+
+    header = _HEADER.pack(
+        _MAGIC, _VERSION, len(ids), len(edges), len(pool), int(time.time())
+    )
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        sections = (header, _le(ids), _le(offsets), _le(edges), records, pool)
+        for section in sections:
+            f.write(section)
+            f.write(b"\x00" * _align(len(section)))
+    os.replace(tmp, target)
+
+    print(
+        f"✅ Graph snapshot exported: {len(ids)} nodes, {len(edges)} sequel edges"
+        f" -> {path}"
+    )
+    return {"nodes": len(ids), "edges": len(edges), "bytes": target.stat().st_size}
+
+
+class GraphSnapshot:
+    """Read-only view of one snapshot file
+
+    The file is mapped, not read: ids, offsets and edges are memoryviews
+    over the mapping and metadata records are unpacked on demand, so every
+    worker shares the page cache copy of the file.
+    """
+
+    def __init__(self, path: str):
+        if sys.byteorder != "little":
+            raise ValueError(
+                "Graph snapshots are only supported on little-endian hosts"
+            )
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        sections: Dict[str, memoryview] = {}
+        try:
+            if len(self._mmap) < _HEADER.size:
+                raise ValueError(f"Truncated graph snapshot: {path}")
+            header = _HEADER.unpack_from(self._mmap, 0)
+            magic, version, nodes, edges, pool_size, exported_at = header
+            if magic != _MAGIC or version != _VERSION:
+                raise ValueError(f"Not a version {_VERSION} graph snapshot: {path}")
+
+            position = _HEADER.size + _align(_HEADER.size)
+            for name, size in (
+                ("ids", nodes * 4),
+                ("offsets", (nodes + 1) * 4),
+                ("edges", edges * 4),
+                ("records", nodes * _RECORD.size),
+                ("pool", pool_size),
+            ):
+                if position + size > len(self._mmap):
+                    raise ValueError(f"Truncated graph snapshot: {path}")
+                sections[name] = view[position:position + size]
+                position += size + _align(size)
+        except Exception:
+            for section in sections.values():
+                section.release()
+            view.release()
+            self._mmap.close()
+            raise
+
+        self.ids = sections["ids"].cast("i")
+        self.offsets = sections["offsets"].cast("I")
+        self.edges = sections["edges"].cast("I")
+        self._records = sections["records"]
+        self._pool = sections["pool"]
+        self._view = view
+        self.node_count = nodes
+        self.edge_count = edges
+        self.exported_at = exported_at
+
+    def close(self):
+        for view in (
+            self.ids, self.offsets, self.edges, self._records, self._pool, self._view
+        ):
+            view.release()
+        self._mmap.close()
+
+    def index_of(self, media_id: int) -> Optional[int]:
+        i = bisect.bisect_left(self.ids, media_id)
+        if i < self.node_count and self.ids[i] == media_id:
+            return i
+        return None
+
+    def sequels(self, media_id: int) -> List[int]:
+        """Ids of the known SEQUEL targets of ``media_id``"""
+        i = self.index_of(media_id)
+        if i is None:
+            return []
+        return [self.ids[j] for j in self.edges[self.offsets[i]:self.offsets[i + 1]]]
+
+    def _string(self, offset: int, length: int) -> Optional[str]:
+        if not length:
+            return None
+        return str(self._pool[offset:offset + length], "utf-8")
+
+    def _record(self, i: int) -> Tuple[int, Dict[str, Any]]:
+        fields = _RECORD.unpack_from(self._records, i * _RECORD.size)
+        synced, episodes, duration, season_year, score = fields[:5]
+        next_episode, next_at = fields[5:7]
+        strings = dict(
+            zip(_STRINGS, (self._string(*fields[k:k + 2]) for k in range(7, 17, 2)))
+        )
+        airing = None
+        if next_at != -1:
+            airing = {"episode": _opt(next_episode), "airingAt": next_at}
+        return synced, {
+            "id": self.ids[i],
+            "title": {
+                "romaji": strings["title_romaji"],
+                "english": strings["title_english"],
+            },
+            "format": strings["format"],
+            "episodes": _opt(episodes),
+            "duration": _opt(duration),
+            "seasonYear": _opt(season_year),
+            "averageScore": _opt(score),
+            "status": strings["status"],
+            "nextAiringEpisode": airing,
+            "coverImage": {"extraLarge": strings["cover_image"]},
+        }
+
+    def media(self, media_id: int) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """(relations synced at, media) with SEQUEL edges only
+
+        Returns None for unknown ids and for media only seen as the target
+        of another media's relation (their own sequels are unknown).
+        """
+        i = self.index_of(media_id)
+        if i is None:
+            return None
+        synced, media = self._record(i)
+        if not synced:
+            return None
+        media["relations"] = {
+            "edges": [
+                {"relationType": "SEQUEL", "node": self._record(j)[1]}
+                for j in self.edges[self.offsets[i]:self.offsets[i + 1]]
+            ]
+        }
+        return synced, media
+
+
+class SnapshotStore:
+    """Keeps the current snapshot mapped, reopening it when the file changes
+
+    The file is checked at most every ``check_interval`` seconds. Lookups
+    return nothing if the file is missing or unreadable, so callers fall
+    back to the media graph store and AniList.
+    """
+
+    def __init__(self, path: str, check_interval: float = 30.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot: Optional[GraphSnapshot] = None
+        self._stat: Optional[Tuple[int, int, int]] = None
+        self._checked_at: Optional[float] = None
+
+        # Counters for metrics
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.loads = 0
+        self.errors = 0
+
+    def current(self) -> Optional[GraphSnapshot]:
+        now = time.monotonic()
+        if not self.path or (
+            self._checked_at is not None
+            and now - self._checked_at < self.check_interval
+        ):
+            return self._snapshot
+        self._checked_at = now
+
+        try:
+            st = os.stat(self.path)
+            stat = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except OSError:
+            stat = None
+        if stat == self._stat:
+            return self._snapshot
+
+        old, self._snapshot, self._stat = self._snapshot, None, stat
+        if stat is not None:
+            try:
+                self._snapshot = GraphSnapshot(self.path)
+                self.loads += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️ Failed to load graph snapshot {self.path}: {e}")
+        if old is not None:
+            old.close()
+        return self._snapshot
+
+    def get_media(
+        self, media_ids: List[int], ttl_policy: TTLPolicy
+    ) -> Dict[int, Dict[str, Any]]:
+        """Media in the media-details shape, SEQUEL edges only
+
+        Freshness follows ``ttl_policy`` like the media graph store; since
+        only SEQUEL edges are kept, airing non-sequel relations do not
+        shorten the TTL of FINISHED media here.
+        """
+        snapshot = self.current()
+        if snapshot is None or not media_ids:
+            return {}
+
+        now = time.time()
+        found = {}
+        for media_id in dict.fromkeys(media_ids):
+            entry = snapshot.media(media_id)
+            if entry is None:
+                continue
+            synced, media = entry
+            soft_ttl, _hard_ttl = ttl_policy(media)
+            if now - synced > soft_ttl:
+                self.stale += 1
+                continue
+            found[media_id] = media
+
+        self.hits += len(found)
+        self.misses += len(set(media_ids)) - len(found)
+        return found
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "path": self.path or None,
+            "loaded": snapshot is not None,
+            "nodes": snapshot.node_count if snapshot else 0,
+            "edges": snapshot.edge_count if snapshot else 0,
+            "exported_at": snapshot.exported_at if snapshot else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "loads": self.loads,
+            "errors": self.errors,
+        }
+
+
+def snapshot_path() -> str:
+    return settings.GRAPH_SNAPSHOT_PATH or str(
+        Path(settings.CACHE_DIR) / "graph.snapshot"
+    )
+
+
+# Global snapshot store instance
+graph_snapshot = SnapshotStore(
+    snapshot_path(), settings.GRAPH_SNAPSHOT_CHECK_INTERVAL
+)
@@ -0,0 +1,368 @@
+"""
+Persistent media relation graph shared by every scan
+"""
+
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.core.config import settings
+from app.db.session import Base, engine
+from app.models.media import MediaNode, MediaRelation
+
+# Rows per INSERT, keeping bound parameters under SQLite's 999 limit
+_CHUNK = 60
+
+# Derives (soft TTL, hard TTL) from a media-details payload
+TTLPolicy = Callable[[Dict[str, Any]], Tuple[int, int]]
+
+# Columns written from each kind of payload. Full media (list pages, batch
+# lookups) and relation nodes select different fields, so neither may
+# overwrite the other's columns with NULLs.
+_MEDIA_COLUMNS = (
+    "title_romaji",
+    "title_english",
+    "format",
+    "episodes",
+    "duration",
+    "status",
+    "next_airing_episode",
+    "next_airing_at",
+    "cover_image",
+    "relations_synced_at",
+)
+_NODE_COLUMNS = (
+    "title_romaji",
+    "format",
+    "episodes",
+    "season_year",
+    "average_score",
+    "status",
+    "next_airing_episode",
+    "next_airing_at",
+    "cover_image",
+)
+
+
+def _chunks(rows: List[Any], size: int = _CHUNK) -> Iterable[List[Any]]:
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def _insert(conn: AsyncConnection) -> Callable[..., Any]:
+    """Dialect-specific INSERT supporting ON CONFLICT"""
+    if conn.dialect.name == "postgresql":
+        return postgresql.insert
+    return sqlite.insert
+
+
+def _node_row(media: Dict[str, Any]) -> Dict[str, Any]:
+    title = media.get("title") or {}
+    airing = media.get("nextAiringEpisode") or {}
+    return {
+        "id": media["id"],
+        "title_romaji": title.get("romaji"),
+        "title_english": title.get("english"),
+        "format": media.get("format"),
+        "episodes": media.get("episodes"),
+        "duration": media.get("duration"),
+        "season_year": media.get("seasonYear"),
+        "average_score": media.get("averageScore"),
+        "status": media.get("status"),
+        "next_airing_episode": airing.get("episode"),
+        "next_airing_at": airing.get("airingAt"),
+        "cover_image": (media.get("coverImage") or {}).get("extraLarge"),
+    }
+
+
+def _airing(row) -> Optional[Dict[str, Any]]:
+    if row.next_airing_at is None:
+        return None
+    return {"episode": row.next_airing_episode, "airingAt": row.next_airing_at}
+
+
+def _relation_node(row) -> Dict[str, Any]:
+    """A stored node in the shape of a relation node of the media query"""
+    return {
+        "id": row.id,
+        "title": {"romaji": row.title_romaji},
+        "format": row.format,
+        "episodes": row.episodes,
+        "seasonYear": row.season_year,
+        "averageScore": row.average_score,
+        "status": row.status,
+        "nextAiringEpisode": _airing(row),
+        "coverImage": {"extraLarge": row.cover_image},
+    }
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite hands back naive datetimes
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+class MediaGraphStore:
+    """Media nodes and typed relation edges in the application database.
+
+    Every list page and batch response the AniList client sees is upserted
+    here, so the franchise graph is shared across users and scans. Reads
+    rebuild media in the media-details shape, so traversal code cannot tell
+    them apart from AniList responses.
+
+    The store is an optimisation only: if its tables are missing or the
+    database fails, it prints a warning, turns itself off for
+    ``retry_interval`` seconds and callers fall back to AniList. Writes from
+    the request path run in the background (``schedule_upsert``); when
+    ``max_pending_writes`` are already in flight, further ones are dropped.
+    """
+
+    def __init__(
+        self,
+        db_engine: AsyncEngine,
+        retry_interval: float = 300.0,
+        max_pending_writes: int = 8,
+    ):
+        self.engine = db_engine
+        self.retry_interval = retry_interval
+        self.max_pending_writes = max_pending_writes
+        self._down_until = 0.0
+        self._writes: Set[asyncio.Task] = set()
+
+        # Counters for metrics
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.upserted = 0
+        self.dropped = 0
+        self.errors = 0
+
+    @property
+    def available(self) -> bool:
+        return settings.MEDIA_GRAPH_ENABLED and time.monotonic() >= self._down_until
+
+    def _mark_down(self, error: Exception):
+        self.errors += 1
+        self._down_until = time.monotonic() + self.retry_interval
+        print(f"⚠️ Media graph store unavailable: {error}. Falling back to AniList.")
+
+    async def start(self):
+        """Create the graph tables if missing (called from the app lifespan)
+
+        Only these two tables are created; existing tables and their rows,
+        including the users table, are left alone.
+        """
+        if not settings.MEDIA_GRAPH_ENABLED:
+            return
+        try:
+            async with self.engine.begin() as conn:
+                await conn.run_sync(
+                    Base.metadata.create_all,
+                    tables=[MediaNode.__table__, MediaRelation.__table__],
+                    checkfirst=True,
+                )
+        except Exception as e:
+            self._mark_down(e)
+
+    async def stop(self):
+        """Wait for background writes still in flight"""
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+
+    def schedule_upsert(self, media_list: List[Dict[str, Any]]):
+        """Run ``upsert_media`` in the background
+
+        The request path never waits on the database; the write is best
+        effort, like every other use of the store.
+        """
+        if not media_list or not self.available:
+            return
+        if len(self._writes) >= self.max_pending_writes:
+            self.dropped += 1
+            return
+        task = asyncio.create_task(self.upsert_media(media_list))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def upsert_media(self, media_list: List[Dict[str, Any]]):
+        """Store full media payloads with their relation edges
+
+        Each media's edges are replaced, and the media it points to are
+        stored as nodes (without edges of their own).
+        """
+        media_list = [m for m in media_list if m and m.get("id") is not None]
+        if not media_list or not self.available:
+            return
+
+        now = datetime.now(timezone.utc)
+        sources: Dict[int, Dict[str, Any]] = {}
+        targets: Dict[int, Dict[str, Any]] = {}
+        edges = set()
+        for media in media_list:
+            try:
+                source = {**_node_row(media), "relations_synced_at": now}
+                media_targets = {}
+                media_edges = set()
+                for edge in (media.get("relations") or {}).get("edges") or []:
+                    node = edge.get("node") or {}
+                    if node.get("id") is None or not edge.get("relationType"):
+                        continue
+                    media_targets[node["id"]] = _node_row(node)
+                    media_edges.add((media["id"], node["id"], edge["relationType"]))
+            except (AttributeError, TypeError) as e:
+                # Not shaped like an AniList media payload; skip just this one
+                print(f"⚠️ Media graph skipped media {media.get('id')}: {e}")
+                continue
+            sources[media["id"]] = source
+            for nid, row in media_targets.items():
+                targets.setdefault(nid, row)
+            edges |= media_edges
+        if not sources:
+            return
+
+        try:
+            async with self.engine.begin() as conn:
+                insert = _insert(conn)
+                # Targets first so edges never point at a missing node; a
+                # media that is both keeps the relation-only columns
+                # (season year, score) from its target payload. Rows go in
+                # id order so concurrent writes lock them in the same order.
+                await self._upsert_nodes(
+                    conn, insert, [targets[i] for i in sorted(targets)], _NODE_COLUMNS
+                )
+                await self._upsert_nodes(
+                    conn, insert, [sources[i] for i in sorted(sources)], _MEDIA_COLUMNS
+                )
+
+                source_ids = list(sources)
+                for chunk in _chunks(source_ids, 500):
+                    await conn.execute(
+                        delete(MediaRelation).where(MediaRelation.source_id.in_(chunk))
+                    )
+                rows = [
+                    {"source_id": s, "target_id": t, "relation_type": r}
+                    for s, t, r in sorted(edges)
+                ]
+                for chunk in _chunks(rows, 300):
+                    await conn.execute(
+                        insert(MediaRelation).values(chunk).on_conflict_do_nothing()
+                    )
+        except Exception as e:
+            self._mark_down(e)
+            return
+        self.upserted += len(sources)
+
+    async def _upsert_nodes(
+        self, conn, insert, rows: List[Dict[str, Any]], columns: Tuple[str, ...]
+    ):
+        for chunk in _chunks(rows):
+            values = [
+                {"id": row["id"], **{column: row.get(column) for column in columns}}
+                for row in chunk
+            ]
+            stmt = insert(MediaNode).values(values)
+            await conn.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[MediaNode.id],
+                    set_={column: stmt.excluded[column] for column in columns},
+                )
+            )
+
+    async def get_media(
+        self, media_ids: List[int], ttl_policy: TTLPolicy
+    ) -> Dict[int, Dict[str, Any]]:
+        """Load media whose stored relations are still fresh
+
+        Freshness follows ``ttl_policy``, the same policy as the media
+        details cache. Missing and stale ids are left out of the result.
+        """
+        if not media_ids or not self.available:
+            return {}
+
+        try:
+            async with self.engine.connect() as conn:
+                nodes: Dict[int, Any] = {}
+                for chunk in _chunks(list(dict.fromkeys(media_ids)), 500):
+                    result = await conn.execute(
+                        select(MediaNode).where(
+                            MediaNode.id.in_(chunk),
+                            MediaNode.relations_synced_at.is_not(None),
+                        )
+                    )
+                    nodes.update((row.id, row) for row in result)
+
+                edges: Dict[int, List[Tuple[str, int]]] = {nid: [] for nid in nodes}
+                for chunk in _chunks(list(nodes), 500):
+                    result = await conn.execute(
+                        select(MediaRelation).where(MediaRelation.source_id.in_(chunk))
+                    )
+                    for edge in result:
+                        edges[edge.source_id].append(
+                            (edge.relation_type, edge.target_id)
+                        )
+
+                target_ids = list({t for pairs in edges.values() for _, t in pairs})
+                targets: Dict[int, Any] = {}
+                for chunk in _chunks(target_ids, 500):
+                    result = await conn.execute(
+                        select(MediaNode).where(MediaNode.id.in_(chunk))
+                    )
+                    targets.update((row.id, row) for row in result)
+        except Exception as e:
+            self._mark_down(e)
+            return {}
+
+        now = datetime.now(timezone.utc)
+        found = {}
+        for nid, row in nodes.items():
+            media = {
+                "id": row.id,
+                "title": {"romaji": row.title_romaji, "english": row.title_english},
+                "format": row.format,
+                "episodes": row.episodes,
+                "duration": row.duration,
+                "status": row.status,
+                "nextAiringEpisode": _airing(row),
+                "coverImage": {"extraLarge": row.cover_image},
+                "relations": {
+                    "edges": [
+                        {
+                            "relationType": relation_type,
+                            "node": _relation_node(targets[tid]),
+                        }
+                        for relation_type, tid in edges[nid]
+                        if tid in targets
+                    ]
+                },
+            }
+            soft_ttl, _hard_ttl = ttl_policy(media)
+            age = (now - _as_utc(row.relations_synced_at)).total_seconds()
+            if age > soft_ttl:
+                self.stale += 1
+                continue
+            found[nid] = media
+
+        self.hits += len(found)
+        self.misses += len(set(media_ids)) - len(found)
+        return found
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.MEDIA_GRAPH_ENABLED,
+            "available": self.available,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "upserted": self.upserted,
+            "pending_writes": len(self._writes),
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+
+# Global media graph store instance
+media_graph = MediaGraphStore(engine)
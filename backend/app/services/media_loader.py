@@ -0,0 +1,176 @@
+"""
+DataLoader-style batching and adaptive batch sizing of media lookups
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+BatchFn = Callable[[List[int]], Awaitable[Dict[int, Dict[str, Any]]]]
+
+
+class MediaLoader:
+    """Collect media ids from all coroutines and fetch them in shared batches.
+
+    Ids requested within ``window`` seconds of each other are grouped and
+    handed to ``batch_fn`` in chunks of at most ``max_batch`` (the AniList
+    page size), so concurrent scans share a few full ``id_in`` queries
+    instead of sending many small ones. A chunk is sent as soon as it is
+    full; the remainder waits for the window to close.
+    """
+
+    def __init__(self, batch_fn: BatchFn, window: float = 0.005, max_batch: int = 50):
+        self.batch_fn = batch_fn
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+        # Counters for metrics
+        self.requested = 0
+        self.batches = 0
+
+    async def load(self, media_id: int) -> Optional[Dict[str, Any]]:
+        """Load one media, or None if AniList does not return it"""
+        return (await self.load_many([media_id])).get(media_id)
+
+    async def load_many(self, media_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """Load several media; ids AniList does not return are left out"""
+        loop = asyncio.get_running_loop()
+        futures: Dict[int, asyncio.Future] = {}
+        for media_id in dict.fromkeys(media_ids):
+            future = self._pending.get(media_id)
+            if future is None:
+                future = loop.create_future()
+                # Nobody may be left to await it if every caller is cancelled
+                future.add_done_callback(_retrieve)
+                self._pending[media_id] = future
+                self.requested += 1
+            futures[media_id] = future
+
+        if len(self._pending) >= self.max_batch:
+            self._dispatch(full_only=True)
+        if self._pending and self._timer is None:
+            self._timer = loop.call_later(self.window, self._dispatch)
+
+        results = {}
+        for media_id, future in futures.items():
+            media = await asyncio.shield(future)
+            if media is not None:
+                results[media_id] = media
+        return results
+
+    def _dispatch(self, full_only: bool = False):
+        """Send pending ids in chunks of ``max_batch``"""
+        ids = list(self._pending)
+        while ids and (len(ids) >= self.max_batch or not full_only):
+            chunk, ids = ids[:self.max_batch], ids[self.max_batch:]
+            futures = {media_id: self._pending.pop(media_id) for media_id in chunk}
+            task = asyncio.ensure_future(self._run(futures))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        if not self._pending and self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        elif not full_only:
+            self._timer = None
+
+    async def _run(self, futures: Dict[int, asyncio.Future]):
+        self.batches += 1
+        try:
+            found = await self.batch_fn(list(futures))
+        except Exception as e:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for media_id, future in futures.items():
+            if not future.done():
+                future.set_result(found.get(media_id))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "requested": self.requested,
+            "batches": self.batches,
+            "ids_per_batch": (
+                round(self.requested / self.batches, 2) if self.batches else None
+            ),
+        }
+
+
+def _retrieve(future: asyncio.Future):
+    if not future.cancelled():
+        future.exception()
+
+
+class AdaptiveBatchSize:
+    """AIMD controller for the number of ids sent per ``id_in`` request.
+
+    The ceiling grows by ``increase`` after every successful request and is
+    halved whenever AniList rejects a request as too complex or too large.
+    On top of that, the observed cost of a media (itself plus its relation
+    edges, the nodes AniList's complexity counts) keeps each request within
+    ``node_budget``.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 50,
+        min_size: int = 1,
+        node_budget: int = 2000,
+        increase: int = 2,
+    ):
+        self.max_size = max_size
+        self.min_size = min_size
+        self.node_budget = node_budget
+        self.increase = increase
+        self.limit = max_size
+        # Moving average of nodes returned per media
+        self.nodes_per_media: Optional[float] = None
+
+        # Counters for metrics
+        self.successes = 0
+        self.shrinks = 0
+
+    @property
+    def size(self) -> int:
+        size = self.limit
+        if self.nodes_per_media and self.node_budget > 0:
+            size = min(size, int(self.node_budget / self.nodes_per_media))
+        return max(self.min_size, size)
+
+    def record_success(self, media_list: List[Dict[str, Any]]):
+        """Account for a successful request and its returned media"""
+        self.successes += 1
+        self.limit = min(self.max_size, self.limit + self.increase)
+        if not media_list:
+            return
+        nodes = sum(
+            1 + len((media.get("relations") or {}).get("edges") or [])
+            for media in media_list
+        )
+        observed = nodes / len(media_list)
+        if self.nodes_per_media is None:
+            self.nodes_per_media = observed
+        else:
+            self.nodes_per_media = 0.8 * self.nodes_per_media + 0.2 * observed
+
+    def record_too_costly(self):
+        """AniList rejected a request for complexity or size"""
+        self.shrinks += 1
+        self.limit = max(self.min_size, self.limit // 2)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "limit": self.limit,
+            "nodes_per_media": (
+                round(self.nodes_per_media, 2)
+                if self.nodes_per_media is not None
+                else None
+            ),
+            "successes": self.successes,
+            "shrinks": self.shrinks,
+        }
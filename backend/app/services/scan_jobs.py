@@ -0,0 +1,280 @@
+"""
+Background sequel scan jobs, deduplicated and pollable from any worker
+"""
+
+import asyncio
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.cache import cache
+from app.core.config import settings
+import app.services.sequel_finder as sequel_service
+
+# A job record lives at _job_key(id); _active_key(username, depth, force)
+# holds the id of the queued or running job for that scan
+_JOB_PREFIX = "scan_job:"
+_ACTIVE_PREFIX = "scan_job_active:"
+
+ACTIVE_STATUSES = {"queued", "running"}
+
+
+def _job_key(job_id: str) -> str:
+    return f"{_JOB_PREFIX}{job_id}"
+
+
+def _active_key(username: str, max_depth: int, force_refresh: bool) -> str:
+    # A forced refresh must not join a scan that reads cached lists
+    suffix = ":force" if force_refresh else ""
+    return f"{_ACTIVE_PREFIX}{username.lower()}:{max_depth}{suffix}"
+
+
+class JobQueueFull(Exception):
+    """The local job queue is full; the client should retry later"""
+
+
+class ScanJobManager:
+    """Runs sequel scans in a bounded pool of background workers.
+
+    Job state (status, progress, result) is stored in the cache backend, so
+    with Redis or a shared SQLite file any worker can answer a poll. A scan
+    for a (username, depth, force_refresh) combination that is already
+    queued or running is joined instead of started again; the claim is an
+    atomic cache set-if-absent, so this holds across workers too.
+
+    Jobs run in the worker that accepted them and extend their claim with
+    every progress write, and at least every ``job_timeout / 3`` seconds
+    while the scan is quiet: if that process dies, its jobs stop updating
+    and their claim expires ``job_timeout`` after the last write.
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        queue_size: int = 100,
+        result_ttl: int = 3600,
+        job_timeout: int = 900,
+        progress_interval: float = 1.0,
+    ):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.result_ttl = result_ttl
+        self.job_timeout = job_timeout
+        self.progress_interval = progress_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        # Loop the workers run on (test clients may use a new loop per request)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # Counters for metrics
+        self.submitted = 0
+        self.joined = 0
+        self.completed = 0
+        self.failed = 0
+
+    def start(self):
+        """Start the worker pool (called from the app lifespan, or lazily)"""
+        loop = asyncio.get_running_loop()
+        if (
+            self._loop is loop
+            and self._workers
+            and not all(task.done() for task in self._workers)
+        ):
+            return
+        self._loop = loop
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._queue = queue
+        self._workers = [
+            asyncio.create_task(self._worker(queue))
+            for _ in range(max(1, self.workers))
+        ]
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        for task in self._workers:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._workers = []
+        self._queue = None
+
+    async def submit(
+        self, username: str, max_depth: int = 2, force_refresh: bool = False
+    ) -> Tuple[Dict[str, Any], bool]:
+        """Queue a scan or join the one already in progress
+
+        Returns ``(job, joined)``. Raises JobQueueFull when this worker's
+        queue is full.
+        """
+        self.start()
+        queue = self._queue
+        if queue is None:
+            raise RuntimeError("ScanJobManager.start() did not create the job queue")
+        active_key = _active_key(username, max_depth, force_refresh)
+
+        for _ in range(2):
+            job = self._new_job(username, max_depth, force_refresh)
+            claimed = await cache.add(active_key, job["id"], ttl=self.job_timeout)
+            if claimed is not False:
+                # Claimed, or the cache is down and scans are not deduplicated
+                break
+            existing = await self.get(await cache.get_shared(active_key) or "")
+            if existing is not None and existing["status"] in ACTIVE_STATUSES:
+                self.joined += 1
+                return existing, True
+            # The claim outlived its job (finished, expired or lost): take over.
+            # If another worker wins the retry race, the scan just runs twice.
+            await cache.delete(active_key)
+
+        if queue.full():
+            await cache.delete(active_key)
+            raise JobQueueFull("Too many scans queued, try again later")
+
+        await self._save(job)
+        queue.put_nowait(job)
+        self.submitted += 1
+        return job, False
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if not job_id:
+            return None
+        return await cache.get_shared(_job_key(job_id))
+
+    def _new_job(
+        self, username: str, max_depth: int, force_refresh: bool
+    ) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            "id": uuid.uuid4().hex,
+            "username": username,
+            "max_depth": max_depth,
+            "force_refresh": force_refresh,
+            "status": "queued",
+            "progress": {"list_pages": 0, "resolved": 0, "pending": 0, "found": 0},
+            "result": None,
+            "error": None,
+            "error_status": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+
+    async def _save(self, job: Dict[str, Any]):
+        job["updated_at"] = time.time()
+        ttl = self.job_timeout if job["status"] in ACTIVE_STATUSES else self.result_ttl
+        await cache.set(_job_key(job["id"]), job, ttl=ttl)
+
+    async def _save_progress(self, job: Dict[str, Any]):
+        """Save a running job and extend its claim, if the claim is still ours"""
+        await self._save(job)
+        active_key = _active_key(
+            job["username"], job["max_depth"], job["force_refresh"]
+        )
+        if await cache.get_shared(active_key) == job["id"]:
+            await cache.set(active_key, job["id"], ttl=self.job_timeout)
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            job = await queue.get()
+            try:
+                await self._run(job)
+            except Exception as e:
+                print(f"❌ Scan job {job['id']} could not be recorded: {e}")
+            finally:
+                queue.task_done()
+
+    async def _heartbeat(self, job: Dict[str, Any]):
+        """Keep a running job and its claim alive while the scan is quiet"""
+        while True:
+            await asyncio.sleep(self.job_timeout / 3)
+            await self._save_progress(job)
+
+    async def _stop_heartbeat(self, heartbeat: asyncio.Task):
+        # Stopped before the claim is released, so it cannot be re-extended
+        heartbeat.cancel()
+        await asyncio.gather(heartbeat, return_exceptions=True)
+
+    async def _run(self, job: Dict[str, Any]):
+        job["status"] = "running"
+        await self._save_progress(job)
+        progress = job["progress"]
+        user_profile = None
+        missing_sequels = []
+        saved_at = time.monotonic()
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+
+        try:
+            async for event in sequel_service.iter_missing_sequels(
+                job["username"],
+                force_refresh=job["force_refresh"],
+                max_depth=job["max_depth"],
+            ):
+                kind = event["event"]
+                if kind == "user":
+                    user_profile = event["user"]
+                elif kind == "sequel":
+                    missing_sequels.append(event["sequel"])
+                    progress["found"] = len(missing_sequels)
+                elif kind == "progress" and event["stage"] == "list":
+                    progress["list_pages"] += 1
+                elif kind == "progress":
+                    progress["resolved"] = event["resolved"]
+                    progress["pending"] = event["pending"]
+
+                # Progress is written at most every progress_interval seconds
+                if time.monotonic() - saved_at >= self.progress_interval:
+                    await self._save_progress(job)
+                    saved_at = time.monotonic()
+
+            job["status"] = "done"
+            job["result"] = {
+                "user": user_profile,
+                "missing_sequels": missing_sequels,
+                "count": len(missing_sequels),
+            }
+            self.completed += 1
+        except asyncio.CancelledError:
+            job["status"] = "failed"
+            job["error"] = "Scan cancelled"
+            self.failed += 1
+            await self._stop_heartbeat(heartbeat)
+            await self._finish(job)
+            raise
+        except Exception as e:
+            print(f"❌ Scan job {job['id']} for {job['username']} failed: {e}")
+            job["status"] = "failed"
+            job["error"] = str(e)
+            job["error_status"] = 404 if isinstance(e, ValueError) else 500
+            self.failed += 1
+        await self._stop_heartbeat(heartbeat)
+        await self._finish(job)
+
+    async def _finish(self, job: Dict[str, Any]):
+        await self._save(job)
+        active_key = _active_key(
+            job["username"], job["max_depth"], job["force_refresh"]
+        )
+        # Release the claim only if it is still ours
+        if await cache.get_shared(active_key) == job["id"]:
+            await cache.delete(active_key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": sum(1 for task in self._workers if not task.done()),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "submitted": self.submitted,
+            "joined": self.joined,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+# Global scan job manager instance
+scan_jobs = ScanJobManager(
+    workers=settings.SCAN_JOB_WORKERS,
+    queue_size=settings.SCAN_JOB_QUEUE_SIZE,
+    result_ttl=settings.SCAN_JOB_RESULT_TTL,
+    job_timeout=settings.SCAN_JOB_TIMEOUT,
+    progress_interval=settings.SCAN_JOB_PROGRESS_INTERVAL,
+)
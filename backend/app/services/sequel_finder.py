@@ -4,89 +4,236 @@ Service to find missing sequels using AniListClient
 
 import asyncio
 import httpx
-from typing import List, Dict, Any, Optional
+from collections import deque
+from typing import (
+    AsyncGenerator, AsyncIterator, Deque, List, Dict, Any, Optional, Set, Tuple
+)
 
-from app.services.anilist_client import AniListClient
+from app.core.config import settings
+from app.services.anilist_client import AniListClient, media_cache_ttl
+from app.services.graph_snapshot import graph_snapshot
+from app.services.media_graph import media_graph
+
+# Order matters: results are unpacked in this order below
+LIST_STATUSES = ["COMPLETED", "PLANNING", "CURRENT", "PAUSED", "DROPPED", "REPEATING"]
+
+# Statuses only used to build known_ids; fetched with the lean "ids" profile
+EXCLUSION_STATUSES = {"PLANNING", "PAUSED", "DROPPED"}
+
+
+def _list_profile(status: str, deep: bool = False) -> str:
+    if status in EXCLUSION_STATUSES:
+        return "ids"
+    return "deep" if deep else "full"
+
+
+def _entries_to_media(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Flatten list entries into media dicts carrying the user's score"""
+    items = []
+    for entry in entries:
+        media = entry.get("media")
+        if media:
+            # Copy so the user's score never leaks into cached list data
+            items.append({**media, "user_score": entry.get("score")})
+    return items
+
+
+def _raise_for_user_error(e: httpx.HTTPStatusError, username: str):
+    """Turn AniList errors that mean "no such user" into ValueError"""
+    # Check if it's a 404 error (User not found)
+    if e.response.status_code == 404:
+        raise ValueError(f"User '{username}' not found on AniList")
+
+    # If AniList returns 500, it might be a temporary issue or invalid user
+    if e.response.status_code == 500:
+        # Try to parse error message if available
+        try:
+            error_data = e.response.json()
+            errors = error_data.get("errors", [])
+            if errors and "User not found" in str(errors):
+                raise ValueError(f"User '{username}' not found on AniList")
+        except Exception:
+            pass
+        # If we can't determine it's a user error, re-raise with a cleaner message
+        raise ValueError(
+            f"AniList API Error (500). The user '{username}' might not exist "
+            "or the service is down."
+        )
 
 
 async def find_missing_sequels(
     username: str, 
     access_token: Optional[str] = None, 
     force_refresh: bool = False,
-    max_depth: int = 2
-) -> List[Dict[str, Any]]:
+    max_depth: int = 2,
+    list_mode: Optional[str] = None,
+    deep_prefetch: Optional[bool] = None,
+) -> Dict[str, Any]:
     """Find missing sequels for a given username.
 
+    Collects the events of ``iter_missing_sequels`` into
+    ``{"user": ..., "missing_sequels": [...]}``.
+    """
+    user_profile = None
+    missing_sequels = []
+    async for event in iter_missing_sequels(
+        username,
+        access_token=access_token,
+        force_refresh=force_refresh,
+        max_depth=max_depth,
+        list_mode=list_mode,
+        deep_prefetch=deep_prefetch,
+    ):
+        if event["event"] == "user":
+            user_profile = event["user"]
+        elif event["event"] == "sequel":
+            missing_sequels.append(event["sequel"])
+
+    return {
+        "user": user_profile,
+        "missing_sequels": missing_sequels
+    }
+
+
+async def iter_missing_sequels(
+    username: str,
+    access_token: Optional[str] = None,
+    force_refresh: bool = False,
+    max_depth: int = 2,
+    list_mode: Optional[str] = None,
+    deep_prefetch: Optional[bool] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Find missing sequels for a given username, yielding events as they happen.
+
     Logic:
     - Fetch COMPLETED, WATCHING, REPEATING and PLANNING lists
     - For each media, inspect relations for SEQUEL
     - If sequel is not present in any list, consider missing
     - Recursively search for sequels of missing sequels (Deep Search)
+
+    Events are dicts with an ``event`` key:
+    - ``user``: ``{"user": profile}``, once the user is known to exist
+    - ``progress``: ``{"stage": "list", "status", "page", "items"}`` per list
+      page (or status, in collection mode) and ``{"stage": "batch",
+      "resolved", "pending"}`` per deep-search batch
+    - ``sequel``: ``{"sequel": record}`` for each missing sequel, as soon as
+      it is found
+    - ``done``: ``{"count": n}`` at the end
+
+    Errors are raised, not yielded (ValueError when the user does not exist).
+
+    ``list_mode`` selects how lists are loaded: "pages" walks each status
+    page by page, "collection" loads every status through
+    MediaListCollection in a few large chunks. Defaults to
+    ``settings.SEQUEL_LIST_MODE``.
+
+    With ``deep_prefetch`` (default ``settings.SEQUEL_DEEP_PREFETCH``) the
+    source lists use the "deep" profile: relation nodes carry their own
+    relations, so depth 2 is resolved without batch lookups. Nodes without
+    inline relations (e.g. after a complexity fallback) are still fetched.
     """
     client = AniListClient(access_token)
+    list_mode = list_mode or settings.SEQUEL_LIST_MODE
+    if deep_prefetch is None:
+        deep_prefetch = settings.SEQUEL_DEEP_PREFETCH
+    # Depth 2 is only worth prefetching if the search goes that deep
+    deep = deep_prefetch and max_depth > 1
 
     if force_refresh:
         await client.invalidate_user_lists(username)
 
-    # helper to fetch all pages for a given status
-    # Semaphore to limit concurrent requests to avoid hitting rate limits too hard
-    sem = asyncio.Semaphore(2)
+    # Progress events reported by the list helpers below
+    progress: asyncio.Queue = asyncio.Queue()
+
+    # helper to fetch one page of a status list
+    async def fetch_page(status: str, page: int):
+        try:
+            resp = await client.get_user_anime_list(
+                username, status, page=page, profile=_list_profile(status, deep)
+            )
+        except httpx.HTTPStatusError as e:
+            _raise_for_user_error(e, username)
+            print(f"Error fetching page {page} for {status}: {e}")
+            raise e
+        except Exception as e:
+            print(f"Error fetching page {page} for {status}: {e}")
+            raise e
+        data = resp.get("data") or resp
+        page_data = data.get("Page") or {}
+        media_list = page_data.get("mediaList", [])
+        page_info = page_data.get("pageInfo", {})
+        print(
+            f"[{status}] Page {page}: {len(media_list)} items. "
+            f"Next: {page_info.get('hasNextPage')}"
+        )
+        progress.put_nowait({
+            "event": "progress", "stage": "list", "status": status,
+            "page": page, "items": len(media_list),
+        })
+        return media_list, page_info
 
+    # helper to fetch all pages for a given status
+    # The first page reports pageInfo.total, so the remaining pages are
+    # requested concurrently; pacing is handled globally by the AniListClient
+    # rate governor.
     async def fetch_all(status: str):
-        async with sem:
-            page = 1
-            items = []
-            while True:
-                try:
-                    resp = await client.get_user_anime_list(username, status, page=page)
-                    data = resp.get("data") or resp
-                    page_data = data.get("Page")
-                    if not page_data:
-                        break
-                    media_list = page_data.get("mediaList", [])
-                    for entry in media_list:
-                        media = entry.get("media")
-                        score = entry.get("score")
-                        if media:
-                            media["user_score"] = score
-                            items.append(media)
-                    page_info = page_data.get("pageInfo", {})
-                    has_next = page_info.get("hasNextPage")
-                    print(f"[{status}] Page {page}: {len(media_list)} items. Next: {has_next}")
-                    
-                    # Safety check: if no items returned, stop to avoid infinite loops
-                    if not media_list:
-                        break
-
-                    if not has_next:
-                        break
-                    page += 1
-                    # Rate limit is now handled by AniListClient with exponential backoff
-                except httpx.HTTPStatusError as e:
-                    # Check if it's a 404 error (User not found)
-                    if e.response.status_code == 404:
-                        raise ValueError(f"User '{username}' not found on AniList")
-                    
-                    # If AniList returns 500, it might be a temporary issue or invalid user
-                    if e.response.status_code == 500:
-                         # Try to parse error message if available
-                        try:
-                            error_data = e.response.json()
-                            errors = error_data.get("errors", [])
-                            if errors and "User not found" in str(errors):
-                                raise ValueError(f"User '{username}' not found on AniList")
-                        except:
-                            pass
-                        # If we can't determine it's a user error, re-raise but with a cleaner message
-                        raise ValueError(f"AniList API Error (500). The user '{username}' might not exist or the service is down.")
-
-                    print(f"Error fetching page {page} for {status}: {e}")
-                    raise e
-                except Exception as e:
-                    print(f"Error fetching page {page} for {status}: {e}")
-                    raise e
+        per_page = 50
+        media_list, page_info = await fetch_page(status, 1)
+        items = _entries_to_media(media_list)
+        # Safety check: if no items returned, stop to avoid infinite loops
+        if not media_list or not page_info.get("hasNextPage"):
             return items
 
+        page = 2
+        total = page_info.get("total")
+        if total:
+            last_page = -(-total // per_page)
+            pages = await asyncio.gather(
+                *(fetch_page(status, p) for p in range(2, last_page + 1))
+            )
+            # Reassemble in order; stop at the first page that shows the list
+            # is shorter than pageInfo.total suggested
+            for media_list, page_info in pages:
+                items.extend(_entries_to_media(media_list))
+                if not media_list or not page_info.get("hasNextPage"):
+                    return items
+            page = last_page + 1
+
+        # No total, or the list grew past it: walk the rest sequentially
+        while True:
+            media_list, page_info = await fetch_page(status, page)
+            items.extend(_entries_to_media(media_list))
+            if not media_list or not page_info.get("hasNextPage"):
+                return items
+            page += 1
+
+    # helper to load every status at once through MediaListCollection
+    # (two concurrent calls so exclusion statuses use the lean "ids" profile)
+    async def fetch_collection():
+        source = [s for s in LIST_STATUSES if _list_profile(s) != "ids"]
+        exclusion = [s for s in LIST_STATUSES if _list_profile(s) == "ids"]
+        try:
+            full_lists, id_lists = await asyncio.gather(
+                client.get_user_anime_list_collection(
+                    username, source, profile="deep" if deep else "full"
+                ),
+                client.get_user_anime_list_collection(
+                    username, exclusion, profile="ids"
+                ),
+            )
+            lists = {**full_lists, **id_lists}
+        except httpx.HTTPStatusError as e:
+            _raise_for_user_error(e, username)
+            print(f"Error fetching list collection: {e}")
+            raise e
+        for status in LIST_STATUSES:
+            print(f"[{status}] Collection: {len(lists.get(status, []))} items")
+            progress.put_nowait({
+                "event": "progress", "stage": "list", "status": status,
+                "page": None, "items": len(lists.get(status, [])),
+            })
+        return [_entries_to_media(lists.get(status, [])) for status in LIST_STATUSES]
+
     # 1. Fetch User Profile first to validate user exists and get stats
     print(f"Fetching profile for {username}...")
     try:
@@ -97,15 +244,24 @@ async def find_missing_sequels(
              raise ValueError(f"User '{username}' not found on AniList")
         raise e
 
-    print("Fetching user lists...")
-    completed, planning, watching, paused, dropped, repeating = await asyncio.gather(
-        fetch_all("COMPLETED"),
-        fetch_all("PLANNING"),
-        fetch_all("CURRENT"),
-        fetch_all("PAUSED"),
-        fetch_all("DROPPED"),
-        fetch_all("REPEATING"),
-    )
+    yield {"event": "user", "user": user_profile}
+
+    print(f"Fetching user lists ({list_mode})...")
+    if list_mode == "collection":
+        lists_task = asyncio.ensure_future(fetch_collection())
+    else:
+        lists_task = asyncio.ensure_future(
+            asyncio.gather(*(fetch_all(status) for status in LIST_STATUSES))
+        )
+    # Relay page progress while the lists load
+    relay = _relay(progress, lists_task)
+    try:
+        async for event in relay:
+            yield event
+    finally:
+        # Runs the relay's cleanup now if our own consumer stops early
+        await relay.aclose()
+    completed, planning, watching, paused, dropped, repeating = lists_task.result()
 
     # Sets for O(1) lookup
     completed_ids = {m.get("id") for m in completed}
@@ -129,8 +285,11 @@ async def find_missing_sequels(
         .union(repeating_ids)
     )
 
-    missing_sequels = []
-    queue = []  # Queue of (id, depth, origin_score) tuples for Deep Search
+    found = 0
+    # Queue of (id, depth, origin_score, inline_media) tuples for Deep Search;
+    # inline_media is the relation node itself when it already carries its
+    # relations (deep list profile), so it needs no lookup
+    queue: Deque[Tuple[int, int, Any, Optional[Dict[str, Any]]]] = deque()
 
     # Combine lists to check for sequels (Completed + Watching + Repeating)
     # We DO NOT include Planning in source_list because we don't want to suggest sequels for things the user hasn't watched yet.
@@ -177,84 +336,165 @@ async def find_missing_sequels(
                         "format": node.get("format"),
                         "depth": 1,
                     }
-                    missing_sequels.append(missing_item)
+                    yield {"event": "sequel", "sequel": missing_item}
+                    found += 1
                     known_ids.add(nid)
                     if max_depth > 1:
-                        queue.append((nid, 2, user_score))  # Next depth will be 2
+                        inline = node if "relations" in node else None
+                        # Next depth will be 2
+                        queue.append((nid, 2, user_score, inline))
 
     # 2. Deep search: Check sequels of the missing sequels
-    # Optimized: Process queue in batches to reduce API calls
-    while queue:
-        # Take a batch of up to 50 items from the queue
-        batch_size = 50
-        batch = []
-        while queue and len(batch) < batch_size:
-            batch.append(queue.pop(0))
-        
-        if not batch:
-            break
-            
-        batch_ids = [item[0] for item in batch]
-        # Map ID to its depth and score for processing results
-        id_meta_map = {item[0]: {"depth": item[1], "score": item[2]} for item in batch}
-        
+    # Pipelined BFS: up to DEEP_SEARCH_MAX_IN_FLIGHT batches are resolved
+    # concurrently (AniList pacing is handled by the client's rate governor)
+    # and each batch's sequels are queued as soon as it returns, without
+    # waiting for its siblings. Small batches sent side by side are still
+    # merged into shared id_in requests by the media loader.
+    async def resolve_batch(batch):
+        # Only ids without inline relations need a lookup
+        batch_ids = [item[0] for item in batch if item[3] is None]
+        media_details_list = [item[3] for item in batch if item[3] is not None]
         try:
-            # Fetch details for all IDs in the batch at once
-            media_details_list = await client.get_media_details_batch(batch_ids)
-            
-            for media_details in media_details_list:
-                current_id = media_details.get("id")
-                meta = id_meta_map.get(current_id)
-                
-                if not current_id or not meta:
-                    continue
-                
-                current_depth = meta["depth"]
-                origin_score = meta["score"]
-                
-                relations = media_details.get("relations", {}).get("edges", [])
-
-                for edge in relations:
-                    if edge.get("relationType") == "SEQUEL":
-                        node = edge.get("node")
-                        if not node:
-                            continue
-
-                        # Filter out non-anime formats
-                        if node.get("format") not in ANIME_FORMATS:
-                            continue
-
-                        nid = node.get("id")
-
-                        if nid not in known_ids:
-                            # Found a sequel to a missing sequel
-                            missing_item = {
-                                "base_id": current_id,
-                                "base_title": media_details.get("title", {}).get("romaji"),
-                                "base_score": origin_score,
-                                "missing_id": nid,
-                                "missing_title": node.get("title", {}).get("romaji"),
-                                "missing_cover": node.get("coverImage", {}).get("extraLarge"),
-                                "missing_score": node.get("averageScore"),
-                                "missing_episodes": node.get("episodes"),
-                                "missing_year": node.get("seasonYear"),
-                                "missing_status": node.get("status"),
-                                "missing_next_airing": node.get("nextAiringEpisode"),
-                                "format": node.get("format"),
-                                "depth": current_depth,
-                            }
-                            missing_sequels.append(missing_item)
-                            known_ids.add(nid)
-                            
-                            if current_depth < max_depth:
-                                queue.append((nid, current_depth + 1, origin_score))
-
+            if batch_ids:
+                # Traverse the mapped graph snapshot, then the local relation
+                # graph; only ids that are missing or stale in both are looked up
+                local = graph_snapshot.get_media(batch_ids, media_cache_ttl)
+                media_details_list += [local[mid] for mid in batch_ids if mid in local]
+                batch_ids = [mid for mid in batch_ids if mid not in local]
+            if batch_ids:
+                local = await media_graph.get_media(batch_ids, media_cache_ttl)
+                media_details_list += [local[mid] for mid in batch_ids if mid in local]
+                batch_ids = [mid for mid in batch_ids if mid not in local]
+            if batch_ids:
+                # Fetch details for all IDs in the batch at once
+                media_details_list += await client.get_media_details_batch(batch_ids)
         except Exception as e:
             # In production, use a proper logger
             print(f"Error fetching batch details: {e}")
-            continue
+        return batch, media_details_list
 
-    return {
-        "user": user_profile,
-        "missing_sequels": missing_sequels
-    }
+    batch_size = 50
+    max_in_flight = max(1, settings.DEEP_SEARCH_MAX_IN_FLIGHT)
+    in_flight: Set[asyncio.Future] = set()
+    # Ids taken off the queue, for progress events
+    resolved = 0
+    in_flight_ids = 0
+    try:
+        while queue or in_flight:
+            # Start batches of up to 50 items while there is room in the
+            # pipeline
+            while queue and len(in_flight) < max_in_flight:
+                size = min(batch_size, len(queue))
+                batch = [queue.popleft() for _ in range(size)]
+                in_flight.add(asyncio.ensure_future(resolve_batch(batch)))
+                in_flight_ids += len(batch)
+
+            done, in_flight = await asyncio.wait(
+                in_flight, return_when=asyncio.FIRST_COMPLETED
+            )
+
+            for task in done:
+                batch, media_details_list = task.result()
+                resolved += len(batch)
+                in_flight_ids -= len(batch)
+                # Map ID to its depth and score for processing results
+                id_meta_map = {
+                    item[0]: {"depth": item[1], "score": item[2]} for item in batch
+                }
+
+                for media_details in media_details_list:
+                    current_id = media_details.get("id")
+                    meta = id_meta_map.get(current_id)
+
+                    if not current_id or not meta:
+                        continue
+
+                    current_depth = meta["depth"]
+                    origin_score = meta["score"]
+
+                    relations = media_details.get("relations", {}).get("edges", [])
+
+                    for edge in relations:
+                        if edge.get("relationType") == "SEQUEL":
+                            node = edge.get("node")
+                            if not node:
+                                continue
+
+                            # Filter out non-anime formats
+                            if node.get("format") not in ANIME_FORMATS:
+                                continue
+
+                            nid = node.get("id")
+
+                            if nid not in known_ids:
+                                # Found a sequel to a missing sequel
+                                base_title = media_details.get("title", {})
+                                title = node.get("title", {})
+                                cover = node.get("coverImage", {})
+                                missing_item = {
+                                    "base_id": current_id,
+                                    "base_title": base_title.get("romaji"),
+                                    "base_score": origin_score,
+                                    "missing_id": nid,
+                                    "missing_title": title.get("romaji"),
+                                    "missing_cover": cover.get("extraLarge"),
+                                    "missing_score": node.get("averageScore"),
+                                    "missing_episodes": node.get("episodes"),
+                                    "missing_year": node.get("seasonYear"),
+                                    "missing_status": node.get("status"),
+                                    "missing_next_airing": node.get(
+                                        "nextAiringEpisode"
+                                    ),
+                                    "format": node.get("format"),
+                                    "depth": current_depth,
+                                }
+                                yield {"event": "sequel", "sequel": missing_item}
+                                found += 1
+                                known_ids.add(nid)
+
+                                if current_depth < max_depth:
+                                    inline = node if "relations" in node else None
+                                    queue.append(
+                                        (nid, current_depth + 1, origin_score, inline)
+                                    )
+
+                yield {
+                    "event": "progress", "stage": "batch",
+                    "resolved": resolved, "pending": len(queue) + in_flight_ids,
+                }
+    finally:
+        # The scan was cancelled, failed or its consumer stopped: do not
+        # leave lookups running
+        for task in in_flight:
+            task.cancel()
+        await asyncio.gather(*in_flight, return_exceptions=True)
+
+    yield {"event": "done", "count": found}
+
+
+async def _relay(
+    events: asyncio.Queue, task: asyncio.Future
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """Yield events put on ``events`` until ``task`` is done
+
+    Cancels and awaits ``task`` and the pending queue read if the consumer
+    stops early or is cancelled.
+    """
+    getter: Optional[asyncio.Future] = None
+    try:
+        while not task.done():
+            getter = asyncio.ensure_future(events.get())
+            done, _ = await asyncio.wait(
+                {getter, task}, return_when=asyncio.FIRST_COMPLETED
+            )
+            if getter in done:
+                yield getter.result()
+            else:
+                getter.cancel()
+        while not events.empty():
+            yield events.get_nowait()
+    finally:
+        pending = [f for f in (getter, task) if f is not None and not f.done()]
+        for future in pending:
+            future.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,16 @@
+"""
+Export the stored SEQUEL graph as a memory-mapped snapshot for the workers
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.graph_snapshot import export_snapshot, snapshot_path  # noqa: E402
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else snapshot_path()
+    asyncio.run(export_snapshot(path))
@@ -9,7 +9,8 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from app.db.session import engine, Base
-from app.models import User  # Import all models
+# Import all models
+from app.models import MediaNode, MediaRelation, User  # noqa: E402,F401
 
 
 async def init_db():
@@ -0,0 +1,18 @@
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.db.session import Base
+from app.models.media import MediaNode, MediaRelation
+
+
+@pytest.fixture
+async def graph_engine(tmp_path):
+    """SQLite engine with just the media graph tables"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'graph.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(
+            Base.metadata.create_all,
+            tables=[MediaNode.__table__, MediaRelation.__table__],
+        )
+    yield engine
+    await engine.dispose()
@@ -0,0 +1,44 @@
+"""
+AniList media payloads for the media graph and graph snapshot tests
+"""
+
+
+def fresh(media):
+    """TTL policy under which every stored media is still fresh"""
+    return 3600, 7200
+
+
+def make_media(media_id, status="FINISHED", relations=(), english=None):
+    """Media in the media-details shape; relations are (type, node) pairs"""
+    return {
+        "id": media_id,
+        "title": {"romaji": f"Anime {media_id}", "english": english},
+        "format": "TV",
+        "episodes": 12,
+        "duration": 24,
+        "status": status,
+        "nextAiringEpisode": None,
+        "coverImage": {"extraLarge": f"img{media_id}"},
+        "relations": {
+            "edges": [
+                {"relationType": relation_type, "node": node}
+                for relation_type, node in relations
+            ]
+        },
+    }
+
+
+def make_node(media_id, status="FINISHED", **fields):
+    """Relation node as selected by the media query"""
+    return {
+        "id": media_id,
+        "title": {"romaji": f"Anime {media_id}"},
+        "format": "TV",
+        "episodes": 12,
+        "seasonYear": 2020,
+        "averageScore": 80,
+        "status": status,
+        "nextAiringEpisode": None,
+        "coverImage": {"extraLarge": f"img{media_id}"},
+        **fields,
+    }
@@ -1,16 +1,44 @@
 import pytest
 from unittest.mock import AsyncMock, patch, MagicMock
-from app.services.anilist_client import AniListClient
+from app.core.cache import cache
+from app.core.rate_limit import RedisTokenBucketLimiter, TokenBucketLimiter
+from app.services.anilist_client import (
+    MEDIA_DETAIL_KEYS, AniListClient, media_cache_ttl
+)
 import httpx
 
+
+@pytest.fixture(autouse=True)
+def _no_media_graph():
+    # The media graph store is covered in test_media_graph.py
+    with patch("app.core.config.settings.MEDIA_GRAPH_ENABLED", False):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def _list_generation():
+    # User list keys are namespaced by a generation counter; start every test at 0
+    with patch("app.core.cache.cache.get_counter",
+               new_callable=AsyncMock, return_value=0) as counter:
+        yield counter
+
+
+@pytest.fixture(autouse=True)
+def _fresh_rate_limiter():
+    # Each test gets its own governor so bucket state does not leak between tests
+    limiter = TokenBucketLimiter()
+    with patch("app.services.anilist_client.rate_limiter", limiter):
+        yield limiter
+
+
 @pytest.mark.asyncio
 async def test_make_request_success():
-    with patch("httpx.AsyncClient") as MockClient:
-        mock_client_instance = MockClient.return_value
-        mock_client_instance.__aenter__.return_value = mock_client_instance
-        
+    with patch("app.services.anilist_client.http_pool") as mock_pool:
+        mock_client_instance = mock_pool.client
+
         mock_response = MagicMock()
         mock_response.status_code = 200
+        mock_response.headers = {}
         mock_response.json.return_value = {"data": "success"}
         mock_client_instance.post = AsyncMock(return_value=mock_response)
 
@@ -19,11 +47,10 @@ async def test_make_request_success():
         assert result == {"data": "success"}
 
 @pytest.mark.asyncio
-async def test_make_request_rate_limit_retry():
-    with patch("httpx.AsyncClient") as MockClient:
-        mock_client_instance = MockClient.return_value
-        mock_client_instance.__aenter__.return_value = mock_client_instance
-        
+async def test_make_request_rate_limit_retry(_fresh_rate_limiter):
+    with patch("app.services.anilist_client.http_pool") as mock_pool:
+        mock_client_instance = mock_pool.client
+
         # First response 429, second 200
         mock_response_429 = MagicMock()
         mock_response_429.status_code = 429
@@ -31,6 +58,7 @@ async def test_make_request_rate_limit_retry():
         
         mock_response_200 = MagicMock()
         mock_response_200.status_code = 200
+        mock_response_200.headers = {}
         mock_response_200.json.return_value = {"data": "success"}
         
         mock_client_instance.post = AsyncMock(side_effect=[mock_response_429, mock_response_200])
@@ -42,7 +70,109 @@ async def test_make_request_rate_limit_retry():
             result = await client._make_request("query")
             assert result == {"data": "success"}
             assert mock_client_instance.post.call_count == 2
-            mock_sleep.assert_called_with(1)
+            # The governor holds the retry back for the Retry-After window
+            assert _fresh_rate_limiter.rate_limited == 1
+            waited = mock_sleep.call_args[0][0]
+            assert 0.9 < waited <= 1.5
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_paces_to_remaining_budget():
+    limiter = TokenBucketLimiter(limit=60, headroom=1.0, burst=5, reserve=0)
+    await limiter.update_from_headers(
+        200, {"X-RateLimit-Limit": "60", "X-RateLimit-Remaining": "2"}
+    )
+    with patch("asyncio.sleep", new_callable=AsyncMock) as mock_sleep:
+        await limiter.acquire()
+        await limiter.acquire()
+        mock_sleep.assert_not_called()
+        # Third call exceeds what AniList says is left and must wait ~1 token
+        await limiter.acquire()
+        mock_sleep.assert_called_once()
+        assert 0.9 < mock_sleep.call_args[0][0] <= 1.0
+
+    state = limiter.snapshot()
+    assert state["limit"] == 60
+    assert state["remaining"] == 2
+    assert state["requests"] == 3
+    assert state["throttled"] == 1
+
+
+@pytest.mark.asyncio
+async def test_redis_rate_limiter_uses_shared_bucket():
+    redis_client = MagicMock()
+    acquire_script = AsyncMock(return_value=[b"0.5", b"-0.2", b"90"])
+    sync_script = AsyncMock(return_value=1)
+    redis_client.register_script.side_effect = [acquire_script, sync_script]
+
+    limiter = RedisTokenBucketLimiter(redis_client, "anilist_rate_limit:test")
+    with patch("asyncio.sleep", new_callable=AsyncMock) as mock_sleep:
+        await limiter.acquire()
+        mock_sleep.assert_called_once_with(0.5)
+
+    await limiter.update_from_headers(429, {"Retry-After": "3"})
+    args = sync_script.call_args.kwargs["args"]
+    assert args[-1] == "3.0"
+    assert limiter.snapshot()["shared_tokens"] == -0.2
+
+
+@pytest.mark.asyncio
+async def test_redis_rate_limiter_falls_back_when_redis_fails():
+    redis_client = MagicMock()
+    failing = AsyncMock(side_effect=ConnectionError("redis down"))
+    redis_client.register_script.side_effect = [failing, failing]
+
+    limiter = RedisTokenBucketLimiter(redis_client, "anilist_rate_limit:test")
+    await limiter.acquire()
+    assert not limiter.available
+    assert limiter.fallback.requests == 1
+
+    # While Redis is marked down the script is not retried
+    await limiter.acquire()
+    assert failing.call_count == 1
+    assert limiter.snapshot()["backend"] == "redis (fallback)"
+
+
+@pytest.mark.asyncio
+async def test_redis_rate_limiter_scripts_share_one_bucket():
+    # Runs the real Lua scripts (fakeredis needs lupa for EVALSHA)
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    server = fakeredis.FakeServer()
+    key = "anilist_rate_limit:test"
+    first, second = (
+        RedisTokenBucketLimiter(fakeredis.FakeAsyncRedis(server=server), key)
+        for _ in range(2)
+    )
+    waits = []
+
+    async def record_sleep(seconds):
+        waits.append(seconds)
+
+    with patch("asyncio.sleep", side_effect=record_sleep):
+        # The burst (capacity 5) is shared: the second worker pays for the first
+        for _ in range(5):
+            await first.acquire()
+        assert waits == []
+        await second.acquire()
+        assert len(waits) == 1
+        # One token at 90 * 0.9 / 60 tokens per second
+        assert waits[0] == pytest.approx(1 / 1.35, abs=0.05)
+        assert second.shared_tokens == pytest.approx(-1, abs=0.05)
+
+        # A 429 seen by one worker holds the other
+        await first.update_from_headers(429, {"Retry-After": "10"})
+        await second.acquire()
+        assert waits[-1] >= 10
+
+        # Headers lower the shared limit for everyone
+        await second.update_from_headers(
+            200, {"X-RateLimit-Limit": "30", "X-RateLimit-Remaining": "25"}
+        )
+    state = await fakeredis.FakeAsyncRedis(server=server).hgetall(key)
+    assert float(state[b"limit"]) == 30
+    assert first.available and second.available
+
 
 @pytest.mark.asyncio
 async def test_get_public_user_profile():
@@ -64,12 +194,14 @@ async def test_get_public_user_profile():
 @pytest.mark.asyncio
 async def test_get_media_details_batch_caching():
     # Test that cached items are returned and not fetched
-    with patch("app.core.cache.cache.get", new_callable=AsyncMock) as mock_cache_get:
-        # Mock cache hit for ID 1, miss for ID 2
-        async def cache_side_effect(key):
-            if "media_details_v3:1" in key:
-                return {"id": 1, "title": "Anime 1"}
-            return None
+    with patch("app.core.cache.cache.get_many_swr",
+               new_callable=AsyncMock) as mock_cache_get:
+        # Mock fresh cache hit for ID 1, miss for ID 2
+        async def cache_side_effect(keys):
+            return {
+                key: ({"id": 1, "title": "Anime 1"}, False)
+                for key in keys if key == "media_details_v3:1"
+            }
         mock_cache_get.side_effect = cache_side_effect
         
         with patch("app.services.anilist_client.AniListClient._make_request") as mock_request:
@@ -82,7 +214,9 @@ async def test_get_media_details_batch_caching():
                 }
             }
             
-            with patch("app.core.cache.cache.set", new_callable=AsyncMock) as mock_cache_set:
+            with patch(
+                "app.core.cache.cache.set_many", new_callable=AsyncMock
+            ) as mock_cache_set:
                 client = AniListClient()
                 results = await client.get_media_details_batch([1, 2])
                 
@@ -96,3 +230,367 @@ async def test_get_media_details_batch_caching():
                 assert call_args is not None
                 variables = call_args[0][1] # Second arg is variables
                 assert variables["ids"] == [2]
+
+                # One bulk lookup and one bulk write for the whole batch
+                mock_cache_get.assert_awaited_once()
+                mock_cache_set.assert_awaited_once()
+                assert list(mock_cache_set.call_args[0][0]) == ["media_details_v3:2"]
+
+
+@pytest.mark.asyncio
+async def test_get_media_details_batch_serves_stale_and_refreshes_in_background():
+    async def cache_side_effect(keys):
+        return {"media_details_v3:1": ({"id": 1, "title": "Old"}, True)}
+
+    with patch("app.core.cache.cache.get_many_swr",
+               new_callable=AsyncMock, side_effect=cache_side_effect), \
+            patch("app.core.cache.cache.set_many",
+                  new_callable=AsyncMock) as mock_cache_set, \
+            patch("app.services.anilist_client.AniListClient._make_request",
+                  new_callable=AsyncMock) as mock_request:
+        mock_request.return_value = {
+            "data": {"Page": {"pageInfo": {"hasNextPage": False},
+                              "media": [{"id": 1, "title": "New"}]}}
+        }
+        client = AniListClient()
+        results = await client.get_media_details_batch([1])
+
+        # The stale copy is returned without waiting for AniList
+        assert results == [{"id": 1, "title": "Old"}]
+        refresh = cache._refreshing["media_details_v3:1"]
+        await refresh
+
+        assert mock_request.call_args[0][1]["ids"] == [1]
+        assert list(mock_cache_set.call_args[0][0]) == ["media_details_v3:1"]
+        assert "media_details_v3:1" not in cache._refreshing
+
+
+@pytest.mark.asyncio
+async def test_clients_share_pooled_http_client():
+    from app.core.http import HTTPClientPool
+
+    pool = HTTPClientPool()
+    try:
+        first = pool.client
+        assert pool.client is first
+        assert not first.is_closed
+    finally:
+        await pool.close()
+    assert first.is_closed
+    # A closed pool reopens lazily on next use
+    reopened = pool.client
+    assert reopened is not first
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_get_user_anime_list_collection_chunks_and_caches_per_status():
+    chunk1 = {
+        "data": {
+            "MediaListCollection": {
+                "hasNextChunk": True,
+                "lists": [
+                    {"status": "COMPLETED", "isCustomList": False,
+                     "entries": [{"score": 80, "media": {"id": 1}}]},
+                    {"status": None, "isCustomList": True,
+                     "entries": [{"score": 80, "media": {"id": 1}}]},
+                ],
+            }
+        }
+    }
+    chunk2 = {
+        "data": {
+            "MediaListCollection": {
+                "hasNextChunk": False,
+                "lists": [
+                    {"status": "COMPLETED", "isCustomList": False,
+                     "entries": [{"score": 70, "media": {"id": 2}}]},
+                ],
+            }
+        }
+    }
+
+    async def cache_get_many(keys):
+        key = "user_list_v5:testuser:0:PLANNING:collection:full"
+        return {key: ([{"score": 0, "media": {"id": 9}}], False)} if key in keys else {}
+
+    with patch("app.core.cache.cache.get_many_swr",
+               new_callable=AsyncMock, side_effect=cache_get_many), \
+            patch("app.core.cache.cache.set_many",
+                  new_callable=AsyncMock) as mock_cache_set, \
+            patch("app.services.anilist_client.AniListClient._make_request",
+                  new_callable=AsyncMock, side_effect=[chunk1, chunk2]) as mock_request:
+        client = AniListClient()
+        lists = await client.get_user_anime_list_collection(
+            "testuser", ["COMPLETED", "PLANNING", "DROPPED"]
+        )
+
+    assert [e["media"]["id"] for e in lists["COMPLETED"]] == [1, 2]
+    assert lists["PLANNING"] == [{"score": 0, "media": {"id": 9}}]
+    assert lists["DROPPED"] == []
+
+    # Only statuses missing from the cache were requested, chunk by chunk
+    assert mock_request.call_count == 2
+    first_vars = mock_request.call_args_list[0][0][1]
+    assert first_vars["statuses"] == ["COMPLETED", "DROPPED"]
+    assert mock_request.call_args_list[1][0][1]["chunk"] == 2
+
+    # One write for the lists, one warming the media details of their entries
+    assert mock_cache_set.await_count == 2
+    list_write, media_write = mock_cache_set.call_args_list
+    assert set(list_write[0][0]) == {
+        "user_list_v5:testuser:0:COMPLETED:collection:full",
+        "user_list_v5:testuser:0:DROPPED:collection:full",
+    }
+    assert set(media_write[0][0]) == {"media_details_v3:1", "media_details_v3:2"}
+
+
+@pytest.mark.asyncio
+async def test_get_user_anime_list_ids_profile_is_lean():
+    page = {"data": {"Page": {"pageInfo": {"hasNextPage": False}, "mediaList": []}}}
+    with patch("app.core.cache.cache.get_many_swr",
+               new_callable=AsyncMock, return_value={}), \
+            patch("app.core.cache.cache.set_many",
+                  new_callable=AsyncMock) as mock_cache_set, \
+            patch("app.services.anilist_client.AniListClient._make_request",
+                  new_callable=AsyncMock, return_value=page) as mock_request:
+        client = AniListClient()
+        await client.get_user_anime_list("testuser", "PLANNING", profile="ids")
+
+        query = mock_request.call_args[0][0]
+        assert "relations" not in query
+        assert "coverImage" not in query
+        assert list(mock_cache_set.call_args[0][0]) == [
+            "user_list_v5:testuser:0:PLANNING:ids:1:50"
+        ]
+
+        with pytest.raises(ValueError):
+            await client.get_user_anime_list("testuser", "PLANNING", profile="nope")
+
+
+def test_media_cache_ttl_follows_airing_status():
+    with patch("app.services.anilist_client.time.time", return_value=1_000_000):
+        finished = media_cache_ttl({"status": "FINISHED", "relations": {"edges": [
+            {"relationType": "PREQUEL", "node": {"status": "FINISHED"}},
+        ]}})
+        pending_sequel = media_cache_ttl({"status": "FINISHED", "relations": {"edges": [
+            {"relationType": "SEQUEL", "node": {"status": "NOT_YET_RELEASED"}},
+        ]}})
+        airing = media_cache_ttl({
+            "status": "RELEASING",
+            "nextAiringEpisode": {"episode": 5, "airingAt": 1_000_000 + 3600},
+        })
+        just_aired = media_cache_ttl({
+            "status": "RELEASING",
+            "nextAiringEpisode": {"episode": 5, "airingAt": 1_000_000 - 10},
+        })
+
+    assert finished[0] == 30 * 86400
+    assert pending_sequel[0] == 86400
+    assert airing[0] == 3600
+    assert just_aired[0] == 300
+    for soft_ttl, hard_ttl in (finished, pending_sequel, airing, just_aired):
+        assert hard_ttl > soft_ttl
+
+
+@pytest.mark.asyncio
+async def test_get_media_details_returns_none_for_unknown_ids():
+    with patch("app.core.cache.cache.get_many_swr",
+               new_callable=AsyncMock, return_value={}), \
+            patch("app.core.cache.cache.set_many",
+                  new_callable=AsyncMock) as mock_cache_set, \
+            patch("app.services.anilist_client.media_loader.load",
+                  new_callable=AsyncMock, return_value=None):
+        assert await AniListClient().get_media_details(404) is None
+
+    # Nothing is cached, so the TTL policy never sees the missing media
+    mock_cache_set.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_invalidate_user_lists_bumps_generation():
+    page = {"data": {"Page": {"pageInfo": {"hasNextPage": False}, "mediaList": []}}}
+    with patch("app.core.cache.cache.incr",
+               new_callable=AsyncMock, return_value=1) as mock_incr, \
+            patch("app.core.cache.cache.delete_pattern",
+                  new_callable=AsyncMock) as mock_delete, \
+            patch("app.core.cache.cache.get_many_swr",
+                  new_callable=AsyncMock, return_value={}), \
+            patch("app.core.cache.cache.set_many",
+                  new_callable=AsyncMock) as mock_cache_set, \
+            patch("app.services.anilist_client.AniListClient._make_request",
+                  new_callable=AsyncMock, return_value=page):
+        client = AniListClient()
+        await client.get_user_anime_list("testuser", "COMPLETED")
+        await client.invalidate_user_lists("testuser")
+        await client.get_user_anime_list("testuser", "COMPLETED")
+
+    # One atomic increment, no keyspace scan
+    mock_incr.assert_awaited_once()
+    assert mock_incr.call_args[0][0] == "user_list_gen:testuser"
+    mock_delete.assert_not_awaited()
+    written = [list(call.args[0])[0] for call in mock_cache_set.call_args_list]
+    assert written == [
+        "user_list_v5:testuser:0:COMPLETED:full:1:50",
+        "user_list_v5:testuser:1:COMPLETED:full:1:50",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_list_load_after_invalidation_does_not_join_older_request():
+    import asyncio
+
+    sent = []
+
+    async def slow_send(self, query, variables=None):
+        sent.append(variables)
+        await asyncio.sleep(0.05)
+        entries = [{"media": {"id": len(sent)}}]
+        return {"data": {"Page": {"pageInfo": {"hasNextPage": False},
+                                  "mediaList": entries}}}
+
+    with patch("app.core.cache.cache.incr", new_callable=AsyncMock, return_value=1), \
+            patch("app.core.cache.cache.get_many_swr",
+                  new_callable=AsyncMock, return_value={}), \
+            patch("app.core.cache.cache.set_many",
+                  new_callable=AsyncMock) as mock_cache_set, \
+            patch("app.services.anilist_client.AniListClient._send_request",
+                  autospec=True, side_effect=slow_send):
+        client = AniListClient()
+        before = asyncio.create_task(
+            client.get_user_anime_list("testuser", "COMPLETED", profile="ids")
+        )
+        await asyncio.sleep(0.01)
+        await client.invalidate_user_lists("testuser")
+        after = await client.get_user_anime_list("testuser", "COMPLETED", profile="ids")
+        await before
+
+    assert len(sent) == 2
+    assert after["data"]["Page"]["mediaList"] == [{"media": {"id": 2}}]
+    written = {
+        key: value
+        for call in mock_cache_set.call_args_list
+        for key, value in call.args[0].items()
+    }
+    assert written["user_list_v5:testuser:1:COMPLETED:ids:1:50"] == after
+
+
+@pytest.mark.asyncio
+async def test_identical_concurrent_requests_are_coalesced():
+    import asyncio
+
+    async def slow_send(self, query, variables=None):
+        await asyncio.sleep(0.01)
+        return {"data": {"User": {"name": variables.get("username")}}}
+
+    with patch("app.services.anilist_client.AniListClient._send_request",
+               autospec=True, side_effect=slow_send) as mock_send:
+        results = await asyncio.gather(
+            AniListClient().get_public_user_profile("testuser"),
+            AniListClient().get_public_user_profile("testuser"),
+            AniListClient().get_public_user_profile("other"),
+        )
+        assert [r["name"] for r in results] == ["testuser", "testuser", "other"]
+        assert mock_send.call_count == 2
+
+        # Mutations are never shared
+        await asyncio.gather(
+            AniListClient().add_to_list(1), AniListClient().add_to_list(1)
+        )
+        assert mock_send.call_count == 4
+
+
+@pytest.mark.asyncio
+async def test_media_batch_bisects_failures_and_shrinks_on_complexity():
+    from app.services.media_loader import AdaptiveBatchSize
+
+    requested = []
+
+    async def fake_request(self, query, variables=None):
+        ids = variables["ids"]
+        requested.append(list(ids))
+        if len(ids) > 8:
+            return {"errors": [{"message": "Max query complexity exceeded"}]}
+        if 13 in ids:
+            return {"errors": [{"message": "Internal error"}]}
+        return {"data": {"Page": {"media": [{"id": i} for i in ids]}}}
+
+    sizer = AdaptiveBatchSize(max_size=16)
+    with patch("app.services.anilist_client.media_batch_size", sizer), \
+            patch("app.core.cache.cache.set_many", new_callable=AsyncMock), \
+            patch("app.services.anilist_client.AniListClient._make_request",
+                  autospec=True, side_effect=fake_request):
+        found = await AniListClient()._fetch_media_pages(list(range(1, 17)))
+
+    # Only the id that fails on its own is dropped
+    assert sorted(found) == [i for i in range(1, 17) if i != 13]
+    assert [13] in requested
+    # The complexity error halved the batch size for later requests
+    assert sizer.shrinks == 1
+    assert requested[0] == list(range(1, 17))
+    assert max(len(ids) for ids in requested[1:]) <= 8
+
+
+@pytest.mark.asyncio
+async def test_list_pages_warm_media_details_cache():
+    media = {"id": 5, "title": {"romaji": "Show"}, "status": "FINISHED",
+             "relations": {"edges": []}}
+    page = {"data": {"Page": {"pageInfo": {"hasNextPage": False},
+                              "mediaList": [{"score": 90, "media": media}]}}}
+    with patch("app.core.cache.cache.get_many_swr",
+               new_callable=AsyncMock, return_value={}), \
+            patch("app.core.cache.cache.set_many",
+                  new_callable=AsyncMock) as mock_cache_set, \
+            patch("app.services.anilist_client.AniListClient._make_request",
+                  new_callable=AsyncMock, return_value=page):
+        client = AniListClient()
+        await client.get_user_anime_list("testuser", "COMPLETED")
+        warmed = [call for call in mock_cache_set.call_args_list
+                  if "media_details_v3:5" in call[0][0]]
+        assert len(warmed) == 1
+        details = warmed[0][0][0]["media_details_v3:5"]
+        assert details["title"] == {"romaji": "Show"}
+        assert set(details) == set(MEDIA_DETAIL_KEYS)
+        # Finished media is kept with the long TTL policy
+        assert warmed[0][1]["soft_ttl"]["media_details_v3:5"] == 30 * 86400
+
+        # The lean "ids" profile carries no details, so nothing is warmed
+        mock_cache_set.reset_mock()
+        await client.get_user_anime_list("testuser", "PLANNING", profile="ids")
+        assert all(
+            not any(key.startswith("media_details_v3:") for key in call[0][0])
+            for call in mock_cache_set.call_args_list
+        )
+
+
+@pytest.mark.asyncio
+async def test_deep_profile_falls_back_to_full_when_too_complex():
+    page = {"data": {"Page": {"pageInfo": {"hasNextPage": False}, "mediaList": []}}}
+    queries = []
+
+    async def fake_request(self, query, variables=None, scope=None):
+        queries.append(query)
+        if query.count("relations") > 1:
+            response = httpx.Response(
+                400,
+                json={"errors": [{"message": "Max query complexity exceeded"}]},
+                request=httpx.Request("POST", "https://graphql.anilist.co"),
+            )
+            raise httpx.HTTPStatusError(
+                "400", request=response.request, response=response
+            )
+        return page
+
+    with patch("app.services.anilist_client._deep_profile_retry_at", 0.0), \
+            patch("app.core.cache.cache.get_many_swr",
+                  new_callable=AsyncMock, return_value={}), \
+            patch("app.core.cache.cache.set_many", new_callable=AsyncMock), \
+            patch("app.services.anilist_client.AniListClient._make_request",
+                  autospec=True, side_effect=fake_request):
+        client = AniListClient()
+        found = await client.get_user_anime_list("testuser", "COMPLETED", profile="deep")
+        assert found == page
+        # The rejection is remembered: the next deep call goes straight to "full"
+        await client.get_user_anime_list("testuser", "CURRENT", profile="deep")
+
+    assert [q.count("relations") for q in queries] == [2, 1, 1]
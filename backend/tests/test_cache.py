@@ -0,0 +1,529 @@
+import asyncio
+import json
+import pickle
+import time
+
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.core.cache import CacheService, MemoryCache, _MISSING
+from app.core.cache_backends import FileBackend, RedisBackend, SQLiteBackend
+from app.core.codecs import CacheCodec, TAG_JSON, TAG_PICKLE
+
+
+@pytest.fixture
+def file_cache(tmp_path):
+    service = CacheService()
+    service.backend = FileBackend(tmp_path)
+    return service
+
+
+@pytest.fixture
+def sqlite_cache(tmp_path):
+    service = CacheService()
+    service.backend = SQLiteBackend(tmp_path / "cache.sqlite3")
+    return service
+
+
+def test_memory_cache_evicts_least_recently_used():
+    memory = MemoryCache(max_entries=2, max_bytes=1000, ttl=60)
+    memory.set("a", 1, ttl=60, size=10)
+    memory.set("b", 2, ttl=60, size=10)
+    assert memory.get("a") == 1  # "a" is now most recently used
+    memory.set("c", 3, ttl=60, size=10)
+
+    assert memory.get("b") is _MISSING
+    assert memory.get("a") == 1
+    assert memory.get("c") == 3
+    assert memory.evictions == 1
+
+
+def test_memory_cache_is_byte_bounded_and_expires():
+    memory = MemoryCache(max_entries=10, max_bytes=100, ttl=60)
+    memory.set("a", "x", ttl=60, size=60)
+    memory.set("b", "y", ttl=60, size=60)
+    assert memory.get("a") is _MISSING
+    assert memory.bytes == 60
+
+    # Oversized values are never kept in memory
+    memory.set("huge", "z", ttl=60, size=500)
+    assert memory.get("huge") is _MISSING
+
+    with patch("app.core.cache.time.time", return_value=10**12):
+        assert memory.get("b") is _MISSING
+    assert memory.bytes == 0
+
+
+@pytest.mark.asyncio
+async def test_cache_reads_through_memory_tier(file_cache):
+    await file_cache.set("media_details_v3:1", {"id": 1}, ttl=60)
+
+    l2_read = AssertionError("L2 should not be read")
+    with patch.object(file_cache.backend, "get_many", side_effect=l2_read):
+        assert await file_cache.get("media_details_v3:1") == {"id": 1}
+    assert file_cache.memory_cache.hits == 1
+
+    # A cold L1 falls back to the file tier and is refilled from it
+    file_cache.memory_cache.clear()
+    assert await file_cache.get("media_details_v3:1") == {"id": 1}
+    assert file_cache.hits == 1
+    assert file_cache.memory_cache.stats()["entries"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_invalidation_reaches_memory_tier(file_cache):
+    await file_cache.set("user_list_v4:alice:COMPLETED:full:1:50", {"p": 1}, ttl=60)
+    await file_cache.set("user_list_v4:bob:COMPLETED:full:1:50", {"p": 2}, ttl=60)
+    await file_cache.set("media_details_v3:1", {"id": 1}, ttl=60)
+
+    await file_cache.delete_pattern("user_list_v4:alice:*")
+    await file_cache.delete("media_details_v3:1")
+
+    assert await file_cache.get("user_list_v4:alice:COMPLETED:full:1:50") is None
+    assert await file_cache.get("media_details_v3:1") is None
+    assert await file_cache.get("user_list_v4:bob:COMPLETED:full:1:50") == {"p": 2}
+
+
+@pytest.mark.asyncio
+async def test_file_cache_get_many_set_many(file_cache):
+    await file_cache.set_many({"k:1": {"id": 1}, "k:2": {"id": 2}}, ttl=60)
+    file_cache.memory_cache.clear()
+
+    found = await file_cache.get_many(["k:1", "k:2", "k:3"])
+    assert found == {"k:1": {"id": 1}, "k:2": {"id": 2}}
+    assert file_cache.hits == 2
+    assert file_cache.misses == 1
+
+
+@pytest.mark.asyncio
+async def test_redis_cache_get_many_uses_one_round_trip(file_cache):
+    fakeredis = pytest.importorskip("fakeredis")
+    file_cache.backend = RedisBackend(fakeredis.FakeAsyncRedis())
+
+    await file_cache.set_many({"k:1": {"id": 1}, "k:2": {"id": 2}}, ttl=60)
+    assert 0 < await file_cache.backend.redis.ttl("k:1") <= 60
+    file_cache.memory_cache.clear()
+
+    with patch.object(
+        file_cache.backend.redis, "get", side_effect=AssertionError("use MGET")
+    ):
+        found = await file_cache.get_many(["k:1", "k:2", "k:3"])
+    assert found == {"k:1": {"id": 1}, "k:2": {"id": 2}}
+
+
+def test_codec_round_trips_and_compresses_large_values():
+    codec = CacheCodec(compress_threshold=256)
+    small = {"id": 1, "title": {"romaji": "Anime"}}
+    large = {
+        "media": [{"id": i, "title": {"romaji": "Same title"}} for i in range(200)]
+    }
+
+    encoded_small = codec.encode(small)
+    assert encoded_small[0] == TAG_JSON
+    assert codec.decode(encoded_small) == small
+
+    encoded_large = codec.encode(large)
+    assert encoded_large[0] not in (TAG_JSON, TAG_PICKLE)
+    assert len(encoded_large) < len(pickle.dumps(large)) // 4
+    assert codec.decode(encoded_large) == large
+
+
+@pytest.mark.asyncio
+async def test_memory_tier_counts_compressed_values_at_decoded_size(file_cache):
+    file_cache.codec = CacheCodec(compress_threshold=256)
+    value = {"media": [{"id": 1, "title": {"romaji": "Same title"}}] * 200}
+    decoded_size = len(json.dumps(value, separators=(",", ":")))
+
+    await file_cache.set("k:1", value, ttl=60)
+    assert file_cache.memory_cache.bytes == decoded_size
+
+    # Entries read back from the backend are sized the same way
+    file_cache.memory_cache.clear()
+    assert await file_cache.get("k:1") == value
+    assert file_cache.memory_cache.bytes == decoded_size
+    stored = file_cache.backend._get_file_path("k:1").stat().st_size
+    assert stored < decoded_size // 4
+
+
+def test_codec_reads_legacy_pickle_only_when_allowed():
+    legacy = pickle.dumps({"id": 1})
+    assert CacheCodec().decode(legacy) == {"id": 1}
+    with pytest.raises(ValueError):
+        CacheCodec(allow_pickle=False).decode(legacy)
+
+
+@pytest.mark.asyncio
+async def test_file_cache_reads_entries_written_before_codecs(file_cache):
+    path = file_cache.backend._get_file_path("media_details_v3:7")
+    with open(path, "wb") as f:
+        pickle.dump(({"id": 7}, time.time() + 60), f)
+
+    assert await file_cache.get("media_details_v3:7") == {"id": 7}
+
+    # New writes use the tagged codec format
+    await file_cache.set("media_details_v3:7", {"id": 7}, ttl=60)
+    assert path.read_bytes()[:1] != b"\x80"
+
+
+@pytest.mark.asyncio
+async def test_sqlite_cache_round_trip_and_prefix_delete(sqlite_cache):
+    await sqlite_cache.set_many(
+        {
+            "user_list_v4:alice:COMPLETED:full:1:50": {"p": 1},
+            "user_list_v4:alice:PLANNING:ids:1:50": {"p": 2},
+            "user_list_v4:alicia:COMPLETED:full:1:50": {"p": 3},
+        },
+        ttl=60,
+    )
+    await sqlite_cache.delete_pattern("user_list_v4:alice:*")
+    sqlite_cache.memory_cache.clear()
+
+    found = await sqlite_cache.get_many([
+        "user_list_v4:alice:COMPLETED:full:1:50",
+        "user_list_v4:alice:PLANNING:ids:1:50",
+        "user_list_v4:alicia:COMPLETED:full:1:50",
+    ])
+    assert found == {"user_list_v4:alicia:COMPLETED:full:1:50": {"p": 3}}
+
+
+@pytest.mark.asyncio
+async def test_sqlite_cache_hides_and_purges_expired_rows(sqlite_cache):
+    await sqlite_cache.set("old", {"v": 1}, ttl=-1)
+    await sqlite_cache.set("new", {"v": 2}, ttl=60)
+    sqlite_cache.memory_cache.clear()
+
+    assert await sqlite_cache.get("old") is None
+    assert (await sqlite_cache.sweep())["expired"] == 1
+    assert await sqlite_cache.get("new") == {"v": 2}
+
+
+@pytest.mark.asyncio
+async def test_sqlite_sweep_purges_expired_and_evicts_lru(sqlite_cache):
+    await sqlite_cache.set("expired", {"v": 0}, ttl=-1)
+    for i in range(4):
+        await sqlite_cache.set(f"k:{i}", {"v": i}, ttl=60)
+    sqlite_cache.memory_cache.clear()
+    # Touch k:0 so it is the most recently used entry
+    await sqlite_cache.get("k:0")
+
+    with patch("app.core.cache.settings.CACHE_MAX_ENTRIES", 2), \
+            patch("app.core.cache.settings.CACHE_MAX_BYTES", 0):
+        result = await sqlite_cache.sweep()
+
+    assert result["expired"] == 1
+    assert result["evicted"] == 2
+    sqlite_cache.memory_cache.clear()
+    remaining = await sqlite_cache.get_many([f"k:{i}" for i in range(4)])
+    assert "k:0" in remaining
+    assert len(remaining) == 2
+    assert sqlite_cache.stats()["reclaimed"]["evicted"] == 2
+
+
+@pytest.mark.asyncio
+async def test_sqlite_sweep_purges_the_whole_expired_backlog_first(sqlite_cache):
+    await sqlite_cache.set_many({f"old:{i}": {"v": i} for i in range(5)}, ttl=-1)
+    await sqlite_cache.set_many({f"k:{i}": {"v": i} for i in range(2)}, ttl=60)
+    sqlite_cache.memory_cache.clear()
+
+    with patch("app.core.cache.settings.CACHE_SWEEP_BATCH", 2), \
+            patch("app.core.cache.settings.CACHE_MAX_ENTRIES", 2), \
+            patch("app.core.cache.settings.CACHE_MAX_BYTES", 0):
+        result = await sqlite_cache.sweep()
+
+    assert result["expired"] == 5
+    # The live rows fit once the backlog is gone
+    assert result["evicted"] == 0
+    assert len(await sqlite_cache.get_many(["k:0", "k:1"])) == 2
+
+
+@pytest.mark.asyncio
+async def test_sqlite_reads_buffer_access_stats_until_the_sweep(sqlite_cache):
+    await sqlite_cache.set("k:1", {"v": 1}, ttl=60)
+    sqlite_cache.memory_cache.clear()
+    backend = sqlite_cache.backend
+
+    def hits(conn):
+        return conn.execute("SELECT hits FROM cache WHERE key = 'k:1'").fetchone()[0]
+
+    await sqlite_cache.get("k:1")
+    await sqlite_cache.get_shared("k:1")
+    assert await backend._run(hits) == 0
+
+    await sqlite_cache.sweep()
+    assert await backend._run(hits) == 2
+    indexes = await backend._run(
+        lambda conn: {row[1] for row in conn.execute("PRAGMA index_list(cache)")}
+    )
+    assert {"cache_last_access", "cache_hits"} <= indexes
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("policy", ["lru", "lfu"])
+async def test_sweep_never_evicts_pinned_keys(sqlite_cache, file_cache, policy):
+    for cache in (sqlite_cache, file_cache):
+        await cache.incr("user_list_gen:alice", ttl=60)
+        await cache.set("scan_job_active:alice:2", "job1", ttl=60)
+        await cache.set("scan_job:job1", {"status": "running"}, ttl=60)
+        for i in range(4):
+            await cache.set(f"k:{i}", {"v": i}, ttl=60)
+        cache.memory_cache.clear()
+
+        with patch("app.core.cache.settings.CACHE_MAX_ENTRIES", 2), \
+                patch("app.core.cache.settings.CACHE_MAX_BYTES", 0), \
+                patch("app.core.cache.settings.CACHE_EVICTION_POLICY", policy):
+            # The file backend enforces the cap once a full pass completes
+            await cache.sweep()
+            await cache.sweep()
+
+        assert await cache.get_counter("user_list_gen:alice") == 1
+        assert await cache.get_shared("scan_job_active:alice:2") == "job1"
+        assert await cache.get_shared("scan_job:job1") == {"status": "running"}
+        assert await cache.get_many([f"k:{i}" for i in range(4)]) == {}
+
+
+@pytest.mark.asyncio
+async def test_file_sweep_is_incremental(file_cache):
+    for i in range(3):
+        await file_cache.set(f"old:{i}", {"v": i}, ttl=-1)
+    await file_cache.set("live", {"v": 1}, ttl=60)
+
+    with patch("app.core.cache.settings.CACHE_SWEEP_BATCH", 2):
+        first = await file_cache.sweep()
+        second = await file_cache.sweep()
+        third = await file_cache.sweep()
+
+    assert first["expired"] + second["expired"] + third["expired"] == 3
+    assert first["expired"] <= 2
+    assert file_cache.backend._get_file_path("live").exists()
+
+
+@pytest.mark.asyncio
+async def test_swr_entries_go_stale_after_soft_ttl(file_cache):
+    await file_cache.set_many({"k:1": {"v": 1}}, ttl=60, soft_ttl=10)
+    await file_cache.set("legacy", {"v": 2}, ttl=60)
+
+    assert await file_cache.get("k:1") == {"v": 1}
+    assert await file_cache.get_many_swr(["k:1"]) == {"k:1": ({"v": 1}, False)}
+
+    file_cache.memory_cache.clear()
+    with patch("app.core.cache.time.time", return_value=time.time() + 30):
+        found = await file_cache.get_many_swr(["k:1", "legacy"])
+    # Past the soft TTL but within the hard TTL: served, flagged stale
+    assert found == {"k:1": ({"v": 1}, True), "legacy": ({"v": 2}, True)}
+
+
+@pytest.mark.asyncio
+async def test_get_or_refresh_serves_stale_and_refreshes_once(file_cache):
+    await file_cache.set_many({"k": "old"}, ttl=60, soft_ttl=-1)
+    loader = AsyncMock(return_value="new")
+
+    first = await file_cache.get_or_refresh("k", loader, soft_ttl=60, hard_ttl=120)
+    second = await file_cache.get_or_refresh("k", loader, soft_ttl=60, hard_ttl=120)
+    assert first == second == "old"
+
+    await asyncio.gather(*set(file_cache._refreshing.values()))
+    loader.assert_awaited_once()
+    assert await file_cache.get_many_swr(["k"]) == {"k": ("new", False)}
+
+    # A miss waits for the loader
+    found = await file_cache.get_or_refresh("other", loader, soft_ttl=60, hard_ttl=120)
+    assert found == "new"
+
+
+@pytest.mark.asyncio
+async def test_get_or_refresh_does_not_cache_missing_values(file_cache):
+    loader = AsyncMock(return_value=None)
+
+    def policy(value):
+        return value["ttl"], value["ttl"]
+
+    assert await file_cache.get_or_refresh("gone", loader, ttl_policy=policy) is None
+    assert await file_cache.get_or_refresh("gone", loader, ttl_policy=policy) is None
+    assert loader.await_count == 2
+    assert await file_cache.get("gone") is None
+
+
+@pytest.mark.asyncio
+async def test_set_many_with_policy_groups_writes_by_hard_ttl(file_cache):
+    def policy(value):
+        return (10, 100) if value["long"] else (1, 50)
+
+    backend = file_cache.backend
+    with patch.object(backend, "set_many", wraps=backend.set_many) as backend_set:
+        await file_cache.set_many_with_policy(
+            {"a": {"long": True}, "b": {"long": True}, "c": {"long": False}}, policy
+        )
+
+    assert sorted(call.args[1] for call in backend_set.call_args_list) == [50, 100]
+    with patch("app.core.cache.time.time", return_value=time.time() + 5):
+        found = await file_cache.get_many_swr(["a", "c"])
+    assert found["a"][1] is False
+    assert found["c"][1] is True
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", ["file", "sqlite", "redis"])
+async def test_counters_increment_atomically_and_bypass_memory(
+    backend, file_cache, sqlite_cache
+):
+    service = {"file": file_cache, "sqlite": sqlite_cache}.get(backend, file_cache)
+    if backend == "redis":
+        fakeredis = pytest.importorskip("fakeredis")
+        service.backend = RedisBackend(fakeredis.FakeAsyncRedis())
+
+    assert await service.get_counter("gen:alice") == 0
+    results = await asyncio.gather(
+        *(service.incr("gen:alice", ttl=60) for _ in range(5))
+    )
+    assert sorted(results) == [1, 2, 3, 4, 5]
+    assert await service.get_counter("gen:alice") == 5
+    assert service.memory_cache.stats()["entries"] == 0
+
+
+def _redis_workers(count):
+    """CacheServices standing in for separate workers sharing one Redis"""
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    workers = []
+    for _ in range(count):
+        service = CacheService()
+        service.backend = RedisBackend(fakeredis.FakeAsyncRedis(server=server))
+        workers.append(service)
+    return workers
+
+
+@pytest.mark.asyncio
+async def test_fill_lease_lets_one_worker_fetch():
+    first, second = _redis_workers(2)
+    calls = []
+
+    def fetcher(service):
+        async def fetch(keys):
+            calls.append(list(keys))
+            await asyncio.sleep(0.05)
+            await service.set_many({key: {"key": key} for key in keys}, ttl=60)
+            return {key: {"key": key} for key in keys}
+        return fetch
+
+    a, b = await asyncio.gather(
+        first.fill_many(["m:1", "m:2"], fetcher(first)),
+        second.fill_many(["m:2", "m:3"], fetcher(second)),
+    )
+
+    # m:2 was fetched by exactly one worker; the other waited for it
+    assert sorted(key for keys in calls for key in keys) == ["m:1", "m:2", "m:3"]
+    assert a == {"m:1": {"key": "m:1"}, "m:2": {"key": "m:2"}}
+    assert b == {"m:2": {"key": "m:2"}, "m:3": {"key": "m:3"}}
+    assert first.leases_lost + second.leases_lost == 1
+    # Leases are released after the fill
+    assert await first.backend.redis.keys("lease:*") == []
+
+
+@pytest.mark.asyncio
+async def test_fill_falls_back_to_fetching_when_lease_holder_is_slow():
+    first, second = _redis_workers(2)
+    await first.backend.acquire_leases(["m:1"], "someone-else", 60000)
+    fetch = AsyncMock(return_value={"m:1": {"id": 1}})
+
+    with patch("app.core.cache.settings.CACHE_FILL_WAIT", 0.05):
+        assert await second.fill_many(["m:1"], fetch) == {"m:1": {"id": 1}}
+    fetch.assert_awaited_once_with(["m:1"])
+    assert second.fill_timeouts == 1
+
+
+@pytest.mark.asyncio
+async def test_slow_fill_keeps_its_lease_and_is_waited_for():
+    first, second, third = _redis_workers(3)
+    calls = []
+
+    async def slow_fetch(keys):
+        calls.append(list(keys))
+        # Several lease TTLs, and longer than the waiters' old fixed timeout
+        await asyncio.sleep(0.4)
+        await first.set_many({key: {"key": key} for key in keys}, ttl=60)
+        return {key: {"key": key} for key in keys}
+
+    fetch = AsyncMock(return_value={"m:1": {"key": "late"}})
+
+    async def join_later(service):
+        await asyncio.sleep(0.2)
+        return await service.fill_many(["m:1"], fetch)
+
+    with patch("app.core.cache.settings.CACHE_FILL_LEASE_MS", 90), \
+            patch("app.core.cache.settings.CACHE_FILL_WAIT", 5.0):
+        results = await asyncio.gather(
+            first.fill_many(["m:1"], slow_fetch),
+            second.fill_many(["m:1"], fetch),
+            join_later(third),
+        )
+
+    # The renewed lease kept the later worker from taking the fill over
+    assert calls == [["m:1"]]
+    fetch.assert_not_awaited()
+    assert results == [{"m:1": {"key": "m:1"}}] * 3
+    assert second.fill_timeouts == third.fill_timeouts == 0
+    assert await first.backend.redis.keys("lease:*") == []
+
+
+@pytest.mark.asyncio
+async def test_waiters_stop_when_the_lease_lapses():
+    first, second = _redis_workers(2)
+    # A worker that died mid-fill: its lease is never renewed or released
+    await first.backend.acquire_leases(["m:1"], "dead-worker", 100)
+    fetch = AsyncMock(return_value={"m:1": {"id": 1}})
+
+    started = time.monotonic()
+    with patch("app.core.cache.settings.CACHE_FILL_WAIT", 5.0):
+        assert await second.fill_many(["m:1"], fetch) == {"m:1": {"id": 1}}
+    assert time.monotonic() - started < 1
+    fetch.assert_awaited_once_with(["m:1"])
+
+
+@pytest.mark.asyncio
+async def test_fill_without_redis_is_a_plain_miss(file_cache):
+    fetch = AsyncMock(return_value={"m:1": {"id": 1}})
+    assert await file_cache.fill_many(["m:1"], fetch) == {"m:1": {"id": 1}}
+    fetch.assert_awaited_once_with(["m:1"])
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", ["file", "sqlite", "redis"])
+async def test_add_only_stores_missing_keys(backend, file_cache, sqlite_cache):
+    service = {"file": file_cache, "sqlite": sqlite_cache}.get(backend, file_cache)
+    if backend == "redis":
+        fakeredis = pytest.importorskip("fakeredis")
+        service.backend = RedisBackend(fakeredis.FakeAsyncRedis())
+
+    results = await asyncio.gather(
+        *(service.add("job:alice", {"id": i}, ttl=60) for i in range(5))
+    )
+    assert results.count(True) == 1
+    winner = results.index(True)
+    assert await service.get_shared("job:alice") == {"id": winner}
+    assert service.memory_cache.stats()["entries"] == 0
+
+    await service.delete("job:alice")
+    assert await service.add("job:alice", {"id": 9}, ttl=60) is True
+
+
+@pytest.mark.asyncio
+async def test_delete_swallows_backend_errors(file_cache):
+    await file_cache.set("job:alice", {"id": 1}, ttl=60)
+    with patch.object(
+        file_cache.backend, "delete", side_effect=ConnectionError("cache down")
+    ):
+        await file_cache.delete("job:alice")
+    # The memory copy is dropped even though the backend kept its own
+    assert file_cache.memory_cache.get("job:alice") is _MISSING
+
+
+@pytest.mark.asyncio
+async def test_get_shared_skips_stale_memory_copy():
+    first, second = _redis_workers(2)
+    await first.set("job:1", {"status": "running"}, ttl=60)
+    assert await second.get("job:1") == {"status": "running"}
+
+    await first.set("job:1", {"status": "done"}, ttl=60)
+    # The memory tier of the second worker still has the old copy
+    assert await second.get("job:1") == {"status": "running"}
+    assert await second.get_shared("job:1") == {"status": "done"}
@@ -0,0 +1,102 @@
+import os
+import time
+
+import pytest
+
+from app.services.graph_snapshot import GraphSnapshot, SnapshotStore, export_snapshot
+from app.services.media_graph import MediaGraphStore
+from media_factories import fresh, make_media, make_node
+
+
+def _target(media_id):
+    # Relation-only fields, a missing integer and airing info all round-trip
+    return make_node(
+        media_id,
+        status="RELEASING",
+        episodes=None,
+        seasonYear=2021,
+        averageScore=75,
+        nextAiringEpisode={"episode": 3, "airingAt": 1700000000},
+    )
+
+
+def _media(media_id, relations=()):
+    return make_media(
+        media_id,
+        english="Shared title",
+        relations=[(relation_type, _target(t)) for relation_type, t in relations],
+    )
+
+
+@pytest.fixture
+async def db_engine(graph_engine):
+    store = MediaGraphStore(graph_engine)
+    await store.upsert_media([
+        _media(10, relations=[("SEQUEL", 30), ("PREQUEL", 5)]),
+        _media(30, relations=[("SEQUEL", 40)]),
+    ])
+    return graph_engine
+
+
+@pytest.mark.asyncio
+async def test_export_round_trip(db_engine, tmp_path):
+    path = str(tmp_path / "graph.snapshot")
+    result = await export_snapshot(path, db_engine)
+
+    assert result["nodes"] == 4  # 5, 10, 30, 40
+    assert result["edges"] == 2  # SEQUEL edges only
+
+    snapshot = GraphSnapshot(path)
+    try:
+        assert list(snapshot.ids) == [5, 10, 30, 40]
+        assert snapshot.sequels(10) == [30]
+        assert snapshot.sequels(30) == [40]
+        assert snapshot.sequels(40) == []
+        assert snapshot.sequels(99) == []
+
+        # 40 is only a relation target: its own sequels are unknown
+        assert snapshot.media(40) is None
+        synced, media = snapshot.media(30)
+        assert abs(synced - time.time()) < 60
+        assert media["title"] == {"romaji": "Anime 30", "english": "Shared title"}
+        assert media["episodes"] == 12
+        assert media["relations"]["edges"] == [{
+            "relationType": "SEQUEL",
+            "node": {**_target(40), "title": {"romaji": "Anime 40", "english": None},
+                     "duration": None},
+        }]
+    finally:
+        snapshot.close()
+
+
+@pytest.mark.asyncio
+async def test_store_serves_fresh_media_and_reloads(db_engine, tmp_path):
+    path = str(tmp_path / "graph.snapshot")
+    store = SnapshotStore(path, check_interval=0)
+
+    assert store.get_media([10], fresh) == {}
+
+    await export_snapshot(path, db_engine)
+    found = store.get_media([10, 30, 40, 99], fresh)
+    assert sorted(found) == [10, 30]
+    assert [e["node"]["id"] for e in found[10]["relations"]["edges"]] == [30]
+    assert store.get_media([10], lambda media: (-1, 0)) == {}
+
+    stats = store.stats()
+    assert stats["loads"] == 1
+    assert stats["hits"] == 2
+    assert stats["stale"] == 1
+
+    # A new export is picked up; the previous mapping is closed
+    os.utime(path, ns=(0, 0))
+    assert store.get_media([30], fresh)
+    assert store.stats()["loads"] == 2
+
+
+def test_unreadable_snapshot_is_ignored(tmp_path):
+    path = tmp_path / "graph.snapshot"
+    path.write_bytes(b"not a snapshot")
+    store = SnapshotStore(str(path), check_interval=0)
+
+    assert store.get_media([1], fresh) == {}
+    assert store.stats()["errors"] == 1
@@ -25,3 +25,17 @@ def test_health_endpoint():
     assert response.status_code == 200
     data = response.json()
     assert data == {"status": "healthy"}
+
+
+def test_metrics_endpoint():
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert "anilist_rate_limit" in response.json()
+
+
+def test_health_and_metrics_precede_spa_routes():
+    # With a frontend build, "/" and the "/{full_path:path}" catch-all are
+    # registered together; anything after them would get index.html
+    paths = [route.path for route in app.routes]
+    assert paths.index("/health") < paths.index("/")
+    assert paths.index("/metrics") < paths.index("/")
@@ -0,0 +1,137 @@
+import pytest
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.db.session import Base
+from app.models.user import User
+from app.services.media_graph import MediaGraphStore
+from media_factories import fresh, make_media, make_node
+
+
+@pytest.fixture
+def store(graph_engine):
+    return MediaGraphStore(graph_engine)
+
+
+@pytest.mark.asyncio
+async def test_upserted_media_reads_back_in_details_shape(store):
+    await store.upsert_media([make_media(1, relations=[("SEQUEL", make_node(2))])])
+
+    found = await store.get_media([1, 2, 3], fresh)
+
+    # 2 is only known as a relation target, so its own edges are unknown
+    assert list(found) == [1]
+    media = found[1]
+    assert media["title"] == {"romaji": "Anime 1", "english": None}
+    assert media["coverImage"] == {"extraLarge": "img1"}
+    assert media["relations"]["edges"] == [
+        {"relationType": "SEQUEL", "node": make_node(2)}
+    ]
+    assert store.stats()["hits"] == 1
+    assert store.stats()["misses"] == 2
+
+
+@pytest.mark.asyncio
+async def test_upsert_replaces_edges_and_keeps_relation_columns(store):
+    await store.upsert_media([make_media(1, relations=[("SEQUEL", make_node(2))])])
+    # Seeing 2 as full media must not wipe the fields only relation nodes carry
+    await store.upsert_media([
+        make_media(1, relations=[("PREQUEL", make_node(3))]),
+        make_media(2),
+    ])
+
+    found = await store.get_media([1, 2], fresh)
+
+    assert found[1]["relations"]["edges"] == [
+        {"relationType": "PREQUEL", "node": make_node(3)}
+    ]
+    assert found[2]["relations"]["edges"] == []
+
+    await store.upsert_media([make_media(4, relations=[("SEQUEL", make_node(2))])])
+    found = await store.get_media([4], fresh)
+    assert found[4]["relations"]["edges"][0]["node"]["seasonYear"] == 2020
+
+
+@pytest.mark.asyncio
+async def test_stale_media_is_left_out(store):
+    await store.upsert_media([make_media(1)])
+
+    found = await store.get_media([1], lambda media: (-1, 0))
+
+    assert found == {}
+    assert store.stats()["stale"] == 1
+
+
+@pytest.mark.asyncio
+async def test_malformed_media_is_skipped(store):
+    await store.upsert_media([{"id": 1, "title": "Anime 1"}, make_media(2)])
+
+    found = await store.get_media([1, 2], fresh)
+
+    assert list(found) == [2]
+    assert store.stats()["available"]
+
+
+@pytest.mark.asyncio
+async def test_missing_tables_disable_the_store(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'empty.db'}")
+    store = MediaGraphStore(engine)
+    try:
+        await store.upsert_media([make_media(1)])
+        assert await store.get_media([1], fresh) == {}
+        assert not store.available
+        assert store.stats()["errors"] == 1
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_start_creates_only_the_graph_tables(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'app.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[User.__table__])
+        await conn.execute(
+            text(
+                "INSERT INTO users (anilist_id, username, access_token, settings)"
+                " VALUES (1, 'alice', 'token', '{}')"
+            )
+        )
+    store = MediaGraphStore(engine)
+    try:
+        await store.start()
+        # Idempotent, and existing rows are kept
+        await store.start()
+        async with engine.connect() as conn:
+            tables = await conn.run_sync(
+                lambda sync_conn: inspect(sync_conn).get_table_names()
+            )
+            users = (await conn.execute(text("SELECT COUNT(*) FROM users"))).scalar()
+        assert {"media_nodes", "media_relations", "users"} <= set(tables)
+        assert users == 1
+
+        await store.upsert_media([make_media(1)])
+        assert list(await store.get_media([1], fresh)) == [1]
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_scheduled_upserts_run_in_the_background(store):
+    store.schedule_upsert([make_media(1)])
+    assert store.stats()["pending_writes"] == 1
+
+    await store.stop()
+
+    assert store.stats()["pending_writes"] == 0
+    assert list(await store.get_media([1], fresh)) == [1]
+
+
+@pytest.mark.asyncio
+async def test_scheduled_upserts_are_dropped_when_too_many_are_pending(store):
+    store.max_pending_writes = 1
+    store.schedule_upsert([make_media(1)])
+    store.schedule_upsert([make_media(2)])
+    await store.stop()
+
+    assert store.stats()["dropped"] == 1
+    assert list(await store.get_media([1, 2], fresh)) == [1]
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from app.services.media_loader import AdaptiveBatchSize, MediaLoader
+
+
+def _recording_batch_fn(calls, missing=()):
+    async def batch_fn(ids):
+        calls.append(list(ids))
+        await asyncio.sleep(0)
+        return {i: {"id": i} for i in ids if i not in missing}
+    return batch_fn
+
+
+@pytest.mark.asyncio
+async def test_concurrent_lookups_share_one_batch():
+    calls = []
+    loader = MediaLoader(_recording_batch_fn(calls, missing={3}), window=0.01)
+
+    single, many, other = await asyncio.gather(
+        loader.load(1),
+        loader.load_many([2, 3, 1]),
+        loader.load(4),
+    )
+
+    assert calls == [[1, 2, 3, 4]]
+    assert single == {"id": 1}
+    assert many == {2: {"id": 2}, 1: {"id": 1}}
+    assert other == {"id": 4}
+    assert loader.stats()["batches"] == 1
+
+
+@pytest.mark.asyncio
+async def test_full_batches_are_sent_without_waiting_for_the_window():
+    calls = []
+    loader = MediaLoader(_recording_batch_fn(calls), window=10, max_batch=50)
+
+    task = asyncio.create_task(loader.load_many(range(120)))
+    await asyncio.sleep(0.01)
+    # Two full pages went out at once; the remaining 20 wait for the window
+    assert [len(c) for c in calls] == [50, 50]
+    loader._dispatch()
+    found = await task
+    assert [len(c) for c in calls] == [50, 50, 20]
+    assert len(found) == 120
+
+
+@pytest.mark.asyncio
+async def test_batch_errors_reach_every_waiter():
+    async def failing(ids):
+        raise RuntimeError("AniList down")
+
+    loader = MediaLoader(failing, window=0.001)
+    results = await asyncio.gather(
+        loader.load(1), loader.load(2), return_exceptions=True
+    )
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_adaptive_batch_size_follows_cost_and_errors():
+    sizer = AdaptiveBatchSize(max_size=50, node_budget=200)
+    assert sizer.size == 50
+
+    # Media with 9 relation edges cost 10 nodes each: 20 fit the budget
+    sizer.record_success(
+        [{"id": i, "relations": {"edges": [{}] * 9}} for i in range(5)]
+    )
+    assert sizer.size == 20
+
+    sizer.record_too_costly()
+    assert sizer.limit == 25
+    sizer.record_too_costly()
+    assert sizer.size == 12
+    sizer.record_success([])
+    assert sizer.size == 14
@@ -0,0 +1,206 @@
+import asyncio
+
+import pytest
+from unittest.mock import patch
+
+from app.core.cache import CacheService
+from app.core.cache_backends import SQLiteBackend
+from app.services.scan_jobs import JobQueueFull, ScanJobManager, _active_key
+
+
+@pytest.fixture
+def job_cache(tmp_path):
+    service = CacheService()
+    service.backend = SQLiteBackend(tmp_path / "cache.sqlite3")
+    with patch("app.services.scan_jobs.cache", service):
+        yield service
+
+
+@pytest.fixture
+async def manager(job_cache):
+    manager = ScanJobManager(workers=1, queue_size=2, progress_interval=0)
+    yield manager
+    await manager.stop()
+
+
+def _fake_scan(release=None, error=None):
+    async def fake_iter_missing_sequels(username, **kwargs):
+        yield {"event": "user", "user": {"name": username}}
+        yield {
+            "event": "progress",
+            "stage": "list",
+            "status": "COMPLETED",
+            "page": 1,
+            "items": 1,
+        }
+        if release is not None:
+            await release.wait()
+        if error is not None:
+            raise error
+        yield {"event": "sequel", "sequel": {"missing_id": 2}}
+        yield {"event": "progress", "stage": "batch", "resolved": 1, "pending": 0}
+        yield {"event": "done", "count": 1}
+    return fake_iter_missing_sequels
+
+
+async def _wait_for(manager, job_id, status):
+    for _ in range(200):
+        job = await manager.get(job_id)
+        if job["status"] == status:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job {job_id} never reached {status}: {job}")
+
+
+@pytest.mark.asyncio
+async def test_same_scan_is_joined_until_it_finishes(manager):
+    release = asyncio.Event()
+    with patch("app.services.sequel_finder.iter_missing_sequels", _fake_scan(release)):
+        job, joined = await manager.submit("Alice", max_depth=2)
+        assert not joined
+        assert job["status"] == "queued"
+
+        running = await _wait_for(manager, job["id"], "running")
+        assert running["progress"]["list_pages"] == 1
+
+        again, joined = await manager.submit("alice", max_depth=2)
+        assert joined
+        assert again["id"] == job["id"]
+        # A different depth is a different scan
+        other, joined = await manager.submit("alice", max_depth=3)
+        assert not joined
+
+        release.set()
+        done = await _wait_for(manager, job["id"], "done")
+        await _wait_for(manager, other["id"], "done")
+
+    assert done["result"] == {
+        "user": {"name": "Alice"},
+        "missing_sequels": [{"missing_id": 2}],
+        "count": 1,
+    }
+    assert done["progress"] == {
+        "list_pages": 1, "resolved": 1, "pending": 0, "found": 1
+    }
+
+    # Once finished, the next request starts a fresh scan
+    with patch("app.services.sequel_finder.iter_missing_sequels", _fake_scan()):
+        fresh, joined = await manager.submit("alice", max_depth=2)
+    assert not joined
+    assert fresh["id"] != job["id"]
+    assert manager.stats()["joined"] == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_scan_records_the_error(manager):
+    error = ValueError("User 'ghost' not found on AniList")
+    with patch(
+        "app.services.sequel_finder.iter_missing_sequels", _fake_scan(error=error)
+    ):
+        job, _ = await manager.submit("ghost")
+        failed = await _wait_for(manager, job["id"], "failed")
+
+    assert failed["error"] == str(error)
+    assert failed["error_status"] == 404
+    assert manager.stats()["failed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_full_queue_rejects_new_scans(manager):
+    release = asyncio.Event()
+    with patch("app.services.sequel_finder.iter_missing_sequels", _fake_scan(release)):
+        first, _ = await manager.submit("user0")
+        await _wait_for(manager, first["id"], "running")
+        await manager.submit("user1")
+        await manager.submit("user2")
+
+        with pytest.raises(JobQueueFull):
+            await manager.submit("user3")
+        # The rejected scan did not keep its claim
+        release.set()
+        await _wait_for(manager, first["id"], "done")
+        job, joined = await manager.submit("user3")
+        assert not joined
+
+
+@pytest.mark.asyncio
+async def test_forced_refresh_does_not_join_a_cached_scan(manager):
+    release = asyncio.Event()
+    with patch("app.services.sequel_finder.iter_missing_sequels", _fake_scan(release)):
+        job, _ = await manager.submit("alice")
+        forced, joined = await manager.submit("alice", force_refresh=True)
+        assert not joined
+        assert forced["force_refresh"]
+        again, joined = await manager.submit("alice", force_refresh=True)
+        assert joined
+        assert again["id"] == forced["id"]
+
+        release.set()
+        await _wait_for(manager, job["id"], "done")
+        await _wait_for(manager, forced["id"], "done")
+
+
+@pytest.mark.asyncio
+async def test_progress_writes_extend_the_claim(manager, job_cache):
+    manager.job_timeout = 60
+    release = asyncio.Event()
+    with patch("app.services.sequel_finder.iter_missing_sequels", _fake_scan(release)):
+        job, _ = await manager.submit("alice")
+        await _wait_for(manager, job["id"], "running")
+        active_key = _active_key("alice", 2, False)
+        # Stand in for a claim that is about to lapse
+        await job_cache.set(active_key, job["id"], ttl=1)
+
+        await manager._save_progress(await manager.get(job["id"]))
+        await asyncio.sleep(1.1)
+        assert await job_cache.get_shared(active_key) == job["id"]
+
+        release.set()
+        await _wait_for(manager, job["id"], "done")
+    assert await job_cache.get_shared(active_key) is None
+
+
+@pytest.mark.asyncio
+async def test_quiet_scan_keeps_its_claim_alive(manager, job_cache):
+    manager.job_timeout = 1
+    release = asyncio.Event()
+    with patch("app.services.sequel_finder.iter_missing_sequels", _fake_scan(release)):
+        job, _ = await manager.submit("alice")
+        await _wait_for(manager, job["id"], "running")
+        # No events for longer than job_timeout, e.g. a rate-limited batch
+        await asyncio.sleep(1.5)
+
+        assert (await manager.get(job["id"]))["status"] == "running"
+        again, joined = await manager.submit("alice")
+        assert joined
+        assert again["id"] == job["id"]
+
+        release.set()
+        await _wait_for(manager, job["id"], "done")
+
+
+@pytest.mark.asyncio
+async def test_cache_errors_do_not_stop_the_workers(manager, job_cache):
+    async def broken(*args, **kwargs):
+        raise ConnectionError("cache down")
+
+    for target, name in ((job_cache.backend, "delete"), (manager, "_finish")):
+        release = asyncio.Event()
+        scan = _fake_scan(release)
+        with patch("app.services.sequel_finder.iter_missing_sequels", scan), \
+                patch.object(target, name, broken):
+            first, _ = await manager.submit("alice")
+            await _wait_for(manager, first["id"], "running")
+            queued, _ = await manager.submit("bob")
+            release.set()
+
+            # The job queued behind the failing one still runs
+            for _ in range(200):
+                if (await manager.get(queued["id"]))["status"] != "queued":
+                    break
+                await asyncio.sleep(0.01)
+            else:
+                raise AssertionError("the queued job never started")
+        await job_cache.delete(_active_key("alice", 2, False))
+        await job_cache.delete(_active_key("bob", 2, False))
+    assert manager.stats()["workers"] == 1
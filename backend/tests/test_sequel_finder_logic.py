@@ -1,6 +1,16 @@
+import asyncio
+
 import pytest
 from unittest.mock import AsyncMock, patch
-from app.services.sequel_finder import find_missing_sequels
+from app.services.sequel_finder import find_missing_sequels, iter_missing_sequels
+
+
+@pytest.fixture(autouse=True)
+def _no_media_graph():
+    # The graph stores are covered in test_media_graph.py and test_graph_snapshot.py
+    with patch("app.core.config.settings.MEDIA_GRAPH_ENABLED", False), \
+         patch("app.services.sequel_finder.graph_snapshot.path", ""):
+        yield
 
 
 @pytest.mark.asyncio
@@ -67,7 +77,7 @@ async def test_find_missing_sequels_logic():
         mock_instance = MockClient.return_value
 
         # Setup side_effect for get_user_anime_list
-        async def side_effect(user, status, page=1, per_page=50):
+        async def side_effect(user, status, page=1, per_page=50, profile="full"):
             if status == "COMPLETED":
                 return mock_completed_response
             elif status == "PLANNING":
@@ -130,7 +140,7 @@ async def test_find_missing_sequels_pagination():
     with patch("app.services.sequel_finder.AniListClient") as MockClient:
         mock_instance = MockClient.return_value
 
-        async def side_effect(user, status, page=1, per_page=50):
+        async def side_effect(user, status, page=1, per_page=50, profile="full"):
             if status == "COMPLETED":
                 if page == 1:
                     return mock_page1
@@ -162,6 +172,10 @@ async def test_find_missing_sequels_pagination():
         # Should call COMPLETED page 1, COMPLETED page 2, PLANNING page 1
         calls = mock_instance.get_user_anime_list.call_args_list
 
+        # Exclusion-only statuses use the lean id-only profile
+        planning_calls = [c for c in calls if c[0][1] == "PLANNING"]
+        assert planning_calls[0].kwargs.get("profile") == "ids"
+
         # Filter calls by status
         completed_calls = [c for c in calls if c[0][1] == "COMPLETED"]
         assert len(completed_calls) == 2
@@ -226,7 +240,7 @@ async def test_find_missing_sequels_deep_search():
         mock_instance = MockClient.return_value
 
         # Mock get_user_anime_list
-        async def list_side_effect(user, status, page=1, per_page=50):
+        async def list_side_effect(user, status, page=1, per_page=50, profile="full"):
             if status == "COMPLETED":
                 return mock_completed
             elif status == "PLANNING":
@@ -299,4 +313,367 @@ async def test_find_missing_sequels_api_error():
         mock_instance.get_user_anime_list = AsyncMock(side_effect=Exception("API Error"))
         
         with pytest.raises(Exception, match="API Error"):
-            await find_missing_sequels(username)
\ No newline at end of file
+            await find_missing_sequels(username)
+
+
+@pytest.mark.asyncio
+async def test_find_missing_sequels_collection_mode():
+    username = "testuser"
+
+    anime1 = {
+        "id": 1,
+        "title": {"romaji": "Anime 1"},
+        "relations": {
+            "edges": [
+                {
+                    "relationType": "SEQUEL",
+                    "node": {"id": 2, "title": {"romaji": "Anime 2"}, "format": "TV"},
+                },
+                {
+                    "relationType": "SEQUEL",
+                    "node": {"id": 3, "title": {"romaji": "Anime 3"}, "format": "TV"},
+                },
+            ]
+        },
+    }
+
+    with patch("app.services.sequel_finder.AniListClient") as MockClient:
+        mock_instance = MockClient.return_value
+        mock_instance.get_public_user_profile = AsyncMock(
+            return_value={"name": "testuser"}
+        )
+
+        async def collection_side_effect(user, statuses, per_chunk=500, profile="full"):
+            lists = {
+                "COMPLETED": [{"score": 90, "media": anime1}],
+                "PLANNING": [{"score": 0, "media": {"id": 3}}],
+            }
+            return {s: lists[s] for s in statuses if s in lists}
+
+        mock_instance.get_user_anime_list_collection = AsyncMock(
+            side_effect=collection_side_effect
+        )
+        mock_instance.get_user_anime_list = AsyncMock()
+
+        results = await find_missing_sequels(username, list_mode="collection")
+        missing_sequels = results["missing_sequels"]
+
+        assert [m["missing_id"] for m in missing_sequels] == [2]
+        assert missing_sequels[0]["base_score"] == 90
+        # One collection call with relations, one id-only call for exclusions
+        calls = mock_instance.get_user_anime_list_collection.call_args_list
+        assert len(calls) == 2
+        assert calls[1].kwargs["profile"] == "ids"
+        assert set(calls[1][0][1]) == {"PLANNING", "PAUSED", "DROPPED"}
+        mock_instance.get_user_anime_list.assert_not_called()
+        # The user's score is not written back into the (cached) media dict
+        assert "user_score" not in anime1
+
+
+@pytest.mark.asyncio
+async def test_find_missing_sequels_parallel_pages_use_total():
+    username = "testuser"
+
+    def page_of(ids, has_next, total=None):
+        info = {"hasNextPage": has_next}
+        if total is not None:
+            info["total"] = total
+        entries = []
+        for i in ids:
+            sequel = {"id": i * 10, "title": {"romaji": f"S{i}"}, "format": "TV"}
+            entries.append({"media": {
+                "id": i,
+                "title": {"romaji": f"A{i}"},
+                "relations": {"edges": [{"relationType": "SEQUEL", "node": sequel}]},
+            }})
+        return {"data": {"Page": {"pageInfo": info, "mediaList": entries}}}
+
+    # total promises 4 pages, but the list shrank and page 3 is already the end
+    completed_pages = {
+        1: page_of([1], True, total=200),
+        2: page_of([2], True),
+        3: page_of([3], False),
+        4: page_of([4], False),
+    }
+    empty = {"data": {"Page": {"pageInfo": {"hasNextPage": False}, "mediaList": []}}}
+
+    with patch("app.services.sequel_finder.AniListClient") as MockClient:
+        mock_instance = MockClient.return_value
+        mock_instance.get_public_user_profile = AsyncMock(
+            return_value={"name": "testuser"}
+        )
+
+        async def side_effect(user, status, page=1, per_page=50, profile="full"):
+            if status == "COMPLETED":
+                return completed_pages[page]
+            return empty
+
+        mock_instance.get_user_anime_list = AsyncMock(side_effect=side_effect)
+        mock_instance.get_media_details_batch = AsyncMock(return_value=[])
+
+        results = await find_missing_sequels(username, max_depth=1)
+
+        completed_calls = [
+            c.kwargs["page"] for c in mock_instance.get_user_anime_list.call_args_list
+            if c[0][1] == "COMPLETED"
+        ]
+        # Every page up to pageInfo.total was requested, with no extra walk
+        assert sorted(completed_calls) == [1, 2, 3, 4]
+        # Pages are reassembled in order and nothing past the real end is used
+        assert [m["missing_id"] for m in results["missing_sequels"]] == [10, 20, 30]
+
+
+@pytest.mark.asyncio
+async def test_find_missing_sequels_deep_prefetch_skips_batch_lookups():
+    # A -> B -> C where B arrives from the deep list profile with its own relations
+    anime_a = {
+        "id": 1,
+        "title": {"romaji": "Anime A"},
+        "relations": {"edges": [{
+            "relationType": "SEQUEL",
+            "node": {
+                "id": 2, "title": {"romaji": "Anime B"}, "format": "TV",
+                "relations": {"edges": [{
+                    "relationType": "SEQUEL",
+                    "node": {"id": 3, "title": {"romaji": "Anime C"}, "format": "TV"},
+                }]},
+            },
+        }]},
+    }
+    profiles = {}
+
+    with patch("app.services.sequel_finder.AniListClient") as MockClient:
+        mock_instance = MockClient.return_value
+
+        async def list_side_effect(user, status, page=1, per_page=50, profile="full"):
+            profiles[status] = profile
+            media_list = [{"media": anime_a}] if status == "COMPLETED" else []
+            page_info = {"hasNextPage": False}
+            return {"data": {"Page": {"pageInfo": page_info, "mediaList": media_list}}}
+
+        mock_instance.get_user_anime_list = AsyncMock(side_effect=list_side_effect)
+        mock_instance.get_public_user_profile = AsyncMock(
+            return_value={"name": "testuser"}
+        )
+        mock_instance.get_media_details_batch = AsyncMock(return_value=[])
+
+        results = await find_missing_sequels("testuser", deep_prefetch=True)
+
+    assert profiles["COMPLETED"] == "deep"
+    assert profiles["PLANNING"] == "ids"
+    found = {r["missing_id"]: r for r in results["missing_sequels"]}
+    assert found[2]["depth"] == 1
+    assert found[3]["depth"] == 2
+    assert found[3]["base_id"] == 2
+    # Depth 2 came from the list itself; C (depth 2 = max) needs no lookup either
+    mock_instance.get_media_details_batch.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_find_missing_sequels_pipelines_deep_search_batches():
+    # 120 completed anime, each with a missing sequel (1000+i) that has its
+    # own sequel (2000+i): three depth-2 batches, then the depth-3 lookups
+    def anime(media_id, sequel_id):
+        return {
+            "id": media_id,
+            "title": {"romaji": f"Anime {media_id}"},
+            "relations": {"edges": [{
+                "relationType": "SEQUEL",
+                "node": {
+                    "id": sequel_id,
+                    "title": {"romaji": f"Anime {sequel_id}"},
+                    "format": "TV",
+                },
+            }]},
+        }
+
+    completed = [{"media": anime(i, 1000 + i)} for i in range(120)]
+    third_depth_requested = asyncio.Event()
+    in_flight = 0
+    peak = 0
+
+    with patch("app.services.sequel_finder.AniListClient") as MockClient:
+        mock_instance = MockClient.return_value
+
+        async def list_side_effect(user, status, page=1, per_page=50, profile="full"):
+            media_list = completed if status == "COMPLETED" else []
+            page_info = {"hasNextPage": False}
+            return {"data": {"Page": {"pageInfo": page_info, "mediaList": media_list}}}
+
+        async def batch_details_side_effect(media_ids):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            try:
+                if any(mid >= 2000 for mid in media_ids):
+                    third_depth_requested.set()
+                    return [anime(mid, 3000 + mid) for mid in media_ids]
+                if 1000 in media_ids:
+                    # The first batch is slow: the sequels found by its
+                    # siblings must not wait for it
+                    await third_depth_requested.wait()
+                return [anime(mid, mid + 1000) for mid in media_ids]
+            finally:
+                in_flight -= 1
+
+        mock_instance.get_user_anime_list = AsyncMock(side_effect=list_side_effect)
+        mock_instance.get_public_user_profile = AsyncMock(
+            return_value={"name": "testuser"}
+        )
+        mock_instance.get_media_details_batch = AsyncMock(
+            side_effect=batch_details_side_effect
+        )
+
+        results = await asyncio.wait_for(
+            find_missing_sequels("testuser", max_depth=3), 5
+        )
+
+    depths = {}
+    for r in results["missing_sequels"]:
+        depths[r["depth"]] = depths.get(r["depth"], 0) + 1
+    assert depths == {1: 120, 2: 120, 3: 120}
+    assert peak >= 2
+
+
+@pytest.mark.asyncio
+async def test_stopped_scan_cancels_and_awaits_its_lookups():
+    def anime(media_id, sequel_id):
+        return {
+            "id": media_id,
+            "title": {"romaji": f"Anime {media_id}"},
+            "relations": {"edges": [{
+                "relationType": "SEQUEL",
+                "node": {"id": sequel_id, "format": "TV"},
+            }]},
+        }
+
+    completed = [{"media": anime(i, 1000 + i)} for i in range(120)]
+    started = []
+    cancelled = []
+    lookups_started = asyncio.Event()
+
+    with patch("app.services.sequel_finder.AniListClient") as MockClient:
+        mock_instance = MockClient.return_value
+
+        async def list_side_effect(user, status, page=1, per_page=50, profile="full"):
+            media_list = completed if status == "COMPLETED" else []
+            page_info = {"hasNextPage": False}
+            return {"data": {"Page": {"pageInfo": page_info, "mediaList": media_list}}}
+
+        async def batch_details_side_effect(media_ids):
+            started.append(media_ids)
+            lookups_started.set()
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                # Cleanup that takes a moment, like closing a connection
+                await asyncio.sleep(0.01)
+                cancelled.append(media_ids)
+                raise
+
+        mock_instance.get_user_anime_list = AsyncMock(side_effect=list_side_effect)
+        mock_instance.get_public_user_profile = AsyncMock(
+            return_value={"name": "testuser"}
+        )
+        mock_instance.get_media_details_batch = AsyncMock(
+            side_effect=batch_details_side_effect
+        )
+
+        async def consume():
+            async for _event in iter_missing_sequels("testuser", max_depth=2):
+                pass
+
+        consumer = asyncio.ensure_future(consume())
+        await asyncio.wait_for(lookups_started.wait(), 5)
+        consumer.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await consumer
+
+    # Every lookup had finished cancelling before the scan itself stopped
+    assert started
+    assert len(cancelled) == len(started)
+
+
+@pytest.mark.asyncio
+async def test_stopped_scan_cancels_and_awaits_its_list_fetches():
+    fetching = asyncio.Event()
+    cancelled = []
+
+    with patch("app.services.sequel_finder.AniListClient") as MockClient:
+        mock_instance = MockClient.return_value
+
+        async def list_side_effect(user, status, page=1, per_page=50, profile="full"):
+            fetching.set()
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                await asyncio.sleep(0.01)
+                cancelled.append(status)
+                raise
+
+        mock_instance.get_user_anime_list = AsyncMock(side_effect=list_side_effect)
+        mock_instance.get_public_user_profile = AsyncMock(
+            return_value={"name": "testuser"}
+        )
+
+        async def consume():
+            async for _event in iter_missing_sequels("testuser", max_depth=2):
+                pass
+
+        consumer = asyncio.ensure_future(consume())
+        await asyncio.wait_for(fetching.wait(), 5)
+        consumer.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await consumer
+
+        # The list fetches and the pending progress read are gone, not leaked
+        assert cancelled
+        leftover = [
+            task for task in asyncio.all_tasks()
+            if task is not asyncio.current_task() and not task.done()
+        ]
+        assert leftover == []
+
+
+@pytest.mark.asyncio
+async def test_iter_missing_sequels_streams_events():
+    anime_a = {
+        "id": 1,
+        "title": {"romaji": "Anime A"},
+        "relations": {"edges": [{
+            "relationType": "SEQUEL",
+            "node": {"id": 2, "title": {"romaji": "Anime B"}, "format": "TV"},
+        }]},
+    }
+
+    with patch("app.services.sequel_finder.AniListClient") as MockClient:
+        mock_instance = MockClient.return_value
+
+        async def list_side_effect(user, status, page=1, per_page=50, profile="full"):
+            media_list = [{"media": anime_a}] if status == "COMPLETED" else []
+            page_info = {"hasNextPage": False}
+            return {"data": {"Page": {"pageInfo": page_info, "mediaList": media_list}}}
+
+        mock_instance.get_user_anime_list = AsyncMock(side_effect=list_side_effect)
+        mock_instance.get_public_user_profile = AsyncMock(
+            return_value={"name": "testuser"}
+        )
+        mock_instance.get_media_details_batch = AsyncMock(return_value=[])
+
+        events = [event async for event in iter_missing_sequels("testuser")]
+
+    kinds = [event["event"] for event in events]
+    assert kinds[0] == "user"
+    assert kinds[-1] == "done"
+    pages = [e for e in events if e["event"] == "progress" and e["stage"] == "list"]
+    assert {e["status"] for e in pages} == {
+        "COMPLETED", "PLANNING", "CURRENT", "PAUSED", "DROPPED", "REPEATING"
+    }
+    # The depth-1 sequel is reported before the deep search resolves it
+    assert kinds.index("sequel") < kinds.index("progress", len(pages) + 1)
+    assert events[kinds.index("sequel")]["sequel"]["missing_id"] == 2
+    batches = [e for e in events if e["event"] == "progress" and e["stage"] == "batch"]
+    assert batches[-1] == {
+        "event": "progress", "stage": "batch", "resolved": 1, "pending": 0
+    }
+    assert events[-1]["count"] == 1
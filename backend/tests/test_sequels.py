@@ -1,5 +1,7 @@
 """Tests for sequels endpoint using monkeypatch to avoid external HTTP calls."""
 
+import json
+
 import pytest
 from fastapi.testclient import TestClient
 
@@ -65,3 +67,101 @@ def test_find_sequels_server_error(monkeypatch):
     resp = client.get("/api/v1/sequels/find?username=testuser")
     assert resp.status_code == 500
     assert "Unexpected error" in resp.json()["detail"]
+
+
+def _fake_iter(events, error=None):
+    async def fake_iter_missing_sequels(username: str, **kwargs):
+        for event in events:
+            yield event
+        if error is not None:
+            raise error
+    return fake_iter_missing_sequels
+
+
+STREAM_EVENTS = [
+    {"event": "user", "user": {"name": "testuser"}},
+    {
+        "event": "progress",
+        "stage": "list",
+        "status": "COMPLETED",
+        "page": 1,
+        "items": 1,
+    },
+    {"event": "sequel", "sequel": {"missing_id": 2, "missing_title": "Missing Sequel"}},
+    {"event": "done", "count": 1},
+]
+
+
+def test_find_sequels_stream_ndjson(monkeypatch):
+    monkeypatch.setattr(
+        "app.services.sequel_finder.iter_missing_sequels", _fake_iter(STREAM_EVENTS)
+    )
+
+    resp = client.get("/api/v1/sequels/find/stream?username=testuser&format=ndjson")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert lines == STREAM_EVENTS
+
+
+def test_find_sequels_stream_sse(monkeypatch):
+    monkeypatch.setattr(
+        "app.services.sequel_finder.iter_missing_sequels", _fake_iter(STREAM_EVENTS)
+    )
+
+    resp = client.get("/api/v1/sequels/find/stream?username=testuser")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    messages = resp.text.strip().split("\n\n")
+    assert len(messages) == 4
+    assert messages[2].splitlines()[0] == "event: sequel"
+    assert json.loads(messages[2].splitlines()[1][len("data: "):]) == STREAM_EVENTS[2]
+
+
+def test_find_sequels_stream_user_not_found(monkeypatch):
+    monkeypatch.setattr(
+        "app.services.sequel_finder.iter_missing_sequels",
+        _fake_iter([], ValueError("User 'nonexistent' not found on AniList")),
+    )
+
+    resp = client.get("/api/v1/sequels/find/stream?username=nonexistent")
+    assert resp.status_code == 404
+    assert "User 'nonexistent' not found" in resp.json()["detail"]
+
+
+def test_find_sequels_stream_error_after_start(monkeypatch):
+    monkeypatch.setattr(
+        "app.services.sequel_finder.iter_missing_sequels",
+        _fake_iter(STREAM_EVENTS[:2], Exception("Unexpected error")),
+    )
+
+    resp = client.get("/api/v1/sequels/find/stream?username=testuser&format=ndjson")
+    assert resp.status_code == 200
+    last = json.loads(resp.text.splitlines()[-1])
+    assert last == {"event": "error", "status": 500, "detail": "Unexpected error"}
+
+
+def test_scan_job_endpoints(monkeypatch):
+    async def fake_submit(username, max_depth=2, force_refresh=False):
+        return {"id": "abc", "username": username, "status": "queued"}, False
+
+    async def fake_get(job_id):
+        if job_id == "abc":
+            return {"id": "abc", "status": "done", "result": {"count": 0}}
+        return None
+
+    monkeypatch.setattr("app.services.scan_jobs.scan_jobs.submit", fake_submit)
+    monkeypatch.setattr("app.services.scan_jobs.scan_jobs.get", fake_get)
+
+    resp = client.post("/api/v1/sequels/jobs", json={"username": "testuser"})
+    assert resp.status_code == 202
+    assert resp.json() == {
+        "id": "abc", "username": "testuser", "status": "queued", "joined": False
+    }
+
+    resp = client.get("/api/v1/sequels/jobs/abc")
+    assert resp.status_code == 200
+    assert resp.json()["status"] == "done"
+
+    resp = client.get("/api/v1/sequels/jobs/missing")
+    assert resp.status_code == 404
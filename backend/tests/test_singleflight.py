@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from app.core.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_task():
+    flight = SingleFlight()
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"id": 1}
+
+    results = await asyncio.gather(*(flight.do("k", work) for _ in range(5)))
+    assert calls == 1
+    assert all(result == {"id": 1} for result in results)
+    assert flight.stats() == {"in_flight": 0, "started": 1, "joined": 4}
+
+    # Once finished the key is forgotten
+    await flight.do("k", work)
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_caller():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    results = await asyncio.gather(
+        flight.do("k", fail), flight.do("k", fail), return_exceptions=True
+    )
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_shared_work():
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.02)
+        return 42
+
+    leader = asyncio.create_task(flight.do("k", work))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(flight.do("k", work))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    assert await follower == 42
+
+
+@pytest.mark.asyncio
+async def test_do_many_joins_overlapping_batches():
+    flight = SingleFlight()
+    requested = []
+
+    async def fetch(ids):
+        requested.append(list(ids))
+        await asyncio.sleep(0.01)
+        return {i: f"media {i}" for i in ids if i != 3}
+
+    first, second = await asyncio.gather(
+        flight.do_many([1, 2, 3], fetch),
+        flight.do_many([2, 3, 4], fetch),
+    )
+    assert requested == [[1, 2, 3], [4]]
+    assert first == {1: "media 1", 2: "media 2"}
+    assert second == {2: "media 2", 4: "media 4"}